@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the @mention user directory: build time, memory per user and
+prefix lookup latency over a synthetic population.
+
+Run from the backend directory: python benchmarks/bench_directory.py [num_users]
+"""
+
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "15")
+
+from bson import ObjectId  # noqa: E402
+from core.directory import UserDirectory  # noqa: E402
+
+FIRST = ["ada", "alan", "grace", "linus", "margaret", "ken", "barbara", "donald", "edsger", "frances",
+         "john", "tim", "radia", "guido", "bjarne", "niklaus", "leslie", "tony", "karen", "josé"]
+
+
+def random_word(rng, low: int = 4, high: int = 10) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(low, high)))
+
+
+def percentile(samples, pct):
+    return sorted(samples)[int(len(samples) * pct / 100) - 1]
+
+
+def main():
+    num_users = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = random.Random(7)
+    users = []
+    for _ in range(num_users):
+        first, last = rng.choice(FIRST), random_word(rng)
+        users.append({
+            "_id": ObjectId(),
+            "email": f"{first}.{last}{rng.randint(1, 99)}@example.com",
+            "full_name": f"{first.title()} {last.title()}"
+        })
+
+    print(f"User directory benchmark: {num_users:,} users\n")
+
+    tracemalloc.start()
+    directory = UserDirectory()
+    started = time.perf_counter()
+    directory.bulk_load(users)
+    elapsed = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"Build: {elapsed:.2f} s, {memory / num_users:.0f} bytes/user")
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        directory.upsert({"_id": ObjectId(), "email": f"{random_word(rng)}@example.com", "full_name": random_word(rng)})
+    per_user = (time.perf_counter() - started) / 1000
+    print(f"Incremental upsert: {per_user * 1000:.3f} ms per user")
+
+    for label, prefixes in (
+        ("1-char prefix", [rng.choice(string.ascii_lowercase) for _ in range(2000)]),
+        ("3-char prefix", [random_word(rng, 3, 3) for _ in range(2000)]),
+        ("first name", [rng.choice(FIRST) for _ in range(2000)]),
+        ("first + last initial", [f"{rng.choice(FIRST)} {rng.choice(string.ascii_lowercase)}" for _ in range(2000)]),
+    ):
+        latencies = []
+        for prefix in prefixes:
+            t = time.perf_counter()
+            directory.suggest(prefix, 10)
+            latencies.append((time.perf_counter() - t) * 1000)
+        print(f"Suggest, {label}: p50 {percentile(latencies, 50):.3f} ms, p99 {percentile(latencies, 99):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
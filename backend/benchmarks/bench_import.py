@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark of bulk import on a generated 10k-file zip: archive parsing and
+Markdown conversion on their own, then a full import into a scratch database
+on MONGODB_URL (skipped when MongoDB isn't reachable).
+
+Run from the backend directory: python benchmarks/bench_import.py [num_files]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "15")
+
+from bson import ObjectId  # noqa: E402
+from pymongo import MongoClient  # noqa: E402
+from pymongo.errors import PyMongoError  # noqa: E402
+from core.importer import iter_archive, parse_file, run_import  # noqa: E402
+from core.settings import settings  # noqa: E402
+
+PAGE = """# Page {i}
+
+Meeting notes for **sprint {i}** with a [link](https://example.com/{i}) and `inline code`.
+
+- decision one
+- decision two
+  - follow-up
+
+```
+print({i})
+```
+
+{filler}
+"""
+
+
+def build_archive(path: str, num_files: int):
+    filler = " ".join(f"word{n}" for n in range(300))
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for i in range(num_files):
+            archive.writestr(f"Team/Area {i % 20}/Project {i % 7}/page-{i}.md", PAGE.format(i=i, filler=filler))
+
+
+def main():
+    num_files = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    workdir = tempfile.mkdtemp()
+    try:
+        run(num_files, os.path.join(workdir, "import.zip"))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(num_files: int, archive_path: str):
+    build_archive(archive_path, num_files)
+    print(f"Import benchmark: {num_files:,} files, {os.path.getsize(archive_path) / 1_000_000:.1f} MB zip, "
+          f"batch size {settings.IMPORT_BATCH_SIZE}\n")
+
+    started = time.perf_counter()
+    for parts, _, read in iter_archive(archive_path):
+        parse_file("/".join(parts), read())
+    elapsed = time.perf_counter() - started
+    print(f"Parse + convert only: {elapsed:.2f} s ({num_files / elapsed:,.0f} files/s)")
+
+    client = MongoClient(settings.MONGODB_URL, serverSelectionTimeoutMS=2000)
+    db = client["CollabraDoc_bench"]
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        print(f"Full import skipped, MongoDB unreachable: {e}")
+        return
+    try:
+        import_id = db.imports.insert_one({"status": "pending"}).inserted_id
+        started = time.perf_counter()
+        run_import(db, import_id, archive_path, ObjectId())
+        elapsed = time.perf_counter() - started
+        record = db.imports.find_one({"_id": import_id})
+        print(f"Full import: {elapsed:.2f} s ({num_files / elapsed:,.0f} files/s), status {record['status']}, "
+              f"{record['created_documents']:,} documents, {record['created_folders']} folders")
+    finally:
+        client.drop_database("CollabraDoc_bench")
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the three-way merge used by base-version saves, on generated
+editor HTML: diff time, clean merges of edits in different paragraphs and in
+the same paragraph, and a real conflict, compared with difflib.
+
+Run from the backend directory: python benchmarks/bench_merge.py [size_kb]
+"""
+
+import os
+import random
+import string
+import sys
+import time
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "15")
+
+from core.merge import matching_blocks, merge3, split_lines  # noqa: E402
+
+
+def random_word(rng) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))
+
+
+def paragraph(rng) -> str:
+    return "<p>" + " ".join(random_word(rng) for _ in range(rng.randint(20, 80))) + "</p>"
+
+
+def generate(rng, size: int) -> list[str]:
+    paragraphs = []
+    total = 0
+    while total < size:
+        paragraphs.append(paragraph(rng))
+        total += len(paragraphs[-1])
+    return paragraphs
+
+
+def edit_words(rng, text: str, count: int, start: float = 0.0, end: float = 1.0) -> str:
+    """Replace `count` words of a paragraph, picked from the [start, end) fraction of it"""
+    words = text[3:-4].split(" ")
+    low, high = int(len(words) * start), max(int(len(words) * end) - 1, int(len(words) * start))
+    for index in rng.sample(range(low, high + 1), min(count, high - low + 1)):
+        words[index] = random_word(rng).upper()
+    return "<p>" + " ".join(words) + "</p>"
+
+
+def timed(label, run, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label}: {best * 1000:.1f} ms")
+    return result
+
+
+def main():
+    size = (int(sys.argv[1]) if len(sys.argv) > 1 else 1024) * 1024
+    rng = random.Random(7)
+    paragraphs = generate(rng, size)
+    base = "".join(paragraphs)
+    print(f"Three-way merge benchmark: {len(base) / 1024:.0f} KB, {len(paragraphs):,} paragraphs\n")
+
+    current_paragraphs = list(paragraphs)
+    incoming_paragraphs = list(paragraphs)
+    for index in rng.sample(range(len(paragraphs)), 20):
+        current_paragraphs[index] = edit_words(rng, paragraphs[index], 3)
+    for index in rng.sample(range(len(paragraphs)), 20):
+        incoming_paragraphs[index] = edit_words(rng, paragraphs[index], 3)
+    current = "".join(current_paragraphs)
+    incoming = "".join(incoming_paragraphs)
+
+    base_lines, current_lines = split_lines(base), split_lines(current)
+    timed("Line diff (Myers, linear space)", lambda: matching_blocks(base_lines, current_lines))
+    timed("Line diff (difflib)", lambda: SequenceMatcher(None, base_lines, current_lines, autojunk=False).get_matching_blocks())
+
+    result = timed("Merge, 20 + 20 edited paragraphs", lambda: merge3(base, current, incoming))
+    print(f"  conflicts: {len(result.conflicts)}")
+
+    # Both sides edit the same paragraphs, in different halves: resolved word by word
+    shared = rng.sample(range(len(paragraphs)), 20)
+    current_paragraphs = list(paragraphs)
+    incoming_paragraphs = list(paragraphs)
+    for index in shared:
+        current_paragraphs[index] = edit_words(rng, paragraphs[index], 2, 0.0, 0.4)
+        incoming_paragraphs[index] = edit_words(rng, paragraphs[index], 2, 0.6, 1.0)
+    result = timed(
+        "Merge, both sides edit the same 20 paragraphs",
+        lambda: merge3(base, "".join(current_paragraphs), "".join(incoming_paragraphs))
+    )
+    print(f"  conflicts: {len(result.conflicts)}")
+
+    # Both sides rewrite one paragraph differently: a real conflict
+    index = rng.randrange(len(paragraphs))
+    current_paragraphs = list(paragraphs)
+    incoming_paragraphs = list(paragraphs)
+    current_paragraphs[index] = paragraph(rng)
+    incoming_paragraphs[index] = paragraph(rng)
+    result = timed(
+        "Merge, one paragraph rewritten by both",
+        lambda: merge3(base, "".join(current_paragraphs), "".join(incoming_paragraphs))
+    )
+    print(f"  conflicts: {len(result.conflicts)}")
+
+    # Editor HTML without any line ends: everything is merged word by word
+    flat_base = base.replace("</p>", "</span>")
+    flat_current = current.replace("</p>", "</span>")
+    flat_incoming = incoming.replace("</p>", "</span>")
+    result = timed("Merge, single-line document", lambda: merge3(flat_base, flat_current, flat_incoming), repeat=1)
+    print(f"  conflicts: {len(result.conflicts)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark of near-duplicate detection: MinHash signature throughput on large
+document bodies and LSH duplicate lookups across a corpus with planted copies.
+
+Run from the backend directory: python benchmarks/bench_minhash.py [num_docs]
+"""
+
+import os
+import sys
+import time
+
+for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ[var] = "1"
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "15")
+
+import numpy as np  # noqa: E402
+from core.minhash import LSHIndex, signature  # noqa: E402
+from core.settings import settings  # noqa: E402
+
+
+def random_text(rng, words: int, vocab_size: int = 50_000) -> str:
+    return "<p>" + " ".join(f"w{i}" for i in rng.integers(0, vocab_size, size=words)) + "</p>"
+
+
+def percentile(samples, pct):
+    return sorted(samples)[int(len(samples) * pct / 100) - 1]
+
+
+def main():
+    num_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    try:
+        os.sched_setaffinity(0, {min(os.sched_getaffinity(0))})
+    except (AttributeError, OSError):
+        pass
+    rng = np.random.default_rng(7)
+
+    print(f"MinHash/LSH benchmark: {num_docs:,} documents, threshold={settings.DEDUP_THRESHOLD}, 1 core\n")
+
+    body = random_text(rng, 200_000)
+    started = time.perf_counter()
+    for _ in range(5):
+        signature(body)
+    elapsed = (time.perf_counter() - started) / 5
+    print(f"Signature of a {len(body) / 1_000_000:.1f} MB body: {elapsed * 1000:.0f} ms "
+          f"({len(body) / 1_000_000 / elapsed:.1f} MB/s)")
+
+    # Every tenth document gets a lightly edited copy
+    texts = []
+    for i in range(num_docs):
+        if i % 10 == 9:
+            words = texts[-1][3:-4].split()
+            words[rng.integers(len(words))] = "edited"
+            texts.append("<p>" + " ".join(words) + "</p>")
+        else:
+            texts.append(random_text(rng, 300))
+
+    index = LSHIndex()
+    started = time.perf_counter()
+    for i, text in enumerate(texts):
+        index.upsert(str(i), signature(text))
+    elapsed = time.perf_counter() - started
+    print(f"Indexing 300-word documents: {num_docs / elapsed:,.0f} docs/s")
+
+    latencies, found = [], 0
+    for i in range(8, num_docs, 10):
+        t = time.perf_counter()
+        hits = index.duplicates(str(i), settings.DEDUP_THRESHOLD)
+        latencies.append((time.perf_counter() - t) * 1000)
+        found += any(doc_id == str(i + 1) for doc_id, _ in hits)
+    print(f"Duplicate lookup: p50 {percentile(latencies, 50):.3f} ms, p95 {percentile(latencies, 95):.3f} ms, "
+          f"recall {found / len(latencies):.1%}")
+
+    page = [str(i) for i in range(200)]
+    t = time.perf_counter()
+    kept = index.dedupe(page, settings.DEDUP_THRESHOLD)
+    print(f"Dedupe of a 200-document page: {(time.perf_counter() - t) * 1000:.2f} ms ({len(kept)} kept)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the in-memory storage engine: insert throughput and query latency
+for the lookups the routes make (by id, by indexed field, by email), compared
+with the same queries answered by a full scan.
+
+Run from the backend directory: python benchmarks/bench_repositories.py [num_comments]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "15")
+
+from datetime import datetime, timedelta  # noqa: E402
+
+from bson import ObjectId  # noqa: E402
+from core.repositories import MEMORY_INDEXES, MemoryRepository  # noqa: E402
+
+
+def percentile(samples, pct):
+    return sorted(samples)[int(len(samples) * pct / 100) - 1]
+
+
+def measure(label, queries, run):
+    latencies = []
+    for query in queries:
+        t = time.perf_counter()
+        run(query)
+        latencies.append((time.perf_counter() - t) * 1000)
+    print(f"{label}: p50 {percentile(latencies, 50):.3f} ms, p99 {percentile(latencies, 99):.3f} ms")
+
+
+def main():
+    num_comments = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = random.Random(7)
+    workspace_id = ObjectId()
+    documents = [ObjectId() for _ in range(max(1, num_comments // 20))]
+    started_at = datetime(2024, 1, 1)
+
+    indexed = MemoryRepository("comments", MEMORY_INDEXES["comments"])
+    scanned = MemoryRepository("comments")
+    users = MemoryRepository("users", MEMORY_INDEXES["users"])
+
+    print(f"In-memory repository benchmark: {num_comments:,} comments on {len(documents):,} documents\n")
+
+    comments = [
+        {
+            "_id": ObjectId(),
+            "workspace_id": workspace_id,
+            "document_id": rng.choice(documents),
+            "parent_id": None,
+            "content": "x" * rng.randint(20, 200),
+            "created_at": started_at + timedelta(seconds=i),
+            "resolved": False
+        }
+        for i in range(num_comments)
+    ]
+    started = time.perf_counter()
+    for comment in comments:
+        indexed.insert(comment)
+    elapsed = time.perf_counter() - started
+    print(f"Insert (indexed): {num_comments / elapsed:,.0f} records/s")
+    for comment in comments:
+        scanned.insert(comment)
+    for i in range(num_comments // 10):
+        users.insert({"email": f"user{i}@example.com", "full_name": f"User {i}"})
+
+    def thread_query(document_id):
+        return {"workspace_id": workspace_id, "document_id": document_id, "parent_id": None, "deleted_at": None}
+
+    samples = [rng.choice(documents) for _ in range(200)]
+    measure("Comments of a document, indexed",
+            samples, lambda d: indexed.find(thread_query(d), sort=[("created_at", -1)]))
+    measure("Comments of a document, full scan",
+            samples[:20], lambda d: scanned.find(thread_query(d), sort=[("created_at", -1)]))
+    measure("find_one by _id", [rng.choice(comments)["_id"] for _ in range(2000)],
+            lambda i: indexed.find_one({"_id": i}))
+    measure("User by email (unique index)", [f"user{rng.randrange(num_comments // 10)}@example.com" for _ in range(2000)],
+            lambda email: users.find_one({"email": email}))
+    measure("Resolve a comment", [rng.choice(comments)["_id"] for _ in range(2000)],
+            lambda i: indexed.update_one({"_id": i}, {"$set": {"resolved": True}}))
+
+
+if __name__ == "__main__":
+    main()
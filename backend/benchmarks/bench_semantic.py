@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the semantic index: incremental indexing throughput and cosine
+top-k query latency at 100k documents, pinned to a single CPU core.
+
+Run from the backend directory: python benchmarks/bench_semantic.py [num_docs]
+"""
+
+import os
+import sys
+import time
+
+# Pin BLAS to one thread before numpy is imported
+for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ[var] = "1"
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "15")
+
+import numpy as np  # noqa: E402
+from core.settings import settings  # noqa: E402
+from core.semantic import SemanticIndex  # noqa: E402
+
+
+def synthetic_corpus(num_docs: int, vocab_size: int = 20_000, words_per_doc: int = 150, seed: int = 7):
+    """Zipf-distributed words so the corpus has realistic term frequencies"""
+    rng = np.random.default_rng(seed)
+    vocab = [f"w{i}" for i in range(vocab_size)]
+    ranks = np.minimum(rng.zipf(1.3, size=(num_docs, words_per_doc)), vocab_size) - 1
+    for row in ranks:
+        yield "<p>" + " ".join(vocab[i] for i in row) + "</p>"
+
+
+def percentile(samples, pct):
+    return sorted(samples)[int(len(samples) * pct / 100) - 1]
+
+
+def main():
+    num_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    try:
+        os.sched_setaffinity(0, {min(os.sched_getaffinity(0))})
+    except (AttributeError, OSError):
+        pass
+
+    print(f"Semantic index benchmark: {num_docs:,} documents, dim={settings.SEMANTIC_DIM}, 1 core\n")
+    index = SemanticIndex(settings.SEMANTIC_DIM)
+
+    started = time.perf_counter()
+    for i, text in enumerate(synthetic_corpus(num_docs)):
+        index.upsert(str(i), text)
+    elapsed = time.perf_counter() - started
+    print(f"Indexing: {elapsed:.1f} s ({num_docs / elapsed:,.0f} docs/s)")
+    print(f"Matrix: {index.matrix[: len(index.ids)].nbytes / 1_000_000:.1f} MB")
+
+    queries = [f"w{i} w{i * 7 % 500} w{i * 13 % 2000}" for i in range(1, 201)]
+    latencies = []
+    for query in queries:
+        t = time.perf_counter()
+        index.search([query], 10)
+        latencies.append((time.perf_counter() - t) * 1000)
+    print(f"\nSingle query top-10: p50 {percentile(latencies, 50):.2f} ms, p95 {percentile(latencies, 95):.2f} ms")
+
+    latencies = []
+    for i in range(0, len(queries), 32):
+        t = time.perf_counter()
+        index.search(queries[i : i + 32], 10)
+        latencies.append((time.perf_counter() - t) * 1000 / len(queries[i : i + 32]))
+    print(f"Batched (32) top-10: {sum(latencies) / len(latencies):.2f} ms per query")
+
+    latencies = []
+    for i in range(200):
+        t = time.perf_counter()
+        index.related(str(i), 10)
+        latencies.append((time.perf_counter() - t) * 1000)
+    print(f"Related top-10:      p50 {percentile(latencies, 50):.2f} ms, p95 {percentile(latencies, 95):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
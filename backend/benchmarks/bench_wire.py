@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the collaboration wire codecs on a generated editing session:
+several users typing, deleting and pasting into an HTML document, with the
+cursor, presence and awareness traffic that goes with it. Reports bytes per
+message and encode/decode time for the JSON envelopes and the binary
+protocol, and the cost of fanning one message out to a room.
+
+Run from the backend directory: python benchmarks/bench_wire.py [size_kb]
+"""
+
+import os
+import random
+import string
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-benchmark-secret-key")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "15")
+
+from bson import ObjectId  # noqa: E402
+
+from core.wire import (  # noqa: E402
+    BINARY, JSON, Awareness, AwarenessState, Broadcast, Cursor, Presence, PresenceUser, Update, diff_ops
+)
+
+USERS = 4
+KEYSTROKES = 5000
+ROOM_SIZE = 20
+
+
+def random_word(rng) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))
+
+
+def generate(rng, size: int) -> str:
+    paragraphs = []
+    total = 0
+    while total < size:
+        paragraphs.append("<p>" + " ".join(random_word(rng) for _ in range(rng.randint(20, 80))) + "</p>")
+        total += len(paragraphs[-1])
+    return "".join(paragraphs)
+
+
+def editing_trace(rng, content: str) -> list:
+    """
+    Messages a relay forwards during a session, each update carrying both its
+    edit script and the resulting content (as the relay holds it)
+    """
+    users = [
+        PresenceUser(str(ObjectId()), random_word(rng).title(), f"{random_word(rng)}@example.com",
+                     f"hsl({rng.uniform(0, 360)}, 70%, 50%)")
+        for _ in range(USERS)
+    ]
+    cursors = {user.user_id: rng.randrange(len(content)) for user in users}
+    clocks = defaultdict(int)
+    trace = [Presence(users[:index + 1]) for index in range(USERS)]
+    version = 0
+    for step in range(KEYSTROKES):
+        user = rng.choice(users)
+        position = cursors[user.user_id] = min(cursors[user.user_id], len(content))
+        roll = rng.random()
+        if roll < 0.85:
+            new = content[:position] + rng.choice(string.ascii_lowercase + " ") + content[position:]
+            cursors[user.user_id] += 1
+        elif roll < 0.97 and position > 0:
+            new = content[:position - 1] + content[position:]
+            cursors[user.user_id] -= 1
+        else:
+            pasted = " ".join(random_word(rng) for _ in range(rng.randint(5, 40)))
+            new = content[:position] + pasted + content[position:]
+            cursors[user.user_id] += len(pasted)
+        version += 1
+        trace.append(Update(version, ops=diff_ops(content, new), content=new))
+        content = new
+        trace.append(Cursor(user.user_id, cursors[user.user_id]))
+        if step % 10 == 0:
+            clocks[user.user_id] += 1
+            trace.append(Awareness([AwarenessState(user.user_id, clocks[user.user_id], {
+                "user": {"name": user.name, "color": user.color},
+                "cursor": {"anchor": cursors[user.user_id], "head": cursors[user.user_id]},
+            })]))
+        if rng.random() < 0.002:
+            trace.append(Presence(users))
+    return trace
+
+
+def received(codec, message):
+    """A message as a client of this codec sends it: JSON clients send full content, binary ones edit scripts"""
+    if isinstance(message, Update):
+        if codec is JSON:
+            return Update(message.version, content=message.content)
+        return Update(message.version, ops=message.ops)
+    return message
+
+
+def timed(label, run, count: int, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label}: {best * 1000:.1f} ms ({best / count * 1e6:.2f} us/message)")
+    return result
+
+
+def main():
+    size = (int(sys.argv[1]) if len(sys.argv) > 1 else 20) * 1024
+    rng = random.Random(11)
+    content = generate(rng, size)
+    trace = editing_trace(rng, content)
+    document_id = str(ObjectId())
+    print(f"Wire protocol benchmark: {len(content) / 1024:.0f} KB document, {len(trace):,} messages\n")
+
+    for codec in (JSON, BINARY):
+        messages = [received(codec, message) for message in trace]
+        frames = timed(
+            f"Encode {codec.protocol}",
+            lambda: [codec.encode(message, document_id) for message in messages], len(messages)
+        )
+        timed(f"Decode {codec.protocol}", lambda: [codec.decode(frame) for frame in frames], len(frames))
+
+    print("\nBytes per message (JSON -> binary):")
+    sizes = defaultdict(lambda: [0, 0, 0])
+    for message in trace:
+        entry = sizes[type(message).__name__]
+        entry[0] += 1
+        entry[1] += len(JSON.encode(received(JSON, message), document_id).encode())
+        entry[2] += len(BINARY.encode(received(BINARY, message)))
+    total_json = total_binary = 0
+    for name, (count, json_bytes, binary_bytes) in sizes.items():
+        total_json += json_bytes
+        total_binary += binary_bytes
+        print(f"  {name:<9} x{count:<6,} {json_bytes / count:>10,.1f} -> {binary_bytes / count:>6,.1f}")
+    print(f"  total: {total_json / 1024 / 1024:,.1f} MB -> {total_binary / 1024:,.1f} KB "
+          f"({total_json / total_binary:,.0f}x smaller)")
+
+    # Each update relayed to a room of mixed clients: one encode per recipient vs once per codec
+    codecs = [BINARY if index % 2 else JSON for index in range(ROOM_SIZE)]
+    updates = [message for message in trace if isinstance(message, Update)][:500]
+    timed(
+        f"\nFan-out of {len(updates)} updates to {ROOM_SIZE} connections, encoded per recipient",
+        lambda: [codec.encode(update, document_id) for update in updates for codec in codecs], len(updates)
+    )
+    timed(
+        f"Fan-out of {len(updates)} updates to {ROOM_SIZE} connections, encoded once per codec",
+        lambda: [
+            [broadcast.frame(codec) for codec in codecs]
+            for broadcast in (Broadcast(update, document_id) for update in updates)
+        ],
+        len(updates)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from anyio import to_thread
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+FEED_COLLECTION = "activity"
+
+# action -> (counter field, timestamp field) on documents and document_views
+ACTIONS = {
+    "view": ("view_count", "last_viewed_at"),
+    "edit": ("edit_count", "last_edited_at"),
+}
+
+
+class _Counter:
+    __slots__ = ("count", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.last = datetime.min
+
+    def add(self, count: int, at: datetime):
+        self.count += count
+        self.last = max(self.last, at)
+
+
+class ActivityAggregator:
+    """
+    Accumulates view and edit counts in memory and writes them out in one
+    bulk_write per collection every ACTIVITY_FLUSH_SECONDS, instead of one
+    update per request. Counts are additive, so every worker process can
+    flush its own buffer independently.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[str, str, str, ObjectId], _Counter] = defaultdict(_Counter)
+
+    def record(
+        self, action: str, document_id: str, user_id: str, workspace_id: ObjectId,
+        count: int = 1, at: datetime | None = None
+    ):
+        with self._lock:
+            self._pending[(action, document_id, user_id, workspace_id)].add(count, at or datetime.utcnow())
+
+    def _take(self) -> dict:
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(_Counter)
+        return pending
+
+    def _restore(self, pending: dict):
+        for (action, document_id, user_id, workspace_id), counter in pending.items():
+            self.record(action, document_id, user_id, workspace_id, counter.count, counter.last)
+
+    def flush(self, db) -> int:
+        """Write buffered counts; returns how many (action, document, user, workspace) keys were flushed"""
+        pending = self._take()
+        if not pending:
+            return 0
+        documents: dict[tuple[str, str], _Counter] = defaultdict(_Counter)
+        views = []
+        feed = []
+        for (action, document_id, user_id, workspace_id), counter in pending.items():
+            documents[(action, document_id)].add(counter.count, counter.last)
+            count_field, time_field = ACTIONS[action]
+            views.append(UpdateOne(
+                {"user_id": user_id, "document_id": document_id},
+                {"$inc": {count_field: counter.count}, "$max": {time_field: counter.last}},
+                upsert=True
+            ))
+            feed.append({
+                "action": action,
+                "document_id": document_id,
+                "user_id": user_id,
+                "workspace_id": workspace_id,
+                "count": counter.count,
+                "at": counter.last
+            })
+        document_updates = []
+        for (action, document_id), counter in documents.items():
+            count_field, time_field = ACTIONS[action]
+            document_updates.append(UpdateOne(
+                {"_id": ObjectId(document_id)},
+                {"$inc": {count_field: counter.count}, "$max": {time_field: counter.last}}
+            ))
+        try:
+            db.documents.bulk_write(document_updates, ordered=False)
+        except BulkWriteError as e:
+            # Rejected rows (e.g. deleted documents) won't succeed on a retry either
+            logger.warning("%d document counters were not written", len(e.details.get("writeErrors", [])))
+        except Exception:
+            # Usually nothing reached the server; keep the counts for the next flush
+            self._restore(pending)
+            raise
+        # Per-user rows and the feed are best effort: retrying them would double-count the documents
+        try:
+            db.document_views.bulk_write(views, ordered=False)
+            feed.sort(key=lambda entry: entry["at"])
+            db[FEED_COLLECTION].insert_many(feed, ordered=True)
+        except Exception as e:
+            logger.warning("Could not record per-user activity: %s", e)
+        return len(pending)
+
+
+activity = ActivityAggregator()
+
+
+def ensure_activity_collections(db):
+    """Create the capped feed collection and the indexes the activity endpoints read"""
+    db.document_views.create_index([("user_id", 1), ("document_id", 1)], unique=True)
+    db.document_views.create_index([("user_id", 1), ("last_viewed_at", -1)])
+    db.documents.create_index([("workspace_id", 1), ("view_count", -1)])
+    try:
+        db.create_collection(FEED_COLLECTION, capped=True, size=settings.ACTIVITY_FEED_BYTES)
+    except CollectionInvalid:
+        pass
+    # Each workspace reads only its own slice of the shared feed
+    db[FEED_COLLECTION].create_index([("workspace_id", 1), ("at", -1)])
+
+
+async def activity_flush_loop(db):
+    """Set up the activity collections, then flush buffered counts periodically"""
+    try:
+        await to_thread.run_sync(ensure_activity_collections, db)
+    except Exception as e:
+        logger.warning("Could not create activity collections: %s", e)
+    while True:
+        await asyncio.sleep(settings.ACTIVITY_FLUSH_SECONDS)
+        try:
+            await to_thread.run_sync(activity.flush, db)
+        except Exception as e:
+            logger.warning("Flushing activity counters failed: %s", e)
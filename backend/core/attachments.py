@@ -0,0 +1,243 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import logging
+import re
+from datetime import datetime, timedelta
+
+from anyio import to_thread
+from gridfs import GridFSBucket, NoFile
+from gridfs.errors import FileExists
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+BUCKET_NAME = "attachments"
+ATTACHMENT_PATH = "/api/attachments/"
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+_REFERENCE_RE = re.compile(re.escape(ATTACHMENT_PATH) + r"([0-9a-f]{64})")
+_DATA_URI_RE = re.compile(r"""(["'])data:(image/[\w.+-]+);base64,([A-Za-z0-9+/=\s]+)\1""")
+
+# Served inline; anything else (SVG and HTML included) is forced to download, so an
+# upload can't run script on our origin. Types come from the bytes, never the uploader.
+INLINE_TYPES = frozenset({
+    "image/png", "image/jpeg", "image/gif", "image/webp", "image/avif",
+    "video/mp4", "video/webm", "audio/mpeg", "audio/ogg", "audio/wav", "audio/mp4", "application/pdf",
+})
+
+# Every download is a sandboxed, script-free document even when opened directly
+DOWNLOAD_CSP = "default-src 'none'; sandbox"
+
+SNIFF_BYTES = 64
+
+# ISO base media (ftyp box) major brands we serve; HEIC, QuickTime and the rest download
+_ISO_BRANDS = {
+    b"isom": "video/mp4", b"iso2": "video/mp4", b"mp41": "video/mp4", b"mp42": "video/mp4",
+    b"avc1": "video/mp4", b"dash": "video/mp4", b"M4V ": "video/mp4", b"M4A ": "audio/mp4",
+    b"avif": "image/avif", b"avis": "image/avif",
+}
+
+
+def sniff_content_type(head: bytes) -> str:
+    """The type of a file from its leading bytes; application/octet-stream when unrecognised"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "audio/wav"
+    if head[4:8] == b"ftyp":
+        return _ISO_BRANDS.get(head[8:12], "application/octet-stream")
+    if head.startswith(b"\x1aE\xdf\xa3"):
+        return "video/webm"
+    if head.startswith(b"OggS"):
+        return "audio/ogg"
+    if head.startswith(b"ID3") or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "audio/mpeg"
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    return "application/octet-stream"
+
+
+def is_attachment_id(value: str) -> bool:
+    return bool(_SHA256_RE.match(value))
+
+
+def attachment_url(attachment_id: str) -> str:
+    return f"{ATTACHMENT_PATH}{attachment_id}"
+
+
+def referenced_attachments(content: str) -> set[str]:
+    """Attachment ids linked from a document's HTML"""
+    return set(_REFERENCE_RE.findall(content or ""))
+
+
+def get_bucket(db) -> GridFSBucket:
+    return GridFSBucket(db, bucket_name=BUCKET_NAME, chunk_size_bytes=settings.ATTACHMENT_CHUNK_BYTES)
+
+
+def store_attachment(db, attachment_id: str, source, size: int, filename: str) -> dict:
+    """
+    Store a blob (bytes or a seekable file) under its SHA-256 unless it is
+    already there, typed by sniffing its content. Metadata is touched first so
+    a concurrent garbage-collection pass skips the blob.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        head = bytes(source[:SNIFF_BYTES])
+    else:
+        position = source.tell()
+        head = source.read(SNIFF_BYTES)
+        source.seek(position)
+    content_type = sniff_content_type(head)
+    now = datetime.utcnow()
+    db.attachments.update_one(
+        {"_id": attachment_id},
+        {
+            "$setOnInsert": {
+                "size": size,
+                "content_type": content_type,
+                "filename": filename,
+                "refcount": 0,
+                "created_at": now
+            },
+            "$set": {"updated_at": now}
+        },
+        upsert=True
+    )
+    bucket = get_bucket(db)
+    if not db[f"{BUCKET_NAME}.files"].find_one({"_id": attachment_id}, {"_id": 1}):
+        try:
+            bucket.upload_from_stream_with_id(
+                attachment_id, filename, source, metadata={"content_type": content_type}
+            )
+        except FileExists:
+            # Another upload of the same content won the race; its copy is identical
+            pass
+    return db.attachments.find_one({"_id": attachment_id})
+
+
+def extract_inline_images(db, content: str) -> str:
+    """Move base64 data-URI images into attachment storage, replacing them with URLs"""
+    if "data:image/" not in (content or ""):
+        return content
+
+    def replace(match):
+        try:
+            data = base64.b64decode(match[3], validate=False)
+        except (binascii.Error, ValueError):
+            return match[0]
+        if not data or len(data) > settings.ATTACHMENT_MAX_BYTES:
+            return match[0]
+        attachment_id = hashlib.sha256(data).hexdigest()
+        extension = match[2].split("/")[1].split("+")[0]
+        store_attachment(db, attachment_id, data, len(data), f"pasted.{extension}")
+        return f"{match[1]}{attachment_url(attachment_id)}{match[1]}"
+
+    return _DATA_URI_RE.sub(replace, content)
+
+
+def update_references(db, added: set[str], removed: set[str]):
+    """Adjust reference counts after a document's attachment links change"""
+    now = datetime.utcnow()
+    if added:
+        db.attachments.update_many(
+            {"_id": {"$in": list(added)}}, {"$inc": {"refcount": 1}, "$set": {"updated_at": now}}
+        )
+    if removed:
+        db.attachments.update_many(
+            {"_id": {"$in": list(removed)}}, {"$inc": {"refcount": -1}, "$set": {"updated_at": now}}
+        )
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Inclusive (start, end) for a single-range "bytes=" header, None to serve the
+    whole body. Raises ValueError when the range can't be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                raise ValueError(header)
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        raise ValueError(header)
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def open_download(db, attachment_id: str):
+    try:
+        return get_bucket(db).open_download_stream(attachment_id)
+    except NoFile:
+        return None
+
+
+async def stream_range(grid_out, start: int, end: int):
+    """Yield bytes start..end (inclusive) of a GridFS file, one chunk per thread hop"""
+    remaining = end - start + 1
+    await to_thread.run_sync(grid_out.seek, start)
+    try:
+        while remaining > 0:
+            chunk = await to_thread.run_sync(grid_out.read, min(settings.ATTACHMENT_CHUNK_BYTES, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        grid_out.close()
+
+
+def collect_garbage(db) -> int:
+    """Delete blobs nothing has referenced for ATTACHMENT_GC_GRACE_SECONDS"""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.ATTACHMENT_GC_GRACE_SECONDS)
+    bucket = get_bucket(db)
+    deleted = 0
+    for candidate in db.attachments.find({"refcount": {"$lte": 0}, "updated_at": {"$lt": cutoff}}, {"_id": 1}):
+        attachment_id = candidate["_id"]
+        # Counts can drift if a write fails half-way; trust the documents over the counter
+        references = db.documents.count_documents({"attachments": attachment_id})
+        if references:
+            db.attachments.update_one({"_id": attachment_id}, {"$set": {"refcount": references}})
+            continue
+        result = db.attachments.delete_one(
+            {"_id": attachment_id, "refcount": {"$lte": 0}, "updated_at": {"$lt": cutoff}}
+        )
+        if result.deleted_count:
+            try:
+                bucket.delete(attachment_id)
+            except NoFile:
+                pass
+            deleted += 1
+    return deleted
+
+
+async def attachment_gc_loop(db):
+    """Create the attachment indexes, then collect unreferenced blobs periodically"""
+    try:
+        db.attachments.create_index([("refcount", 1), ("updated_at", 1)])
+        db.documents.create_index("attachments")
+    except Exception as e:
+        logger.warning("Could not create attachment indexes: %s", e)
+    while True:
+        await asyncio.sleep(settings.ATTACHMENT_GC_SECONDS)
+        try:
+            deleted = await to_thread.run_sync(collect_garbage, db)
+            if deleted:
+                logger.info("Garbage-collected %d unreferenced attachments", deleted)
+        except Exception as e:
+            logger.warning("Attachment garbage collection failed: %s", e)
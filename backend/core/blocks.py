@@ -0,0 +1,279 @@
+import hashlib
+import html
+import logging
+import re
+from difflib import SequenceMatcher
+
+from bson import ObjectId
+from pymongo import DeleteMany, InsertOne, UpdateOne
+
+from core.attachments import referenced_attachments, update_references
+from core.jobs import QUEUED, JobContext, enqueue_job, job_handler
+from core.minhash import lsh_index, signature_bytes
+from core.semantic import semantic_index, document_text
+from core.settings import settings
+from core.summary import document_summary
+from core.versions import record_version
+
+logger = logging.getLogger(__name__)
+
+# Gap between neighbouring block positions, so inserts rarely renumber the document
+POSITION_STEP = 1 << 16
+
+_TAG_RE = re.compile(r"<!--.*?-->|<(/?)([a-zA-Z][a-zA-Z0-9-]*)\b[^>]*?(/?)>", re.S)
+_STRIP_TAGS_RE = re.compile(r"<[^>]*>")
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+# A block starts at each of these so the outline lines up with the document's sections
+_SECTION_TAGS = {"h1", "h2", "h3"}
+
+
+def version_filter(version: int) -> dict:
+    """Match a document still at this blocks_version; records predating the field count as 0"""
+    return {"blocks_version": version} if version else {"blocks_version": {"$in": [0, None]}}
+
+
+def _block_hash(fragment: str) -> str:
+    return hashlib.sha1(fragment.encode()).hexdigest()
+
+
+def _heading(fragment: str) -> tuple[str | None, int | None]:
+    match = re.match(r"\s*<(h[1-6])\b[^>]*>(.*?)</\1\s*>", fragment, re.S | re.I)
+    if not match:
+        return None, None
+    text = " ".join(html.unescape(_STRIP_TAGS_RE.sub("", match[2])).split())
+    return text[:200], int(match[1][1])
+
+
+def split_blocks(content: str) -> list[str]:
+    """
+    Cut editor HTML into fragments at top-level element boundaries, about
+    BLOCK_TARGET_BYTES each, starting a new one at every h1-h3. Joining the
+    fragments gives back the content exactly.
+    """
+    fragments = []
+    start = 0
+    depth = 0
+    for match in _TAG_RE.finditer(content or ""):
+        closing, tag, self_closing = match.group(1), (match.group(2) or "").lower(), match.group(3)
+        if not tag:
+            continue
+        if not closing and depth == 0 and tag in _SECTION_TAGS and match.start() > start:
+            fragments.append(content[start:match.start()])
+            start = match.start()
+        if closing:
+            depth = max(depth - 1, 0)
+        elif tag not in _VOID_TAGS and not self_closing:
+            depth += 1
+        if depth == 0 and match.end() - start >= settings.BLOCK_TARGET_BYTES:
+            fragments.append(content[start:match.end()])
+            start = match.end()
+    if start < len(content or ""):
+        fragments.append(content[start:])
+    return fragments
+
+
+def _block_row(document_id: ObjectId, position: int, fragment: str) -> dict:
+    heading, level = _heading(fragment)
+    return {
+        "document_id": document_id,
+        "position": position,
+        "hash": _block_hash(fragment),
+        "html": fragment,
+        "size": len(fragment),
+        "heading": heading,
+        "level": level
+    }
+
+
+def _positions(left: int | None, right: int | None, count: int) -> list[int] | None:
+    """count positions strictly between two neighbours; None when the gap is too small"""
+    if left is None and right is None:
+        return [i * POSITION_STEP for i in range(count)]
+    if left is None:
+        left = right - POSITION_STEP * (count + 1)
+    if right is None:
+        right = left + POSITION_STEP * (count + 1)
+    step = (right - left) // (count + 1)
+    if step < 1:
+        return None
+    return [left + step * (i + 1) for i in range(count)]
+
+
+def _rewrite_blocks(db, document_id: ObjectId, fragments: list[str]):
+    db.document_blocks.delete_many({"document_id": document_id})
+    if fragments:
+        db.document_blocks.insert_many(
+            [_block_row(document_id, i * POSITION_STEP, fragment) for i, fragment in enumerate(fragments)]
+        )
+
+
+def sync_blocks(db, document_id: ObjectId, content: str, version: int) -> int:
+    """
+    Bring the stored blocks in line with content, rewriting only the blocks whose
+    hashes changed. Returns the number of blocks written or deleted.
+    """
+    fragments = split_blocks(content)
+    existing = list(db.document_blocks.find(
+        {"document_id": document_id}, {"hash": 1, "position": 1}
+    ).sort("position", 1))
+    matcher = SequenceMatcher(None, [row["hash"] for row in existing], [_block_hash(f) for f in fragments], autojunk=False)
+    operations = []
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == "equal":
+            continue
+        if i2 > i1:
+            operations.append(DeleteMany({"_id": {"$in": [row["_id"] for row in existing[i1:i2]]}}))
+        if j2 > j1:
+            left = existing[i1 - 1]["position"] if i1 > 0 else None
+            right = existing[i2]["position"] if i2 < len(existing) else None
+            positions = _positions(left, right, j2 - j1)
+            if positions is None:
+                _rewrite_blocks(db, document_id, fragments)
+                operations = None
+                break
+            operations.extend(
+                InsertOne(_block_row(document_id, position, fragment))
+                for position, fragment in zip(positions, fragments[j1:j2])
+            )
+    if operations:
+        db.document_blocks.bulk_write(operations, ordered=True)
+    db.documents.update_one({"_id": document_id, **version_filter(version)}, {"$set": {"blocks_synced": True}})
+    return len(fragments) if operations is None else len(operations)
+
+
+def ensure_blocks(db, document: dict):
+    """Split a document into blocks if its content changed since the last split"""
+    if document.get("blocks_synced"):
+        return
+    current = db.documents.find_one({"_id": document["_id"]}, {"content": 1, "blocks_version": 1})
+    if current:
+        sync_blocks(db, current["_id"], current.get("content") or "", current.get("blocks_version", 0))
+
+
+def assemble_content(db, document_id: ObjectId) -> str:
+    return "".join(
+        row["html"] for row in db.document_blocks.find({"document_id": document_id}, {"html": 1}).sort("position", 1)
+    )
+
+
+class BlockNotFound(Exception):
+    pass
+
+
+def plan_block_edits(db, document_id: ObjectId, edits: list[dict]) -> list:
+    """
+    The writes that apply replace/insert/delete edits to a document's blocks,
+    touching only those rows. Raises BlockNotFound or ValueError for an edit
+    that doesn't fit the current blocks, before anything is written.
+    """
+    existing = list(db.document_blocks.find({"document_id": document_id}, {"position": 1}).sort("position", 1))
+    order = [row["_id"] for row in existing]
+    positions = {row["_id"]: row["position"] for row in existing}
+    operations = []
+    for edit in edits:
+        try:
+            block_id = ObjectId(edit["block_id"]) if edit.get("block_id") else None
+        except Exception:
+            raise BlockNotFound(edit["block_id"])
+        if block_id is None and edit["op"] != "insert":
+            raise ValueError(f"{edit['op']} needs a block_id")
+        if edit.get("html") is None and edit["op"] != "delete":
+            raise ValueError(f"{edit['op']} needs html")
+        if block_id is not None and block_id not in positions:
+            raise BlockNotFound(edit["block_id"])
+        if edit["op"] == "replace":
+            operations.append(UpdateOne({"_id": block_id}, {"$set": {
+                key: value for key, value in _block_row(document_id, positions[block_id], edit["html"]).items()
+                if key not in ("document_id", "position")
+            }}))
+        elif edit["op"] == "delete":
+            operations.append(DeleteMany({"_id": block_id}))
+            order.remove(block_id)
+            del positions[block_id]
+        else:
+            # Insert after block_id, or at the start when it is omitted
+            index = order.index(block_id) + 1 if block_id is not None else 0
+            left = positions[order[index - 1]] if index > 0 else None
+            right = positions[order[index]] if index < len(order) else None
+            slot = _positions(left, right, 1)
+            if slot is None:
+                # Out of room between these neighbours: spread every block out again
+                for i, row_id in enumerate(order):
+                    positions[row_id] = i * POSITION_STEP
+                    operations.append(UpdateOne({"_id": row_id}, {"$set": {"position": i * POSITION_STEP}}))
+                left = positions[order[index - 1]] if index > 0 else None
+                right = positions[order[index]] if index < len(order) else None
+                slot = _positions(left, right, 1)
+            row = _block_row(document_id, slot[0], edit["html"])
+            row["_id"] = ObjectId()
+            operations.append(InsertOne(row))
+            order.insert(index, row["_id"])
+            positions[row["_id"]] = slot[0]
+            edit["inserted_id"] = str(row["_id"])
+    return operations
+
+
+def apply_block_edits(db, operations: list) -> int:
+    """Write what plan_block_edits planned; returns how many rows changed"""
+    if operations:
+        db.document_blocks.bulk_write(operations, ordered=True)
+    return len(operations)
+
+
+def schedule_assembly(db, document_id: ObjectId, owner_id):
+    """Queue a rebuild of the document's content from its blocks unless one is already waiting"""
+    if db.jobs.find_one(
+        {"kind": "assemble_document", "status": QUEUED, "payload.document_id": document_id}, {"_id": 1}
+    ):
+        return
+    enqueue_job(db, "assemble_document", {"document_id": document_id}, owner_id=owner_id)
+
+
+def _store_assembled(db, document_id: ObjectId) -> dict | None:
+    document = db.documents.find_one(
+        {"_id": document_id},
+        {"title": 1, "attachments": 1, "blocks_version": 1, "content_stale": 1, "workspace_id": 1, "deleted_at": 1}
+    )
+    if not document or not document.get("content_stale"):
+        return None
+    content = assemble_content(db, document_id)
+    attachments = sorted(referenced_attachments(content))
+    text = document_text({"title": document.get("title", ""), "content": content})
+    minhash = signature_bytes(text)
+    # Only if no block edit landed while we were reading; that edit queues another rebuild
+    result = db.documents.update_one(
+        {"_id": document_id, **version_filter(document.get("blocks_version", 0))},
+        {"$set": {
+            "content": content,
+            "content_stale": False,
+            "attachments": attachments,
+            "minhash": minhash,
+            **document_summary(content)
+        }}
+    )
+    if not result.modified_count:
+        return None
+    previous = set(document.get("attachments", []))
+    update_references(db, set(attachments) - previous, previous - set(attachments))
+    record_version(
+        db, document_id, document.get("workspace_id"), document.get("blocks_version", 0),
+        document.get("title", ""), content
+    )
+    if not document.get("deleted_at"):
+        semantic_index.upsert(document.get("workspace_id"), str(document_id), text)
+        lsh_index.upsert(document.get("workspace_id"), str(document_id), minhash)
+    return {"size": len(content)}
+
+
+@job_handler("assemble_document")
+async def assemble_document(ctx: JobContext, payload: dict) -> dict:
+    """Rebuild content, summary and search data from blocks after block-level edits"""
+    result = await ctx.run_sync(_store_assembled, ctx.db, payload["document_id"])
+    return result or {"skipped": True}
+
+
+def load_content(db, document: dict) -> str:
+    """A document's current HTML, rebuilt from its blocks if a block edit hasn't been folded in yet"""
+    if document.get("content_stale"):
+        return assemble_content(db, document["_id"])
+    return document.get("content") or ""
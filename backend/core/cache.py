@@ -0,0 +1,145 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class PartitionedLRU:
+    """
+    LRU cache split into partitions (one per workspace, rate-limit rule, ...)
+    that each have their own capacity, so filling one partition only ever
+    evicts that partition's entries. Partitions themselves are evicted least
+    recently used first once there are more than max_partitions.
+    """
+
+    def __init__(self, per_partition: int, max_partitions: int = 10_000):
+        self.per_partition = per_partition
+        self.max_partitions = max_partitions
+        self._partitions: OrderedDict[Hashable, OrderedDict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(partition) for partition in self._partitions.values())
+
+    def get(self, partition: Hashable, key: Hashable, default=None):
+        with self._lock:
+            entries = self._partitions.get(partition)
+            if entries is None or key not in entries:
+                return default
+            self._partitions.move_to_end(partition)
+            entries.move_to_end(key)
+            return entries[key]
+
+    def put(self, partition: Hashable, key: Hashable, value):
+        with self._lock:
+            entries = self._partitions.get(partition)
+            if entries is None:
+                entries = self._partitions[partition] = OrderedDict()
+                if len(self._partitions) > self.max_partitions:
+                    self._partitions.popitem(last=False)
+            else:
+                self._partitions.move_to_end(partition)
+            entries[key] = value
+            entries.move_to_end(key)
+            if len(entries) > self.per_partition:
+                entries.popitem(last=False)
+
+    def pop(self, partition: Hashable, key: Hashable):
+        with self._lock:
+            entries = self._partitions.get(partition)
+            if entries is not None:
+                entries.pop(key, None)
+
+    def clear(self, partition: Hashable):
+        with self._lock:
+            self._partitions.pop(partition, None)
+
+
+class SizedLRU:
+    """
+    LRU cache bounded by the total size of its values rather than their count.
+    Each put names the value's size; least recently used entries are evicted
+    until the total is within max_bytes. A value larger than max_bytes on its
+    own isn't kept.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # key -> (value, size)
+        self._entries: OrderedDict[Hashable, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value, size: int):
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+
+class PartitionedIndex(Generic[T]):
+    """
+    One in-memory search index per workspace. Queries only touch the asking
+    workspace's index, so a workspace with a million documents costs nothing
+    to one with fifty. Documents that move between workspaces follow along.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._indexes: dict[Hashable, T] = {}
+        self._homes: dict[str, Hashable] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._homes)
+
+    def get(self, workspace_id) -> T:
+        """The workspace's index, created empty on first use"""
+        key = str(workspace_id)
+        index = self._indexes.get(key)
+        if index is None:
+            with self._lock:
+                index = self._indexes.setdefault(key, self._factory())
+        return index
+
+    def upsert(self, workspace_id, doc_id: str, *args):
+        key = str(workspace_id)
+        previous = self._homes.get(doc_id)
+        if previous is not None and previous != key:
+            self._indexes[previous].remove(doc_id)
+        self.get(key).upsert(doc_id, *args)
+        self._homes[doc_id] = key
+
+    def remove(self, doc_id: str):
+        home = self._homes.pop(doc_id, None)
+        if home is not None:
+            self._indexes[home].remove(doc_id)
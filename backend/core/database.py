@@ -1,6 +1,14 @@
-from pymongo import MongoClient
+import importlib.util
+import threading
+import time
+from itertools import islice
+from anyio import to_thread
+from pymongo import MongoClient, monitoring
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
 from fastapi import Depends
 from core.settings import settings
+from core.metrics import current_request_metrics, registry, LATENCY_BUCKETS
+from core.profiling import command_filter, log_slow_query
 from bson import ObjectId
 from pydantic import GetJsonSchemaHandler, GetCoreSchemaHandler
 from pydantic.json_schema import JsonSchemaValue
@@ -42,15 +50,164 @@ class PyObjectId(ObjectId):
     def __repr__(self):
         return f"PyObjectId('{super().__repr__()}')"
 
+class CommandTimingListener(monitoring.CommandListener):
+    """Attributes MongoDB command time to the request that issued it"""
+
+    def __init__(self):
+        # request_id -> (collection, filter) captured when the command starts
+        self._pending = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        collection = target if isinstance(target, str) else None
+        self._pending[event.request_id] = (collection, command_filter(event.command_name, event.command))
+        metrics = current_request_metrics()
+        if metrics is not None and metrics.threads is not None:
+            metrics.threads.add(threading.get_ident())
+
+    def _finished(self, event):
+        collection, filter_ref = self._pending.pop(event.request_id, (None, None))
+        duration = event.duration_micros / 1_000_000
+        metrics = current_request_metrics()
+        if metrics is not None:
+            metrics.record_db(duration, event.command_name, collection, filter_ref)
+        if duration * 1000 >= settings.SLOW_QUERY_MS:
+            log_slow_query(event.command_name, collection, duration, filter_ref)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Tracks connection pool occupancy so saturation can be observed and acted upon"""
+
+    def __init__(self):
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self._lock = threading.Lock()
+        self._wait_started = threading.local()
+        self.checkout_failures = registry.counter(
+            "collabradoc_mongo_checkout_failures_total", "Failed pool checkouts", ("reason",)
+        )
+        self.checkout_wait = registry.histogram(
+            "collabradoc_mongo_checkout_wait_seconds", "Time spent waiting for a pooled connection", LATENCY_BUCKETS
+        )
+
+    def saturation(self) -> float:
+        return self.checked_out / settings.MONGO_MAX_POOL_SIZE if settings.MONGO_MAX_POOL_SIZE else 0.0
+
+    def _adjust(self, attr: str, delta: int):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + delta)
+
+    def connection_check_out_started(self, event):
+        self._wait_started.value = time.perf_counter()
+        self._adjust("waiting", 1)
+
+    def connection_checked_out(self, event):
+        self._adjust("waiting", -1)
+        self._adjust("checked_out", 1)
+        self.checkout_wait.observe(time.perf_counter() - getattr(self._wait_started, "value", time.perf_counter()))
+
+    def connection_check_out_failed(self, event):
+        self._adjust("waiting", -1)
+        self.checkout_failures.inc(str(event.reason))
+
+    def connection_checked_in(self, event):
+        self._adjust("checked_out", -1)
+
+    def connection_created(self, event):
+        self._adjust("open", 1)
+
+    def connection_closed(self, event):
+        self._adjust("open", -1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+pool_stats = PoolStats()
+registry.gauge("collabradoc_mongo_pool_open_connections", "Open pooled connections", lambda: pool_stats.open)
+registry.gauge("collabradoc_mongo_pool_checked_out", "Connections currently checked out", lambda: pool_stats.checked_out)
+registry.gauge("collabradoc_mongo_pool_wait_queue", "Threads waiting for a connection", lambda: pool_stats.waiting)
+registry.gauge("collabradoc_mongo_pool_saturation", "Checked-out share of maxPoolSize", pool_stats.saturation)
+
+
+# Wire compressors that need an optional package to be installed
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy"}
+
+
+def _available_compressors() -> list[str]:
+    compressors = []
+    for name in filter(None, (c.strip() for c in settings.MONGO_COMPRESSORS.split(","))):
+        module = _COMPRESSOR_MODULES.get(name)
+        if module is None or importlib.util.find_spec(module) is not None:
+            compressors.append(name)
+    return compressors
+
+
 client: MongoClient | None = None
 
 def get_client() -> MongoClient:
     global client
     if client is None:
-        client = MongoClient(settings.MONGODB_URL)
+        compressors = _available_compressors()
+        client = MongoClient(
+            settings.MONGODB_URL,
+            maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+            minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=settings.MONGO_SOCKET_TIMEOUT_MS,
+            event_listeners=[CommandTimingListener(), pool_stats],
+            **({"compressors": ",".join(compressors)} if compressors else {}),
+        )
     return client
 
+def close_client():
+    global client
+    if client is not None:
+        client.close()
+        client = None
+
+async def iterate_cursor(cursor, batch_size: int = 100):
+    """Yield a cursor's documents without blocking the event loop on getMore round trips"""
+    cursor.batch_size(batch_size)
+    while True:
+        batch = await to_thread.run_sync(lambda: list(islice(cursor, batch_size)))
+        if not batch:
+            return
+        for document in batch:
+            yield document
+
+
 def get_db(db_name=None):
     def _get_db(client: MongoClient = Depends(get_client)):
         return client[db_name]
     return _get_db
+
+def get_read_db(db_name=None):
+    """Database handle for listing/search reads, routed by MONGO_LISTING_READ_PREFERENCE"""
+    read_preference = make_read_preference(read_pref_mode_from_name(settings.MONGO_LISTING_READ_PREFERENCE), None)
+
+    def _get_read_db(client: MongoClient = Depends(get_client)):
+        return client.get_database(db_name, read_preference=read_preference)
+    return _get_read_db
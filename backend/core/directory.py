@@ -0,0 +1,177 @@
+"""
+@mention autocomplete over the members of a workspace. Each worker keeps a
+prefix index per recently used workspace, built from its member list on
+first use and rebuilt once WORKSPACE_CACHE_SECONDS old, so memory and build
+time follow the workspaces being typed in rather than the whole user base,
+and nobody is suggested to people outside their workspaces.
+"""
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right
+
+from bson import ObjectId
+
+from core.cache import PartitionedLRU
+from core.settings import settings
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9@._ -]+")
+_SPACE_RE = re.compile(r"\s+")
+
+# Fields the directory keeps per user; never the password hash
+DIRECTORY_FIELDS = {"email": 1, "full_name": 1, "avatar": 1, "role": 1}
+
+# Below this many new users, inserting keys one by one beats re-sorting everything
+_BULK_THRESHOLD = 1000
+
+
+def normalize(text: str) -> str:
+    """Case- and accent-folded form used for both keys and queries"""
+    folded = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode().casefold()
+    return _SPACE_RE.sub(" ", _NON_WORD_RE.sub("", folded)).strip()
+
+
+def directory_entry(user: dict) -> dict:
+    """The public fields of a user record, as suggestions and presence show them"""
+    return {
+        "id": str(user["_id"]),
+        "email": user["email"],
+        "full_name": user.get("full_name") or "",
+        "avatar": user.get("avatar") or "",
+        "role": user.get("role") or "viewer"
+    }
+
+
+def user_keys(user: dict) -> set[str]:
+    """
+    Keys a user is found under: every word suffix of the full name (so "ada l"
+    and "lovelace" both match Ada Lovelace) and the email address.
+    """
+    keys = set()
+    words = normalize(user.get("full_name") or "").split()
+    for i in range(len(words)):
+        keys.add(" ".join(words[i:]))
+    email = normalize(user.get("email") or "")
+    if email:
+        keys.add(email)
+    return keys
+
+
+class UserDirectory:
+    """
+    Prefix index over user names and emails for @mention autocomplete: one
+    sorted list of normalized keys with a parallel list of user ids. A lookup
+    is a bisect to the first key at or after the prefix and a scan of the
+    matching run, so it costs O(log n + k) whatever the number of users.
+    """
+
+    def __init__(self):
+        self._keys: list[str] = []
+        self._owners: list[str] = []
+        self._users: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def _remove_keys(self, user_id: str):
+        for key in user_keys(self._users[user_id]):
+            i = bisect_left(self._keys, key)
+            while i < len(self._keys) and self._keys[i] == key:
+                if self._owners[i] == user_id:
+                    del self._keys[i]
+                    del self._owners[i]
+                    break
+                i += 1
+
+    def _set_entry(self, user: dict) -> str:
+        user_id = str(user["_id"])
+        if user_id in self._users:
+            self._remove_keys(user_id)
+        self._users[user_id] = directory_entry(user)
+        return user_id
+
+    def upsert(self, user: dict):
+        with self._lock:
+            user_id = self._set_entry(user)
+            for key in user_keys(self._users[user_id]):
+                i = bisect_right(self._keys, key)
+                self._keys.insert(i, key)
+                self._owners.insert(i, user_id)
+
+    def bulk_load(self, users: list[dict]):
+        """Add many users with one sort rather than a list insert per key"""
+        if len(users) < _BULK_THRESHOLD:
+            for user in users:
+                self.upsert(user)
+            return
+        with self._lock:
+            pairs = list(zip(self._keys, self._owners))
+            for user in users:
+                user_id = self._set_entry(user)
+                pairs.extend((key, user_id) for key in user_keys(self._users[user_id]))
+            pairs.sort()
+            self._keys = [key for key, _ in pairs]
+            self._owners = [owner for _, owner in pairs]
+
+    def remove(self, user_id: str):
+        with self._lock:
+            if user_id in self._users:
+                self._remove_keys(user_id)
+                del self._users[user_id]
+
+    def get(self, user_ids) -> dict[str, dict]:
+        """Directory entries for the given ids, skipping unknown ones"""
+        return {user_id: self._users[user_id] for user_id in user_ids if user_id in self._users}
+
+    def suggest(self, prefix: str, limit: int, exclude: str | None = None) -> list[dict]:
+        """Up to limit users with a name word or email starting with prefix"""
+        query = normalize(prefix)
+        if not query:
+            return []
+        seen = set()
+        result = []
+        with self._lock:
+            i = bisect_left(self._keys, query)
+            while i < len(self._keys) and len(result) < limit:
+                key = self._keys[i]
+                if not key.startswith(query):
+                    break
+                user_id = self._owners[i]
+                if user_id not in seen and user_id != exclude:
+                    seen.add(user_id)
+                    result.append(self._users[user_id])
+                i += 1
+        return result
+
+
+def _build(db, workspace_id: ObjectId) -> UserDirectory:
+    workspace = db.workspaces.find_one({"_id": workspace_id}, {"members.user_id": 1})
+    member_ids = [ObjectId(member["user_id"]) for member in (workspace or {}).get("members", [])]
+    directory = UserDirectory()
+    if member_ids:
+        directory.bulk_load(list(db.users.find({"_id": {"$in": member_ids}}, DIRECTORY_FIELDS)))
+    return directory
+
+
+class WorkspaceDirectories:
+    """UserDirectory per workspace, for the DIRECTORY_CACHE_WORKSPACES most recently used ones"""
+
+    def __init__(self, max_workspaces: int):
+        self._cache = PartitionedLRU(max_workspaces, max_partitions=1)
+
+    def get(self, db, workspace_id: ObjectId) -> UserDirectory:
+        cached = self._cache.get(None, workspace_id)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        directory = _build(db, workspace_id)
+        self._cache.put(None, workspace_id, (directory, time.monotonic() + settings.WORKSPACE_CACHE_SECONDS))
+        return directory
+
+    def suggest(self, db, workspace_id: ObjectId, prefix: str, limit: int, exclude: str | None = None) -> list[dict]:
+        """Members of the workspace with a name word or email starting with prefix"""
+        return self.get(db, workspace_id).suggest(prefix, limit, exclude)
+
+
+workspace_directories = WorkspaceDirectories(settings.DIRECTORY_CACHE_WORKSPACES)
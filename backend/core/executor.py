@@ -0,0 +1,47 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Shared pool for CPU-heavy work, started on first use"""
+    global _pool
+    if _pool is None:
+        # Spawned rather than forked: the parent holds MongoDB monitor threads and locks
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.CPU_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logger.info("Started process pool with %d workers", settings.CPU_WORKERS)
+    return _pool
+
+
+async def run_cpu_bound(func, *args, size: int):
+    """
+    Run func(*args) off the event loop. Small inputs are handled inline, since
+    pickling them to a worker process costs more than the work itself.
+    """
+    if size < settings.EXPORT_INLINE_BYTES:
+        return func(*args)
+    return await run_in_process(func, *args)
+
+
+async def run_in_process(func, *args):
+    """Run func(*args) in the process pool; func and its arguments must be picklable"""
+    if settings.CPU_WORKERS <= 0:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(get_process_pool(), func, *args)
+
+
+def shutdown_process_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
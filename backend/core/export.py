@@ -0,0 +1,255 @@
+import html
+import re
+import zipfile
+from datetime import datetime
+from html.parser import HTMLParser
+from urllib.parse import quote
+
+# Kept free of database and settings imports: convert() runs in spawned worker processes
+
+FORMATS = {
+    "md": ("text/markdown; charset=utf-8", "md"),
+    "html": ("text/html; charset=utf-8", "html"),
+    "txt": ("text/plain; charset=utf-8", "txt"),
+}
+
+_BLOCK_TAGS = {"p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "li", "blockquote", "pre", "tr", "ul", "ol", "table", "hr"}
+_UNSAFE_FILENAME_RE = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+class _MarkdownConverter(HTMLParser):
+    """Editor HTML to Markdown; unknown tags are dropped and their text kept"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: list[str] = []
+        self.lists: list[list] = []
+        self.href: str | None = None
+        self.in_pre = False
+        self.quote_depth = 0
+
+    def _newline(self, count: int = 2):
+        self.out.append("\n" * count + "> " * self.quote_depth)
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self._newline()
+            self.out.append("#" * int(tag[1]) + " ")
+        elif tag in ("p", "div"):
+            self._newline()
+        elif tag == "br":
+            self.out.append("  \n")
+        elif tag in ("strong", "b"):
+            self.out.append("**")
+        elif tag in ("em", "i"):
+            self.out.append("*")
+        elif tag in ("s", "del", "strike"):
+            self.out.append("~~")
+        elif tag == "code" and not self.in_pre:
+            self.out.append("`")
+        elif tag == "pre":
+            self.in_pre = True
+            self._newline()
+            self.out.append("```\n")
+        elif tag == "blockquote":
+            self.quote_depth += 1
+            self._newline()
+        elif tag in ("ul", "ol"):
+            if not self.lists:
+                self._newline()
+            self.lists.append([tag, 0])
+        elif tag == "li":
+            indent = "  " * (len(self.lists) - 1)
+            if self.lists and self.lists[-1][0] == "ol":
+                self.lists[-1][1] += 1
+                marker = f"{self.lists[-1][1]}. "
+            else:
+                marker = "- "
+            self._newline(1)
+            self.out.append(indent + marker)
+        elif tag == "a":
+            self.href = attrs.get("href")
+            self.out.append("[")
+        elif tag == "img":
+            self.out.append(f"![{attrs.get('alt') or ''}]({attrs.get('src') or ''})")
+        elif tag == "hr":
+            self._newline()
+            self.out.append("---")
+
+    def handle_endtag(self, tag):
+        if tag in ("strong", "b"):
+            self.out.append("**")
+        elif tag in ("em", "i"):
+            self.out.append("*")
+        elif tag in ("s", "del", "strike"):
+            self.out.append("~~")
+        elif tag == "code" and not self.in_pre:
+            self.out.append("`")
+        elif tag == "pre":
+            self.in_pre = False
+            self.out.append("\n```")
+        elif tag == "blockquote":
+            self.quote_depth = max(0, self.quote_depth - 1)
+            self._newline()
+        elif tag in ("ul", "ol") and self.lists:
+            self.lists.pop()
+        elif tag == "a":
+            self.out.append(f"]({self.href or ''})")
+            self.href = None
+
+    def handle_data(self, data):
+        if not self.in_pre:
+            data = re.sub(r"\s+", " ", data)
+        self.out.append(data)
+
+    def result(self) -> str:
+        return _BLANK_LINES_RE.sub("\n\n", "".join(self.out)).strip() + "\n"
+
+
+class _TextConverter(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: list[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "br":
+            self.out.append("\n")
+        elif tag in _BLOCK_TAGS:
+            self.out.append("\n\n" if tag != "li" else "\n- ")
+
+    def handle_endtag(self, tag):
+        if tag in _BLOCK_TAGS and tag != "li":
+            self.out.append("\n\n")
+
+    def handle_data(self, data):
+        self.out.append(data)
+
+    def result(self) -> str:
+        text = "\n".join(line.strip() for line in "".join(self.out).splitlines())
+        return _BLANK_LINES_RE.sub("\n\n", text).strip() + "\n"
+
+
+def _metadata_header(document: dict) -> str:
+    updated = document.get("updated_at")
+    lines = [
+        "---",
+        f"title: {document.get('title', '')}",
+        f"updated: {updated.isoformat() if isinstance(updated, datetime) else updated or ''}",
+        f"exported: {datetime.utcnow().isoformat()}",
+        "---",
+        "",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def html_to_text(content: str) -> str:
+    """Editor HTML to plain text with block structure kept as blank lines"""
+    converter = _TextConverter()
+    converter.feed(content or "")
+    converter.close()
+    return converter.result()
+
+
+def convert(document: dict, fmt: str, include_metadata: bool = False) -> str:
+    """Render a document's title and HTML content as md, html or txt"""
+    title = document.get("title", "")
+    content = document.get("content", "")
+    if fmt == "html":
+        return (
+            "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+            f"<title>{html.escape(title)}</title>\n</head>\n<body>\n"
+            f"<h1>{html.escape(title)}</h1>\n{content}\n</body>\n</html>\n"
+        )
+    converter = _MarkdownConverter() if fmt == "md" else _TextConverter()
+    converter.feed(content)
+    converter.close()
+    body = converter.result()
+    if fmt == "md":
+        body = f"# {title}\n\n{body}"
+        if include_metadata:
+            body = _metadata_header(document) + body
+    else:
+        body = f"{title}\n\n{body}"
+    return body
+
+
+def iter_chunks(data: bytes, size: int):
+    view = memoryview(data)
+    for start in range(0, len(view), size):
+        yield bytes(view[start : start + size])
+
+
+def safe_filename(name: str, fallback: str = "untitled") -> str:
+    name = _UNSAFE_FILENAME_RE.sub("_", name).strip(" .")
+    return name[:120] or fallback
+
+
+def content_disposition(filename: str) -> str:
+    """attachment header with an ASCII fallback and the RFC 5987 UTF-8 name"""
+    ascii_name = filename.encode("ascii", "replace").decode().replace("?", "_").replace('"', "_")
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+
+class _Sink:
+    """Write-only, unseekable target; zipfile falls back to data descriptors for it"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data) -> int:
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+class ZipStreamWriter:
+    """
+    Builds a zip archive incrementally. Each call returns the bytes produced so
+    far, so only the entry being written is held in memory, never the archive.
+    """
+
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=zipfile.ZIP_DEFLATED)
+        self._names: set[str] = set()
+
+    def _unique(self, name: str) -> str:
+        if name not in self._names:
+            self._names.add(name)
+            return name
+        stem, dot, ext = name.rpartition(".")
+        if not dot:
+            stem, ext = name, ""
+        counter = 2
+        while True:
+            candidate = f"{stem} ({counter}){dot}{ext}"
+            if candidate not in self._names:
+                self._names.add(candidate)
+                return candidate
+            counter += 1
+
+    def add_directory(self, path: str) -> bytes:
+        self._zip.mkdir(self._unique(path.rstrip("/") + "/"))
+        return self._sink.drain()
+
+    def add_file(self, path: str, data: bytes, modified: datetime | None = None, chunk_size: int = 1 << 20) -> bytes:
+        info = zipfile.ZipInfo(self._unique(path), date_time=(modified or datetime.utcnow()).timetuple()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with self._zip.open(info, "w", force_zip64=len(data) > zipfile.ZIP64_LIMIT) as entry:
+            for chunk in iter_chunks(data, chunk_size):
+                entry.write(chunk)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
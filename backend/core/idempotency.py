@@ -0,0 +1,295 @@
+"""
+Idempotency-Key support for create endpoints. A client retrying
+`POST /documents/`, `/folders/` or `/comments/` with the same key gets the
+first attempt's response back instead of a second record. Keys are scoped to
+the caller and the route. Successful responses and validation errors
+(400/422) are kept in the `idempotency_keys` collection for
+IDEMPOTENCY_TTL_SECONDS (a TTL index expires them); anything that may go
+differently on a retry, like 401, 403, 409, 429 or a 5xx, releases the key. Duplicates that arrive while the first attempt is still
+running wait for it: within a worker they share its result directly; across
+workers they poll the stored record.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+
+from anyio import to_thread
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+
+from core.database import get_client
+from core.metrics import registry
+from core.ratelimit import client_identity, request_header
+from core.settings import settings
+
+IDEMPOTENT_TOTAL = registry.counter(
+    "collabradoc_idempotent_requests_total", "Requests carrying an Idempotency-Key, by outcome", ("outcome",)
+)
+
+# Create endpoints that honour Idempotency-Key. Only the canonical paths: the
+# slashless form just redirects, and the retry after the redirect must execute.
+IDEMPOTENT_ROUTES = {("POST", "/api/documents/"), ("POST", "/api/folders/"), ("POST", "/api/comments/")}
+
+MAX_KEY_LENGTH = 255
+
+# Response headers worth replaying; the rest are recomputed by the outer middleware
+_STORED_HEADERS = {b"content-type", b"location"}
+
+# Outcomes a retry would only repeat; every other status releases the key
+_STORED_ERRORS = {400, 422}
+
+PENDING = "pending"
+DONE = "done"
+
+
+class StoredResponse:
+    def __init__(self, status: int, headers: list[tuple[bytes, bytes]], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def to_record(self) -> dict:
+        return {
+            "status": self.status,
+            "headers": [[key.decode("latin-1"), value.decode("latin-1")] for key, value in self.headers],
+            "body": Binary(self.body),
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> "StoredResponse":
+        return cls(
+            record["status"],
+            [(key.encode("latin-1"), value.encode("latin-1")) for key, value in record["headers"]],
+            bytes(record["body"]),
+        )
+
+
+class MongoIdempotencyStore:
+    """Claims, results and expiry of keys, shared by every worker"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def claim(self, key_id: str, fingerprint: str) -> dict | None:
+        """
+        Take the key for this request. None when it is ours to execute;
+        otherwise the existing record (finished, or pending on another worker).
+        """
+        now = datetime.utcnow()
+        try:
+            self.collection.insert_one({
+                "_id": key_id,
+                "fingerprint": fingerprint,
+                "state": PENDING,
+                "locked_until": now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS),
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+        record = self.collection.find_one({"_id": key_id})
+        if record is None:
+            # Expired between the insert and the read
+            return self.claim(key_id, fingerprint)
+        if record["state"] == PENDING and record["locked_until"] < now and record["fingerprint"] == fingerprint:
+            # The worker that claimed it died mid-request; take over
+            taken = self.collection.update_one(
+                {"_id": key_id, "state": PENDING, "locked_until": record["locked_until"]},
+                {"$set": {"locked_until": now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)}}
+            )
+            if taken.modified_count:
+                return None
+            record = self.collection.find_one({"_id": key_id}) or record
+        return record
+
+    def find(self, key_id: str) -> dict | None:
+        return self.collection.find_one({"_id": key_id})
+
+    def complete(self, key_id: str, response: StoredResponse):
+        self.collection.update_one(
+            {"_id": key_id},
+            {"$set": {
+                "state": DONE,
+                **response.to_record(),
+                "expires_at": datetime.utcnow() + timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS),
+            }, "$unset": {"locked_until": ""}}
+        )
+
+    def release(self, key_id: str):
+        """Forget a key whose request failed, so a retry runs again"""
+        self.collection.delete_one({"_id": key_id, "state": PENDING})
+
+
+def create_store() -> MongoIdempotencyStore:
+    return MongoIdempotencyStore(get_client()["CollabraDoc"].idempotency_keys)
+
+
+async def _respond(send, response: StoredResponse, replayed: bool = False):
+    headers = [*response.headers, (b"content-length", str(len(response.body)).encode())]
+    if replayed:
+        headers.append((b"idempotent-replayed", b"true"))
+    await send({"type": "http.response.start", "status": response.status, "headers": headers})
+    await send({"type": "http.response.body", "body": response.body})
+
+
+def _error(status: int, detail: str, retry_after: int | None = None) -> StoredResponse:
+    headers = [(b"content-type", b"application/json")]
+    if retry_after is not None:
+        headers.append((b"retry-after", str(retry_after).encode()))
+    return StoredResponse(status, headers, json.dumps({"detail": detail}).encode())
+
+
+async def _read_body(receive, limit: int) -> bytes | None:
+    """The whole request body, or None as soon as it grows past limit"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            return b"".join(chunks)
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _stored(response: StoredResponse) -> bool:
+    """Whether a retry with the same key should get this response back"""
+    if len(response.body) > settings.IDEMPOTENCY_MAX_BODY_BYTES:
+        return False
+    return 200 <= response.status < 300 or response.status in _STORED_ERRORS
+
+
+class IdempotencyMiddleware:
+    """Replays or collapses repeated create requests that carry the same Idempotency-Key"""
+
+    def __init__(self, app, store: MongoIdempotencyStore | None = None):
+        self.app = app
+        self.store = store
+        # Requests executing in this worker, by key id, for duplicates to wait on
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not settings.IDEMPOTENCY_ENABLED
+            or (scope["method"], scope["path"]) not in IDEMPOTENT_ROUTES
+        ):
+            await self.app(scope, receive, send)
+            return
+        key = request_header(scope, b"idempotency-key")
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await _respond(send, _error(400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"))
+            return
+
+        length = request_header(scope, b"content-length")
+        body = None
+        if not (length and length.isdigit() and int(length) > settings.IDEMPOTENCY_MAX_REQUEST_BYTES):
+            body = await _read_body(receive, settings.IDEMPOTENCY_MAX_REQUEST_BYTES)
+        if body is None:
+            await _respond(send, _error(413, "Request body too large to use with an Idempotency-Key"))
+            return
+        key_id = hashlib.sha256(
+            f"{client_identity(scope)}|{scope['method']} {scope['path']}|{key}".encode()
+        ).hexdigest()
+        # The same key with a different body or workspace is a client bug, not a retry
+        fingerprint = hashlib.sha256(
+            (request_header(scope, b"x-workspace-id") or "").encode() + b"|" + body
+        ).hexdigest()
+
+        flight = self._in_flight.get(key_id)
+        if flight is not None:
+            IDEMPOTENT_TOTAL.inc("joined")
+            leader_fingerprint, response = await asyncio.shield(flight)
+            if leader_fingerprint != fingerprint:
+                response = _mismatch()
+            await _respond(send, response, replayed=True)
+            return
+
+        flight = asyncio.get_running_loop().create_future()
+        self._in_flight[key_id] = flight
+        response = None
+        try:
+            response = await self._execute(scope, receive, send, key_id, fingerprint, body)
+        finally:
+            if response is None:
+                response = _error(500, "Internal Server Error")
+            flight.set_result((fingerprint, response))
+            del self._in_flight[key_id]
+
+    async def _execute(self, scope, receive, send, key_id: str, fingerprint: str, body: bytes) -> StoredResponse:
+        if self.store is None:
+            self.store = create_store()
+        record = await to_thread.run_sync(self.store.claim, key_id, fingerprint)
+        if record is not None:
+            response = await self._stored_response(key_id, fingerprint, record)
+            await _respond(send, response, replayed=True)
+            return response
+
+        IDEMPOTENT_TOTAL.inc("executed")
+        captured = {"status": 500, "headers": [], "body": []}
+        body_delivered = False
+
+        async def replay_receive():
+            nonlocal body_delivered
+            if not body_delivered:
+                body_delivered = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = [
+                    (key, value) for key, value in message.get("headers", []) if key.lower() in _STORED_HEADERS
+                ]
+            elif message["type"] == "http.response.body":
+                captured["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            await to_thread.run_sync(self.store.release, key_id)
+            raise
+
+        response = StoredResponse(captured["status"], captured["headers"], b"".join(captured["body"]))
+        # Throttles, auth failures, conflicts, server errors and oversized bodies aren't kept,
+        # so a retry runs the request again
+        if _stored(response):
+            await to_thread.run_sync(self.store.complete, key_id, response)
+        else:
+            await to_thread.run_sync(self.store.release, key_id)
+        return response
+
+    async def _stored_response(self, key_id: str, fingerprint: str, record: dict) -> StoredResponse:
+        """The finished response for a key claimed elsewhere, waiting for it if it is still running"""
+        if record["fingerprint"] != fingerprint:
+            IDEMPOTENT_TOTAL.inc("mismatch")
+            return _mismatch()
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while record is not None and record["state"] == PENDING:
+            if time.monotonic() >= deadline:
+                IDEMPOTENT_TOTAL.inc("in_progress")
+                return _error(409, "A request with this Idempotency-Key is still in progress", retry_after=1)
+            await asyncio.sleep(settings.IDEMPOTENCY_POLL_MS / 1000)
+            record = await to_thread.run_sync(self.store.find, key_id)
+        if record is None:
+            # The other attempt failed and released the key
+            return _error(409, "A request with this Idempotency-Key failed; retry it", retry_after=1)
+        IDEMPOTENT_TOTAL.inc("replayed")
+        return StoredResponse.from_record(record)
+
+
+def _mismatch() -> StoredResponse:
+    return _error(422, "Idempotency-Key was already used with a different request")
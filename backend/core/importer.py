@@ -0,0 +1,477 @@
+import html
+import logging
+import os
+import posixpath
+import re
+import tarfile
+import tempfile
+import zipfile
+from datetime import datetime
+
+from bson import ObjectId
+from gridfs import GridFSBucket, NoFile
+from pymongo.errors import BulkWriteError
+
+from core.attachments import referenced_attachments, update_references
+from core.minhash import lsh_index, signature_bytes
+from core.semantic import semantic_index, document_text
+from core.summary import document_summary
+from core.jobs import JobContext, job_handler
+from core.permissions import access_fields
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# GridFS bucket holding uploaded archives until their import job finishes
+ARCHIVE_BUCKET = "imports"
+DUPLICATE_KEY = 11000
+
+SUPPORTED_EXTENSIONS = {".md", ".markdown", ".html", ".htm", ".txt"}
+MAX_RECORDED_ERRORS = 50
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_HR_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_LIST_RE = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+_FRONT_MATTER_RE = re.compile(r"\A---\n(.*?)\n---\n", re.S)
+_IMAGE_RE = re.compile(r"!\[([^\]]*)\]\(([^)\s]+)\)")
+_LINK_RE = re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)")
+_BOLD_RE = re.compile(r"(\*\*|__)(.+?)\1")
+_ITALIC_RE = re.compile(r"(?<![\w*])([*_])(?!\s)(.+?)(?<!\s)\1(?![\w*])")
+_STRIKE_RE = re.compile(r"~~(.+?)~~")
+_HTML_TITLE_RE = re.compile(r"<title[^>]*>(.*?)</title>", re.I | re.S)
+_HTML_BODY_RE = re.compile(r"<body[^>]*>(.*)</body>", re.I | re.S)
+_LEADING_H1_RE = re.compile(r"\A\s*<h1[^>]*>(.*?)</h1>\s*", re.I | re.S)
+
+
+def _inline(text: str) -> str:
+    """Inline Markdown (code, images, links, emphasis) to HTML"""
+    parts = text.split("`")
+    # Odd-indexed parts sit between backticks; an unmatched trailing backtick stays literal
+    if len(parts) % 2 == 0:
+        parts[-2] += "`" + parts.pop()
+    out = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            out.append(f"<code>{html.escape(part)}</code>")
+            continue
+        part = html.escape(part, quote=False)
+        part = _IMAGE_RE.sub(lambda m: f'<img src="{html.escape(m[2])}" alt="{html.escape(m[1])}">', part)
+        part = _LINK_RE.sub(lambda m: f'<a href="{html.escape(m[2])}">{m[1]}</a>', part)
+        part = _BOLD_RE.sub(r"<strong>\2</strong>", part)
+        part = _ITALIC_RE.sub(r"<em>\2</em>", part)
+        part = _STRIKE_RE.sub(r"<s>\1</s>", part)
+        out.append(part)
+    return "".join(out)
+
+
+def markdown_to_html(text: str) -> str:
+    """CommonMark subset used by the exporter: headings, lists, quotes, code, rules, paragraphs"""
+    lines = text.replace("\r\n", "\n").split("\n")
+    out: list[str] = []
+    paragraph: list[str] = []
+    lists: list[tuple[str, int]] = []
+
+    def flush_paragraph():
+        if paragraph:
+            out.append(f"<p>{_inline(' '.join(paragraph))}</p>")
+            paragraph.clear()
+
+    def close_lists(indent: int = -1):
+        while lists and lists[-1][1] > indent:
+            out.append(f"</li></{lists.pop()[0]}>")
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if _FENCE_RE.match(line):
+            flush_paragraph()
+            close_lists()
+            fence = _FENCE_RE.match(line)[1]
+            code = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith(fence):
+                code.append(lines[i])
+                i += 1
+            out.append(f"<pre><code>{html.escape(chr(10).join(code))}</code></pre>")
+        elif not line.strip():
+            flush_paragraph()
+            # A blank line only ends a list when the next line isn't another item
+            if lists and not (i + 1 < len(lines) and _LIST_RE.match(lines[i + 1])):
+                close_lists()
+        elif heading := _HEADING_RE.match(line):
+            flush_paragraph()
+            close_lists()
+            level = len(heading[1])
+            out.append(f"<h{level}>{_inline(heading[2])}</h{level}>")
+        elif _HR_RE.match(line):
+            flush_paragraph()
+            close_lists()
+            out.append("<hr>")
+        elif line.lstrip().startswith(">"):
+            flush_paragraph()
+            close_lists()
+            quoted = []
+            while i < len(lines) and lines[i].lstrip().startswith(">"):
+                quoted.append(re.sub(r"^\s*> ?", "", lines[i]))
+                i += 1
+            out.append(f"<blockquote>{markdown_to_html(chr(10).join(quoted))}</blockquote>")
+            continue
+        elif item := _LIST_RE.match(line):
+            flush_paragraph()
+            indent = len(item[1].expandtabs(4))
+            tag = "ul" if item[2] in "-*+" else "ol"
+            if lists and lists[-1][1] == indent and lists[-1][0] == tag:
+                out.append("</li>")
+            else:
+                close_lists(indent)
+                if lists and lists[-1][1] == indent:
+                    out.append(f"</li></{lists.pop()[0]}>")
+                if not lists or lists[-1][1] < indent:
+                    out.append(f"<{tag}>")
+                    lists.append((tag, indent))
+                else:
+                    out.append("</li>")
+            out.append(f"<li>{_inline(item[3])}")
+        elif lists and line.startswith(" "):
+            # Continuation of the current list item
+            out.append(" " + _inline(line.strip()))
+        else:
+            close_lists()
+            paragraph.append(line.strip())
+        i += 1
+    flush_paragraph()
+    close_lists()
+    return "\n".join(out)
+
+
+def text_to_html(text: str) -> str:
+    blocks = re.split(r"\n\s*\n", text.replace("\r\n", "\n").strip())
+    return "\n".join(
+        "<p>" + "<br>".join(html.escape(line) for line in block.split("\n")) + "</p>" for block in blocks if block
+    )
+
+
+def parse_file(path: str, data: bytes) -> tuple[str, str]:
+    """Title and editor HTML for an archive member, undoing what the exporter adds"""
+    stem, extension = os.path.splitext(posixpath.basename(path))
+    text = data.decode("utf-8", errors="replace").lstrip("\ufeff")
+    title = stem
+    extension = extension.lower()
+    if extension in (".md", ".markdown"):
+        front_matter = _FRONT_MATTER_RE.match(text)
+        if front_matter:
+            text = text[front_matter.end():]
+            for line in front_matter[1].splitlines():
+                key, _, value = line.partition(":")
+                if key.strip() == "title" and value.strip():
+                    title = value.strip()
+        first, _, rest = text.lstrip("\n").partition("\n")
+        heading = _HEADING_RE.match(first)
+        if heading and len(heading[1]) == 1:
+            title, text = heading[2], rest
+        return title, markdown_to_html(text)
+    if extension in (".html", ".htm"):
+        found = _HTML_TITLE_RE.search(text)
+        if found and found[1].strip():
+            title = html.unescape(found[1].strip())
+        body = _HTML_BODY_RE.search(text)
+        content = body[1] if body else text
+        leading = _LEADING_H1_RE.match(content)
+        if leading and html.unescape(leading[1]).strip() == title:
+            content = content[leading.end():]
+        return title, content.strip()
+    first, _, rest = text.partition("\n")
+    if first.strip() == stem:
+        text = rest
+    return title, text_to_html(text)
+
+
+def _normalize(path: str) -> list[str]:
+    return [part for part in path.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+
+
+def _skip(parts: list[str]) -> bool:
+    return not parts or any(part.startswith(".") or part == "__MACOSX" for part in parts)
+
+
+def _rewind(source):
+    if not isinstance(source, str):
+        source.seek(0)
+    return source
+
+
+def iter_archive(source):
+    """
+    Yield (path parts, size, read) for each regular file of an archive given
+    as a path or a seekable binary file. Members are read one at a time;
+    tarballs, including compressed ones, are read as a stream.
+    """
+    if zipfile.is_zipfile(_rewind(source)):
+        with zipfile.ZipFile(_rewind(source)) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                yield _normalize(info.filename), info.file_size, lambda info=info: archive.read(info)
+    else:
+        if isinstance(source, str):
+            opened = tarfile.open(source, "r|*")
+        else:
+            opened = tarfile.open(fileobj=_rewind(source), mode="r|*")
+        with opened as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                yield _normalize(member.name), member.size, lambda member=member: archive.extractfile(member).read()
+
+
+def count_archive_files(source) -> int | None:
+    """Number of members when the archive has a central directory (zip), else None"""
+    if zipfile.is_zipfile(_rewind(source)):
+        with zipfile.ZipFile(_rewind(source)) as archive:
+            return sum(1 for info in archive.infolist() if not info.is_dir())
+    return None
+
+
+def is_supported_archive(source) -> bool:
+    return zipfile.is_zipfile(_rewind(source)) or tarfile.is_tarfile(_rewind(source))
+
+
+def get_archive_bucket(db) -> GridFSBucket:
+    return GridFSBucket(db, bucket_name=ARCHIVE_BUCKET)
+
+
+def store_archive(db, source, filename: str) -> ObjectId:
+    """
+    Keep an uploaded archive in GridFS until its job finishes, so any process
+    running jobs can read it, not only the one that took the upload
+    """
+    return get_archive_bucket(db).upload_from_stream(filename or "archive", _rewind(source))
+
+
+def fetch_archive(db, archive_id: ObjectId, target):
+    """Copy a stored archive into a local seekable file for this attempt"""
+    get_archive_bucket(db).download_to_stream(archive_id, target)
+    target.flush()
+    target.seek(0)
+
+
+class _FolderResolver:
+    """Creates folders for archive directories on first use, reusing same-named existing ones"""
+
+    def __init__(self, db, owner_id, workspace_id, root_id):
+        self.db = db
+        self.owner_id = owner_id
+        self.workspace_id = workspace_id
+        self.ids: dict[tuple[str, ...], object] = {(): root_id}
+        # Sharing fields for records created in each folder; the whole import shares a handful of folders
+        self._access: dict[object, dict] = {}
+        self.created = 0
+
+    def access_fields(self, folder_id) -> dict:
+        if folder_id not in self._access:
+            self._access[folder_id] = access_fields(self.db, self.owner_id, folder_id)
+        return self._access[folder_id]
+
+    def resolve(self, parts: tuple[str, ...]):
+        if parts in self.ids:
+            return self.ids[parts]
+        parent_id = self.resolve(parts[:-1])
+        existing = self.db.folders.find_one(
+            {"workspace_id": self.workspace_id, "parent_id": parent_id, "name": parts[-1], "owner_id": self.owner_id},
+            {"_id": 1}
+        )
+        if existing:
+            folder_id = existing["_id"]
+        else:
+            now = datetime.utcnow()
+            folder_id = self.db.folders.insert_one({
+                "name": parts[-1],
+                "parent_id": parent_id,
+                "workspace_id": self.workspace_id,
+                "owner_id": self.owner_id,
+                **self.access_fields(parent_id),
+                "created_at": now,
+                "updated_at": now
+            }).inserted_id
+            self.created += 1
+        self.ids[parts] = folder_id
+        return folder_id
+
+
+def _read_members(members, resume_from: int, limit: int) -> list[tuple[str, bytes | None, str | None]]:
+    """
+    Pull up to limit members from the archive iterator as (path, data, skip reason).
+    The first resume_from members were imported by an earlier attempt and are passed over.
+    """
+    batch = []
+    for parts, size, read in members:
+        if resume_from > 0:
+            resume_from -= 1
+            continue
+        path = "/".join(parts)
+        if _skip(parts) or os.path.splitext(parts[-1])[1].lower() not in SUPPORTED_EXTENSIONS:
+            batch.append((path, None, ""))
+        elif size > settings.IMPORT_MAX_FILE_BYTES:
+            batch.append((path, None, f"larger than {settings.IMPORT_MAX_FILE_BYTES} bytes"))
+        else:
+            batch.append((path, read(), None))
+        if len(batch) >= limit:
+            break
+    return batch
+
+
+def parse_files(files: list[tuple[str, bytes]]) -> list[tuple[str, str, bytes | None, dict] | str]:
+    """Convert a batch of files in a worker process; a string entry is that file's error"""
+    results = []
+    for path, data in files:
+        try:
+            title, content = parse_file(path, data)
+            results.append((
+                title,
+                content,
+                signature_bytes(document_text({"title": title, "content": content})),
+                document_summary(content)
+            ))
+        except Exception as e:
+            results.append(f"{path}: {e}")
+    return results
+
+
+def import_key(job_id, path: str) -> str:
+    """Identifies the document an import job creates from one archive member"""
+    return f"{job_id}/{path}"
+
+
+def _insert_documents(db, documents: list[dict]) -> int:
+    """
+    Insert a batch, passing over documents an earlier attempt of the same job
+    already inserted (matched by import_key, which has a unique index), and
+    return how many were new. References are counted before the insert, so a
+    crash in between leaks a blob at worst rather than freeing one in use.
+    """
+    if not documents:
+        return 0
+    existing = {
+        document["import_key"]: document["_id"]
+        for document in db.documents.find(
+            {"import_key": {"$in": [document["import_key"] for document in documents]}}, {"import_key": 1}
+        )
+    }
+    new = [document for document in documents if document["import_key"] not in existing]
+    for document in new:
+        document["_id"] = ObjectId()
+        update_references(db, set(document["attachments"]), set())
+    failed = set()
+    if new:
+        try:
+            db.documents.insert_many(new, ordered=False)
+        except BulkWriteError as e:
+            # A runner that took over this job's lease got there first, or the archive repeats a path
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                raise
+            failed = {new[error["index"]]["_id"] for error in errors}
+    for document in documents:
+        if document.get("_id") in failed:
+            continue
+        doc_id = str(existing.get(document["import_key"], document.get("_id")))
+        semantic_index.upsert(document["workspace_id"], doc_id, document_text(document))
+        lsh_index.upsert(document["workspace_id"], doc_id, document["minhash"])
+    return len(new) - len(failed)
+
+
+def remove_archive(db, payload: dict):
+    try:
+        get_archive_bucket(db).delete(payload["archive_id"])
+    except NoFile:
+        pass
+
+
+@job_handler("import", cleanup=remove_archive)
+async def import_archive(ctx: JobContext, payload: dict) -> dict:
+    """
+    Import every supported file in an archive. The archive is copied from
+    GridFS to a local temporary file, then members are read in batches,
+    converted in the process pool and inserted with insert_many. Progress is
+    saved after every batch so a retried attempt resumes after the last one;
+    a batch inserted just before a crash is recognised by its import keys.
+    """
+    progress = {
+        "total_files": ctx.state.get("total_files"),
+        "processed_files": ctx.state.get("processed_files", 0),
+        "created_documents": ctx.state.get("created_documents", 0),
+        "created_folders": ctx.state.get("created_folders", 0),
+        "skipped_files": ctx.state.get("skipped_files", 0),
+        "errors": list(ctx.state.get("errors", [])),
+    }
+
+    def record_error(message: str):
+        if len(progress["errors"]) < MAX_RECORDED_ERRORS:
+            progress["errors"].append(message)
+
+    with tempfile.TemporaryFile(prefix="collabradoc-import-") as archive:
+        await ctx.run_sync(fetch_archive, ctx.db, payload["archive_id"], archive)
+        if progress["total_files"] is None:
+            progress["total_files"] = await ctx.run_sync(count_archive_files, archive)
+        await _import_members(ctx, payload, archive, progress, record_error)
+    return {key: progress[key] for key in ("created_documents", "created_folders", "skipped_files")}
+
+
+async def _import_members(ctx: JobContext, payload: dict, archive, progress: dict, record_error):
+    owner_id = payload["owner_id"]
+    workspace_id = payload["workspace_id"]
+    folders = _FolderResolver(ctx.db, owner_id, workspace_id, payload.get("folder_id"))
+    members = iter_archive(archive)
+    resume_from = progress["processed_files"]
+    try:
+        while True:
+            batch = await ctx.run_sync(_read_members, members, resume_from, settings.IMPORT_BATCH_SIZE)
+            resume_from = 0
+            if not batch:
+                break
+            readable = []
+            for path, data, reason in batch:
+                if data is None:
+                    progress["skipped_files"] += 1
+                    if reason:
+                        record_error(f"{path}: {reason}")
+                else:
+                    readable.append((path, data))
+            parsed = await ctx.run_cpu(parse_files, readable) if readable else []
+
+            documents = []
+            now = datetime.utcnow()
+            for (path, _), outcome in zip(readable, parsed):
+                if isinstance(outcome, str):
+                    progress["skipped_files"] += 1
+                    record_error(outcome)
+                    continue
+                title, content, minhash, summary = outcome
+                parts = tuple(path.split("/")[:-1])
+                folder_id = await ctx.run_sync(folders.resolve, parts)
+                documents.append({
+                    "import_key": import_key(ctx.job_id, path),
+                    "title": title,
+                    "content": content,
+                    "folder_id": folder_id,
+                    "workspace_id": workspace_id,
+                    "isPublic": False,
+                    "owner_id": owner_id,
+                    **await ctx.run_sync(folders.access_fields, folder_id),
+                    "attachments": sorted(referenced_attachments(content)),
+                    "minhash": minhash,
+                    "last_edited_by": owner_id,
+                    "created_at": now,
+                    "updated_at": now,
+                    **summary
+                })
+            created = await ctx.run_sync(_insert_documents, ctx.db, documents)
+
+            progress["processed_files"] += len(batch)
+            progress["created_documents"] += created
+            progress["created_folders"] += folders.created
+            folders.created = 0
+            await ctx.progress(**progress)
+    finally:
+        members.close()
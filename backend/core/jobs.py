@@ -0,0 +1,349 @@
+import asyncio
+import functools
+import logging
+import os
+import random
+import socket
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from anyio import to_thread
+from pymongo import ReturnDocument
+
+from core.executor import run_in_process
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler once cancellation of its job has been requested"""
+
+
+class PermanentJobError(Exception):
+    """A failure that retrying cannot fix; the job fails without further attempts"""
+
+
+@dataclass
+class JobHandler:
+    run: Callable[["JobContext", dict], Awaitable[dict | None]]
+    cleanup: Callable[[object, dict], None] | None = None
+
+
+_handlers: dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str, cleanup: Callable[[object, dict], None] | None = None):
+    """
+    Register an async handler for a job kind. cleanup(db, payload) runs once the
+    job reaches a terminal state, e.g. to delete a stored upload.
+    """
+    def register(func):
+        _handlers[kind] = JobHandler(func, cleanup)
+        return func
+    return register
+
+
+def _run_cleanup(db, kind: str, payload: dict):
+    handler = _handlers.get(kind)
+    if handler and handler.cleanup:
+        try:
+            handler.cleanup(db, payload)
+        except Exception as e:
+            logger.warning("Cleanup for %s job failed: %s", kind, e)
+
+
+class JobContext:
+    """What a handler gets besides its payload: the database, progress reporting and cancellation"""
+
+    def __init__(self, runner: "JobRunner", job: dict):
+        self.runner = runner
+        self.db = runner.db
+        self.job_id = job["_id"]
+        self.attempt = job["attempts"]
+        self.state: dict = dict(job.get("progress") or {})
+        self.cancel_requested = bool(job.get("cancel_requested"))
+
+    def check_cancelled(self):
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    async def progress(self, **fields):
+        """Merge fields into the stored progress; also a cancellation checkpoint"""
+        self.state.update(fields)
+        await to_thread.run_sync(functools.partial(
+            self.db.jobs.update_one,
+            {"_id": self.job_id, "worker_id": self.runner.worker_id},
+            {"$set": {"progress": self.state, "updated_at": datetime.utcnow()}}
+        ))
+        self.check_cancelled()
+
+    async def run_sync(self, func, *args):
+        """Blocking I/O in the thread pool"""
+        return await to_thread.run_sync(functools.partial(func, *args))
+
+    async def run_cpu(self, func, *args):
+        """CPU-bound work in the shared process pool"""
+        return await run_in_process(func, *args)
+
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    ceiling = min(settings.JOB_RETRY_MAX_SECONDS, settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+class JobRunner:
+    """
+    Claims jobs from the jobs collection with a lease and runs them on a fixed
+    number of asyncio workers. Leases are renewed while a job runs, so jobs
+    held by a crashed process become claimable again once their lease expires.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.db = None
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._loops: list[asyncio.Task] = []
+        self._running: dict = {}
+
+    def start(self, db):
+        self.db = db
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._loops = [asyncio.create_task(self._worker()) for _ in range(settings.JOB_CONCURRENCY)]
+        self._loops.append(asyncio.create_task(self._heartbeat()))
+
+    def wake(self):
+        self._wake.set()
+
+    def _ensure_indexes(self):
+        self.db.jobs.create_index([("status", 1), ("run_after", 1)])
+        self.db.jobs.create_index([("owner_id", 1), ("created_at", -1)])
+        self.db.jobs.create_index("finished_at", expireAfterSeconds=settings.JOB_RETENTION_SECONDS)
+
+    def _claim(self) -> dict | None:
+        now = datetime.utcnow()
+        return self.db.jobs.find_one_and_update(
+            {"$or": [
+                {"status": QUEUED, "run_after": {"$lte": now}},
+                # Held by a process that died mid-job
+                {"status": RUNNING, "lease_until": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "worker_id": self.worker_id,
+                    "lease_until": now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+                    "started_at": now,
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("run_after", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _finish(self, job: dict, status: str, **fields) -> bool:
+        now = datetime.utcnow()
+        result = self.db.jobs.update_one(
+            {"_id": job["_id"], "worker_id": self.worker_id},
+            {"$set": {
+                "status": status,
+                "worker_id": None,
+                "lease_until": None,
+                "updated_at": now,
+                "finished_at": now if status in TERMINAL_STATUSES else None,
+                **fields
+            }}
+        )
+        if result.modified_count and status in TERMINAL_STATUSES:
+            _run_cleanup(self.db, job["kind"], job.get("payload") or {})
+        return bool(result.modified_count)
+
+    async def _worker(self):
+        try:
+            await to_thread.run_sync(self._ensure_indexes)
+        except Exception as e:
+            logger.warning("Could not create job indexes: %s", e)
+        while not self._stopping:
+            try:
+                job = await to_thread.run_sync(self._claim)
+            except Exception as e:
+                logger.warning("Claiming a job failed: %s", e)
+                job = None
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), settings.JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job)
+
+    async def _execute(self, job: dict):
+        handler = _handlers.get(job["kind"])
+        if job.get("cancel_requested"):
+            await to_thread.run_sync(functools.partial(self._finish, job, CANCELLED))
+            return
+        if handler is None:
+            await to_thread.run_sync(functools.partial(
+                self._finish, job, FAILED, error=f"Unknown job kind {job['kind']!r}"
+            ))
+            return
+        if job["attempts"] > job["max_attempts"]:
+            await to_thread.run_sync(functools.partial(
+                self._finish, job, FAILED, error="Lease expired on the final attempt"
+            ))
+            return
+
+        context = JobContext(self, job)
+        task = asyncio.create_task(handler.run(context, job.get("payload") or {}))
+        self._running[job["_id"]] = (task, context)
+        finish = None
+        try:
+            result = await task
+            finish = functools.partial(self._finish, job, SUCCEEDED, result=result, error=None)
+        except (JobCancelled, asyncio.CancelledError):
+            if context.cancel_requested:
+                finish = functools.partial(self._finish, job, CANCELLED)
+            else:
+                # Shutdown: hand the job back without spending an attempt
+                finish = functools.partial(self._requeue, job)
+        except PermanentJobError as e:
+            finish = functools.partial(self._finish, job, FAILED, error=str(e))
+        except Exception as e:
+            logger.exception("Job %s (%s) failed on attempt %d", job["_id"], job["kind"], job["attempts"])
+            if job["attempts"] < job["max_attempts"]:
+                run_after = datetime.utcnow() + timedelta(seconds=retry_delay(job["attempts"]))
+                finish = functools.partial(self._finish, job, QUEUED, error=str(e), run_after=run_after)
+            else:
+                finish = functools.partial(self._finish, job, FAILED, error=str(e))
+        finally:
+            self._running.pop(job["_id"], None)
+            if finish is not None:
+                try:
+                    await asyncio.shield(to_thread.run_sync(finish))
+                except Exception as e:
+                    logger.warning("Could not record outcome of job %s: %s", job["_id"], e)
+
+    def _requeue(self, job: dict):
+        self.db.jobs.update_one(
+            {"_id": job["_id"], "worker_id": self.worker_id},
+            {
+                "$set": {
+                    "status": QUEUED,
+                    "worker_id": None,
+                    "lease_until": None,
+                    "run_after": datetime.utcnow(),
+                    "updated_at": datetime.utcnow()
+                },
+                "$inc": {"attempts": -1}
+            }
+        )
+
+    def _renew_leases(self) -> list:
+        """Extend leases on running jobs; returns the ids whose cancellation was requested"""
+        ids = list(self._running)
+        if not ids:
+            return []
+        self.db.jobs.update_many(
+            {"_id": {"$in": ids}, "worker_id": self.worker_id},
+            {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=settings.JOB_LEASE_SECONDS)}}
+        )
+        return [job["_id"] for job in self.db.jobs.find({"_id": {"$in": ids}, "cancel_requested": True}, {"_id": 1})]
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+            try:
+                cancelled = await to_thread.run_sync(self._renew_leases)
+            except Exception as e:
+                logger.warning("Renewing job leases failed: %s", e)
+                continue
+            for job_id in cancelled:
+                running = self._running.get(job_id)
+                if running and not running[1].cancel_requested:
+                    running[1].cancel_requested = True
+                    running[0].cancel()
+
+    async def stop(self):
+        """Stop claiming, give running jobs JOB_DRAIN_SECONDS to finish, then requeue the rest"""
+        self._stopping = True
+        self._wake.set()
+        tasks = [task for task, _ in self._running.values()]
+        if tasks:
+            logger.info("Draining %d running jobs", len(tasks))
+            _, pending = await asyncio.wait(tasks, timeout=settings.JOB_DRAIN_SECONDS)
+            for task in pending:
+                task.cancel()
+        # Worker loops finish recording outcomes (including requeues) before exiting
+        workers, heartbeat = self._loops[:-1], self._loops[-1]
+        await asyncio.gather(*workers, return_exceptions=True)
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+        self._loops = []
+
+
+job_runner = JobRunner()
+
+
+def enqueue_job(db, kind: str, payload: dict, owner_id=None, max_attempts: int | None = None) -> dict:
+    """Persist a job and nudge this process's workers to pick it up"""
+    now = datetime.utcnow()
+    job = {
+        "kind": kind,
+        "owner_id": owner_id,
+        "payload": payload,
+        "status": QUEUED,
+        "progress": {},
+        "result": None,
+        "error": None,
+        "attempts": 0,
+        "max_attempts": max_attempts or settings.JOB_MAX_ATTEMPTS,
+        "cancel_requested": False,
+        "run_after": now,
+        "worker_id": None,
+        "lease_until": None,
+        "created_at": now,
+        "updated_at": now,
+        "started_at": None,
+        "finished_at": None
+    }
+    job["_id"] = db.jobs.insert_one(job).inserted_id
+    job_runner.wake()
+    return job
+
+
+def cancel_job(db, job_id) -> dict | None:
+    """Cancel a queued job outright; a running one is flagged and stops at its next checkpoint"""
+    now = datetime.utcnow()
+    job = db.jobs.find_one_and_update(
+        {"_id": job_id, "status": QUEUED},
+        {"$set": {"status": CANCELLED, "cancel_requested": True, "updated_at": now, "finished_at": now}},
+        return_document=ReturnDocument.AFTER
+    )
+    if job:
+        _run_cleanup(db, job["kind"], job.get("payload") or {})
+        return job
+    job = db.jobs.find_one_and_update(
+        {"_id": job_id, "status": RUNNING},
+        {"$set": {"cancel_requested": True, "updated_at": now}},
+        return_document=ReturnDocument.AFTER
+    )
+    if job:
+        running = job_runner._running.get(job_id)
+        if running:
+            running[1].cancel_requested = True
+            running[0].cancel()
+    return job or db.jobs.find_one({"_id": job_id})
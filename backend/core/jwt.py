@@ -1,45 +1,202 @@
-from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from anyio import to_thread
+from datetime import datetime, timedelta, timezone
+from functools import partial
 import jwt  # PyJWT instead of jose
 from jwt.exceptions import InvalidTokenError  # Use PyJWT's exception
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from core.settings import settings
-from core.database import get_db
+from core.repositories import Repositories, get_repositories
 from models.user import UserInDB
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
 
 security = HTTPBearer()
 
-def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+
+
+class RevocationList:
+    """Revoked token ids (jti) held in memory for O(1) checks, persisted in Mongo with a TTL"""
+
+    def __init__(self):
+        self._revoked: dict[str, float] = {}
+        self._synced_at = datetime.min
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def revoke(self, db, jti: str, expires_at: float):
+        self._revoked[jti] = expires_at
+        db.revoked_tokens.update_one(
+            {"_id": jti},
+            {"$set": {
+                "expires_at": datetime.utcfromtimestamp(expires_at),
+                "revoked_at": datetime.utcnow(),
+            }},
+            upsert=True,
+        )
+
+    def claim(self, db, jti: str, expires_at: float) -> bool:
+        """
+        Revoke a single-use token, True only for the one caller whose insert
+        created the entry: of two workers racing to rotate the same refresh
+        token, the other one gets False.
+        """
+        self._revoked[jti] = expires_at
+        try:
+            db.revoked_tokens.insert_one({
+                "_id": jti,
+                "expires_at": datetime.utcfromtimestamp(expires_at),
+                "revoked_at": datetime.utcnow(),
+            })
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def sync(self, db):
+        """Pick up revocations made by other workers and drop entries that have expired anyway"""
+        now = time.time()
+        started = datetime.utcnow()
+        for entry in db.revoked_tokens.find({"revoked_at": {"$gte": self._synced_at}}):
+            self._revoked[entry["_id"]] = entry["expires_at"].replace(tzinfo=timezone.utc).timestamp()
+        self._synced_at = started - timedelta(seconds=1)
+        for jti in [jti for jti, exp in self._revoked.items() if exp < now]:
+            self._revoked.pop(jti, None)
+
+
+revoked_tokens = RevocationList()
+
+
+async def revocation_sync_loop(db):
+    """Background task keeping this worker's revocation list in step with the others"""
+    while True:
+        try:
+            await to_thread.run_sync(partial(db.revoked_tokens.create_index, "expires_at", expireAfterSeconds=0))
+            break
+        except Exception as e:
+            logger.warning("Could not create revoked_tokens index: %s", e)
+            await asyncio.sleep(settings.REVOCATION_SYNC_SECONDS)
+    while True:
+        try:
+            await to_thread.run_sync(revoked_tokens.sync, db)
+        except Exception as e:
+            logger.warning("Revocation sync failed: %s", e)
+        await asyncio.sleep(settings.REVOCATION_SYNC_SECONDS)
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of verified token payloads keyed by token hash, honoring exp"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[bytes, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> dict | None:
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                return None
+            if payload["exp"] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def put(self, key: bytes, payload: dict):
+        with self._lock:
+            self._entries[key] = payload
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+token_cache = VerifiedTokenCache(settings.TOKEN_CACHE_SIZE)
+
+
+def _encode(data: dict, token_type: str, expires_delta: timedelta) -> str:
+    now = datetime.now(timezone.utc)
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now() + expires_delta
-    else:
-        expire = datetime.now() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({
+        "type": token_type,
+        "jti": secrets.token_urlsafe(16),
+        "iat": int(now.timestamp()),
+        "exp": int((now + expires_delta).timestamp()),
+    })
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 
+def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
+    return _encode(data, ACCESS_TOKEN_TYPE, expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
+
+
+def create_refresh_token(data: dict) -> str:
+    return _encode(data, REFRESH_TOKEN_TYPE, timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS))
+
+
+def decode_token(token: str) -> dict:
+    """Verify a token once and serve repeat presentations from the cache"""
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except InvalidTokenError:  # Use PyJWT's exception
+            return {}
+        if "exp" not in payload:
+            return {}
+        token_cache.put(key, payload)
+    if payload.get("jti") in revoked_tokens:
+        return {}
+    return payload
+
+
 def decode_access_token(token: str) -> dict:
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload
-    except InvalidTokenError:  # Use PyJWT's exception
+    payload = decode_token(token)
+    # Tokens issued before token types existed are access tokens
+    if payload.get("type", ACCESS_TOKEN_TYPE) != ACCESS_TOKEN_TYPE:
+        return {}
+    return payload
+
+
+def decode_refresh_token(token: str) -> dict:
+    payload = decode_token(token)
+    if payload.get("type") != REFRESH_TOKEN_TYPE:
         return {}
+    return payload
+
+
+def revoke_token(db, payload: dict):
+    if payload.get("jti"):
+        revoked_tokens.revoke(db, payload["jti"], payload["exp"])
+
+
+def claim_token(db, payload: dict) -> bool:
+    """Spend a single-use token; False if it was already spent (or can't be tracked)"""
+    if not payload.get("jti"):
+        return False
+    return revoked_tokens.claim(db, payload["jti"], payload["exp"])
 
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db = Depends(get_db("CollabraDoc"))
+    repos: Repositories = Depends(get_repositories)
 ) -> UserInDB:
     """Get current user from JWT token"""
     try:
         token = credentials.credentials
         payload = decode_access_token(token)
         
-        print(f"Token: {token}")
-        print(f"Payload: {payload}")
-        
         if not payload:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -48,7 +205,6 @@ async def get_current_user(
             )
         
         user_id = payload.get("sub")
-        print(f"User ID from token: {user_id}")
         
         if user_id is None:
             raise HTTPException(
@@ -60,11 +216,9 @@ async def get_current_user(
         # Get user from database using ObjectId
         try:
             user_obj_id = ObjectId(user_id)
-            print(f"Looking for user with ObjectId: {user_obj_id}")
-            user = db.users.find_one({"_id": user_obj_id})
-            print(f"User found: {user}")
+            user = repos.users.find_one({"_id": user_obj_id})
         except Exception as e:
-            print(f"Error converting user_id to ObjectId: {e}")
+            logger.debug("Invalid user id in token: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid user ID format",
@@ -72,7 +226,7 @@ async def get_current_user(
             )
         
         if user is None:
-            print(f"No user found with ID: {user_id}")
+            logger.debug("No user found with ID: %s", user_id)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="User not found",
@@ -80,13 +234,12 @@ async def get_current_user(
             )
         
         # Convert ObjectId to string for the user model
-        print(f"Returning user: {user}")
         return UserInDB(**user)
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Unexpected error in get_current_user: {e}")
+        logger.exception("Unexpected error in get_current_user: %s", e)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
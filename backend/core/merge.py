@@ -0,0 +1,250 @@
+"""
+Text diff and three-way merge for concurrent saves. Diffs use Myers' O(ND)
+algorithm in its linear-space form (bisect on the middle snake, then recurse
+on each half), after trimming the common prefix and suffix. Merging runs at
+line granularity first; a region both sides changed is merged again word by
+word, so two edits to the same paragraph only conflict if they overlap.
+Lines end at newlines and at the closing tags of block elements, so editor
+HTML without newlines still splits into paragraphs.
+"""
+import re
+from dataclasses import dataclass, field
+
+_LINE_END_RE = re.compile(r"\n|</(?:p|h[1-6]|li|ul|ol|div|blockquote|pre|tr|table|section)\s*>|<br\s*/?>|<hr\s*/?>", re.I)
+_WORD_RE = re.compile(r"<[^>]*>|&#?\w+;|\w+|\s+|[^\w\s]", re.U)
+
+# Characters of each side kept in a conflict report
+CONFLICT_CONTEXT_CHARS = 200
+
+
+def split_lines(text: str) -> list[str]:
+    """Cut text after each line end; joining the pieces gives the text back"""
+    pieces = []
+    start = 0
+    for match in _LINE_END_RE.finditer(text):
+        pieces.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+
+def split_words(text: str) -> list[str]:
+    """Tags, entities, words, whitespace runs and single punctuation marks"""
+    return _WORD_RE.findall(text)
+
+
+def _run_forward(a, i, b, j, limit: int) -> int:
+    """Length of the common run at a[i:], b[j:] (at most limit), compared in galloping slices"""
+    run = 0
+    step = 1
+    while run < limit:
+        size = min(step, limit - run)
+        if a[i + run:i + run + size] == b[j + run:j + run + size]:
+            run += size
+            step = size * 2
+        elif size == 1:
+            break
+        else:
+            step = size // 2
+    return run
+
+
+def _run_backward(a, i, b, j, limit: int) -> int:
+    """Length of the common run ending just before a[i], b[j] (at most limit)"""
+    run = 0
+    step = 1
+    while run < limit:
+        size = min(step, limit - run)
+        if a[i - run - size:i - run] == b[j - run - size:j - run]:
+            run += size
+            step = size * 2
+        elif size == 1:
+            break
+        else:
+            step = size // 2
+    return run
+
+
+def _bisect(a, alo, ahi, b, blo, bhi) -> tuple[int, int] | None:
+    """
+    The middle snake of a[alo:ahi] vs b[blo:bhi] as a split point (x, y),
+    or None if the two share nothing. Walks forward and backward at once; the
+    V maps hold one entry per diagonal reached, so memory is O(D), at most
+    O(N+M), and a small edit to a large document stays cheap.
+    """
+    n = ahi - alo
+    m = bhi - blo
+    max_d = (n + m + 1) // 2
+    v1 = {1: 0}
+    v2 = {1: 0}
+    delta = n - m
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            if k1 == -d or (k1 != d and v1.get(k1 - 1, -1) < v1.get(k1 + 1, -1)):
+                x1 = v1[k1 + 1]
+            else:
+                x1 = v1[k1 - 1] + 1
+            y1 = x1 - k1
+            if x1 < n and y1 < m:
+                run = _run_forward(a, alo + x1, b, blo + y1, min(n - x1, m - y1))
+                x1 += run
+                y1 += run
+            v1[k1] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                x2 = v2.get(delta - k1, -1)
+                if x2 != -1 and x1 >= n - x2:
+                    return alo + x1, blo + y1
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            if k2 == -d or (k2 != d and v2.get(k2 - 1, -1) < v2.get(k2 + 1, -1)):
+                x2 = v2[k2 + 1]
+            else:
+                x2 = v2[k2 - 1] + 1
+            y2 = x2 - k2
+            if x2 < n and y2 < m:
+                run = _run_backward(a, ahi - x2, b, bhi - y2, min(n - x2, m - y2))
+                x2 += run
+                y2 += run
+            v2[k2] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                x1 = v1.get(delta - k2, -1)
+                if x1 != -1 and x1 >= n - x2:
+                    return alo + x1, blo + x1 - (delta - k2)
+    return None
+
+
+def matching_blocks(a: list, b: list) -> list[tuple[int, int, int]]:
+    """
+    (i, j, size) runs with a[i:i+size] == b[j:j+size], in order, forming the
+    longest common subsequence found by a shortest edit script.
+    """
+    blocks = []
+    # Explicit stack: deeply nested splits would otherwise hit the recursion limit
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        run = _run_forward(a, alo, b, blo, min(ahi - alo, bhi - blo))
+        if run:
+            blocks.append((alo, blo, run))
+            alo += run
+            blo += run
+        run = _run_backward(a, ahi, b, bhi, min(ahi - alo, bhi - blo))
+        if run:
+            ahi -= run
+            bhi -= run
+            blocks.append((ahi, bhi, run))
+        if alo == ahi or blo == bhi:
+            continue
+        split = _bisect(a, alo, ahi, b, blo, bhi)
+        if split is not None:
+            x, y = split
+            stack.append((alo, x, blo, y))
+            stack.append((x, ahi, y, bhi))
+    blocks.sort()
+    merged = []
+    for i, j, size in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + size)
+        else:
+            merged.append((i, j, size))
+    return merged
+
+
+@dataclass
+class Conflict:
+    base: str
+    current: str
+    incoming: str
+
+    def to_dict(self) -> dict:
+        return {
+            "base": self.base[:CONFLICT_CONTEXT_CHARS],
+            "current": self.current[:CONFLICT_CONTEXT_CHARS],
+            "incoming": self.incoming[:CONFLICT_CONTEXT_CHARS],
+        }
+
+
+@dataclass
+class MergeResult:
+    text: str
+    conflicts: list[Conflict] = field(default_factory=list)
+
+
+def _stable_regions(base: list, ours: list, theirs: list) -> list[tuple[int, int, int, int]]:
+    """(base, ours, theirs, size) runs where all three agree, from intersecting both diffs' matching blocks"""
+    to_ours = matching_blocks(base, ours)
+    to_theirs = matching_blocks(base, theirs)
+    regions = []
+    x = y = 0
+    while x < len(to_ours) and y < len(to_theirs):
+        i, j, size = to_ours[x]
+        i2, k, size2 = to_theirs[y]
+        start, end = max(i, i2), min(i + size, i2 + size2)
+        if start < end and not "".join(base[start:end]).isspace():
+            # Runs of whitespace alone don't separate changes, so they don't split a conflict
+            regions.append((start, j + start - i, k + start - i2, end - start))
+        if i + size < i2 + size2:
+            x += 1
+        else:
+            y += 1
+    return regions
+
+
+def _chunks(base: list, ours: list, theirs: list):
+    """diff3: (base, ours, theirs) slices, alternating unstable runs and stable runs where all three agree"""
+    i = j = k = 0
+    for start, ours_start, theirs_start, size in _stable_regions(base, ours, theirs):
+        if start > i or ours_start > j or theirs_start > k:
+            yield base[i:start], ours[j:ours_start], theirs[k:theirs_start]
+        i, j, k = start + size, ours_start + size, theirs_start + size
+        yield base[start:i], ours[ours_start:j], theirs[theirs_start:k]
+    if i < len(base) or j < len(ours) or k < len(theirs):
+        yield base[i:], ours[j:], theirs[k:]
+
+
+def _merge(base: list, ours: list, theirs: list, refine) -> MergeResult:
+    merged = []
+    conflicts = []
+    for base_part, ours_part, theirs_part in _chunks(base, ours, theirs):
+        if ours_part == theirs_part or theirs_part == base_part:
+            merged.extend(ours_part)
+        elif ours_part == base_part:
+            merged.extend(theirs_part)
+        else:
+            # Both sides changed this region; a finer look may still reconcile them
+            result = refine("".join(base_part), "".join(ours_part), "".join(theirs_part))
+            merged.append(result.text)
+            conflicts.extend(result.conflicts)
+    return MergeResult("".join(merged), conflicts)
+
+
+def _unresolved(base: str, ours: str, theirs: str) -> MergeResult:
+    # Keep the stored text where the two disagree; the caller reports the conflict
+    return MergeResult(ours, [Conflict(base, ours, theirs)])
+
+
+def _merge_words(base: str, ours: str, theirs: str) -> MergeResult:
+    return _merge(split_words(base), split_words(ours), split_words(theirs), _unresolved)
+
+
+def merge3(base: str, current: str, incoming: str) -> MergeResult:
+    """
+    Merge the changes from base to incoming into current. Edits to different
+    lines, or to different words of the same line, combine; only overlapping
+    edits that disagree come back as conflicts.
+    """
+    if incoming == base or incoming == current:
+        return MergeResult(current)
+    if current == base:
+        return MergeResult(incoming)
+    return _merge(split_lines(base), split_lines(current), split_lines(incoming), _merge_words)
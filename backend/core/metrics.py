@@ -0,0 +1,309 @@
+import asyncio
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, Tuple
+
+from fastapi.routing import APIRoute
+
+from core.profiling import MAX_RECORDED_COMMANDS, log_request, should_profile, start_profile
+
+
+class RequestMetrics:
+    """Timings collected while a single request is being served"""
+    __slots__ = (
+        "start", "db_count", "db_time", "deps_time", "handler_time", "serialize_time",
+        "route_started", "endpoint_ended", "commands", "threads", "workspace",
+    )
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_count = 0
+        self.db_time = 0.0
+        self.deps_time = 0.0
+        self.handler_time = 0.0
+        self.serialize_time = 0.0
+        self.route_started = 0.0
+        self.endpoint_ended = 0.0
+        # (command, collection, duration, filter) kept for the slow-request log
+        self.commands = []
+        # Threads sampled by the profiler; None unless this request is profiled
+        self.threads = None
+        # Set once the request's workspace is resolved
+        self.workspace = None
+
+    def record_db(self, duration: float, command_name: str, collection: str | None, filter_ref):
+        self.db_count += 1
+        self.db_time += duration
+        if len(self.commands) < MAX_RECORDED_COMMANDS:
+            self.commands.append((command_name, collection, duration, filter_ref))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def server_timing(self, total: float) -> str:
+        return ", ".join([
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.db_count} commands"',
+            f"auth;dur={self.deps_time * 1000:.2f}",
+            f"app;dur={self.handler_time * 1000:.2f}",
+            f"ser;dur={self.serialize_time * 1000:.2f}",
+            f"total;dur={total * 1000:.2f}",
+        ])
+
+
+_current_metrics: ContextVar[RequestMetrics | None] = ContextVar("request_metrics", default=None)
+
+
+def current_request_metrics() -> RequestMetrics | None:
+    return _current_metrics.get()
+
+
+def _label_string(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield f"{self.name}{_label_string(self.labels, label_values)} {value}"
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time"""
+    def __init__(self, name: str, help_text: str, read):
+        self.name = name
+        self.help_text = help_text
+        self._read = read
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self._read()}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...], labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        inf_label = 'le="+Inf"'
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _label_string(self.labels, label_values, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            cumulative += series[len(self.buckets)]
+            yield f"{self.name}_bucket{_label_string(self.labels, label_values, inf_label)} {cumulative}"
+            yield f"{self.name}_sum{_label_string(self.labels, label_values)} {series[-1]}"
+            yield f"{self.name}_count{_label_string(self.labels, label_values)} {cumulative}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, read) -> Gauge:
+        return self.register(Gauge(name, help_text, read))
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...], labels: Tuple[str, ...] = ()) -> Histogram:
+        return self.register(Histogram(name, help_text, buckets, labels))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+registry = MetricsRegistry()
+
+REQUESTS_TOTAL = registry.counter(
+    "collabradoc_requests_total", "Requests served", ("method", "route", "status")
+)
+REQUEST_DURATION = registry.histogram(
+    "collabradoc_request_duration_seconds", "Total request time", LATENCY_BUCKETS, ("method", "route")
+)
+REQUEST_DB_DURATION = registry.histogram(
+    "collabradoc_request_db_duration_seconds", "Time spent in MongoDB commands per request",
+    LATENCY_BUCKETS, ("method", "route")
+)
+REQUEST_DB_COMMANDS = registry.histogram(
+    "collabradoc_request_db_commands", "MongoDB commands issued per request", COUNT_BUCKETS, ("method", "route")
+)
+REQUEST_AUTH_DURATION = registry.histogram(
+    "collabradoc_request_auth_duration_seconds", "Time spent resolving dependencies (auth, db handles)",
+    LATENCY_BUCKETS, ("method", "route")
+)
+REQUEST_SERIALIZE_DURATION = registry.histogram(
+    "collabradoc_request_serialize_duration_seconds", "Time spent validating and rendering the response",
+    LATENCY_BUCKETS, ("method", "route")
+)
+# Per workspace but not per route, to keep the series count at one set per workspace
+WORKSPACE_REQUESTS_TOTAL = registry.counter(
+    "collabradoc_workspace_requests_total", "Requests served per workspace", ("workspace",)
+)
+WORKSPACE_REQUEST_DURATION = registry.histogram(
+    "collabradoc_workspace_request_duration_seconds", "Total request time per workspace",
+    LATENCY_BUCKETS, ("workspace",)
+)
+WORKSPACE_DB_DURATION = registry.histogram(
+    "collabradoc_workspace_db_duration_seconds", "Time spent in MongoDB commands per workspace",
+    LATENCY_BUCKETS, ("workspace",)
+)
+
+
+def _mark_endpoint_start(metrics: RequestMetrics | None) -> float:
+    started = time.perf_counter()
+    if metrics is not None and metrics.route_started:
+        metrics.deps_time = started - metrics.route_started
+    return started
+
+
+def _mark_endpoint_end(metrics: RequestMetrics | None, started: float):
+    if metrics is not None:
+        metrics.endpoint_ended = time.perf_counter()
+        metrics.handler_time = metrics.endpoint_ended - started
+
+
+def _timed_endpoint(call):
+    """Wrap an endpoint so its run time lands on the current RequestMetrics"""
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def async_wrapper(*args, **kwargs):
+            metrics = _current_metrics.get()
+            started = _mark_endpoint_start(metrics)
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                _mark_endpoint_end(metrics, started)
+        return async_wrapper
+
+    @functools.wraps(call)
+    def sync_wrapper(*args, **kwargs):
+        metrics = _current_metrics.get()
+        started = _mark_endpoint_start(metrics)
+        try:
+            return call(*args, **kwargs)
+        finally:
+            _mark_endpoint_end(metrics, started)
+    return sync_wrapper
+
+
+class InstrumentedRoute(APIRoute):
+    """APIRoute that splits request time into dependencies, handler and serialization"""
+
+    def get_route_handler(self):
+        self.dependant.call = _timed_endpoint(self.dependant.call)
+        handler = super().get_route_handler()
+
+        async def instrumented_handler(request):
+            metrics = _current_metrics.get()
+            if metrics is not None:
+                metrics.route_started = time.perf_counter()
+            response = await handler(request)
+            if metrics is not None and metrics.endpoint_ended:
+                metrics.serialize_time = time.perf_counter() - metrics.endpoint_ended
+            return response
+
+        return instrumented_handler
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-request timings and a Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        status_code = 500
+        sampler = start_profile(metrics) if should_profile(scope) else None
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", metrics.server_timing(metrics.elapsed()).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_metrics.reset(token)
+            total = metrics.elapsed()
+            method = scope["method"]
+            route = _route_label(scope)
+            profile = sampler.stop() if sampler is not None else None
+            log_request(scope, metrics, total, status_code, route, profile)
+            REQUESTS_TOTAL.inc(method, route, str(status_code))
+            REQUEST_DURATION.observe(total, method, route)
+            REQUEST_DB_DURATION.observe(metrics.db_time, method, route)
+            REQUEST_DB_COMMANDS.observe(metrics.db_count, method, route)
+            REQUEST_AUTH_DURATION.observe(metrics.deps_time, method, route)
+            REQUEST_SERIALIZE_DURATION.observe(metrics.serialize_time, method, route)
+            if metrics.workspace is not None:
+                WORKSPACE_REQUESTS_TOTAL.inc(metrics.workspace)
+                WORKSPACE_REQUEST_DURATION.observe(total, metrics.workspace)
+                WORKSPACE_DB_DURATION.observe(metrics.db_time, metrics.workspace)
@@ -0,0 +1,428 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable
+
+from anyio import to_thread
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from core.permissions import READERS_STAGE
+from core.settings import settings
+from core.summary import SUMMARY_FIELDS, document_summary
+from core.workspaces import GUEST, personal_workspace_id, set_member
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+APPLIED = "applied"
+
+
+class LeaseLost(Exception):
+    """Another process took over the migration after our lease expired"""
+
+
+class MigrationInterrupted(Exception):
+    """The process is shutting down; the migration resumes from its checkpoint next start"""
+
+
+_stopping = threading.Event()
+# Set once this process has seen every migration applied
+_applied = asyncio.Event()
+# Set when the lifespan starts applying migrations; API requests wait for _applied from then on
+_started = False
+
+# Sent with the 503 API requests get while migrations are still running
+MIGRATING_RETRY_SECONDS = 5
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    run: Callable[["MigrationContext"], None]
+
+
+_migrations: dict[int, Migration] = {}
+
+
+def migration(version: int, name: str):
+    """Register a migration; versions run in ascending order, each exactly once"""
+    def register(func):
+        if version in _migrations:
+            raise ValueError(f"Duplicate migration version {version}")
+        _migrations[version] = Migration(version, name, func)
+        return func
+    return register
+
+
+class MigrationContext:
+    def __init__(self, db, record: dict, owner: str):
+        self.db = db
+        self.version = record["_id"]
+        self.checkpoint: dict = dict(record.get("checkpoint") or {})
+        self.owner = owner
+
+    def save_checkpoint(self, key: str, value, processed: int):
+        """Record progress and renew the lease; raises LeaseLost if another process holds it"""
+        self.checkpoint[key] = value
+        result = self.db.migrations.update_one(
+            {"_id": self.version, "lease_owner": self.owner},
+            {
+                "$set": {
+                    f"checkpoint.{key}": value,
+                    "lease_until": datetime.utcnow() + timedelta(seconds=settings.MIGRATION_LEASE_SECONDS),
+                    "updated_at": datetime.utcnow()
+                },
+                "$inc": {"processed": processed}
+            }
+        )
+        if not result.matched_count:
+            raise LeaseLost(self.version)
+        if _stopping.is_set():
+            raise MigrationInterrupted(self.version)
+
+
+def backfill(
+    ctx: MigrationContext,
+    collection: str,
+    projection: dict,
+    build_update: Callable[[dict], dict | None],
+    batch_updates: list[tuple[dict, dict]] = (),
+):
+    """
+    Walk a collection in _id order from the saved checkpoint, applying per-row
+    updates from build_update and set-wide (filter, update) pairs scoped to each
+    batch, one bulk_write per batch. Sleeps MIGRATION_THROTTLE_MS between batches
+    so a backfill on a live cluster doesn't crowd out user traffic.
+    """
+    coll = ctx.db[collection]
+    last_id = ctx.checkpoint.get(collection)
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = list(coll.find(query, projection).sort("_id", 1).limit(settings.MIGRATION_BATCH_SIZE))
+        if not batch:
+            return
+        operations = []
+        for record in batch:
+            update = build_update(record)
+            if update:
+                operations.append(UpdateOne({"_id": record["_id"]}, update))
+        ids = [record["_id"] for record in batch]
+        for match, update in batch_updates:
+            operations.append(UpdateMany({"_id": {"$in": ids}, **match}, update))
+        if operations:
+            coll.bulk_write(operations, ordered=False)
+        last_id = batch[-1]["_id"]
+        ctx.save_checkpoint(collection, last_id, len(batch))
+        time.sleep(settings.MIGRATION_THROTTLE_MS / 1000)
+
+
+def _created_at(record: dict) -> datetime:
+    """Creation time for records written before timestamps existed, taken from the ObjectId"""
+    if isinstance(record["_id"], ObjectId):
+        return record["_id"].generation_time.replace(tzinfo=None)
+    return datetime.utcnow()
+
+
+def _normalize_timestamps_and_owner(record: dict) -> dict:
+    updates = {}
+    if "created_at" not in record:
+        updates["created_at"] = _created_at(record)
+    if "updated_at" not in record:
+        updates["updated_at"] = record.get("created_at") or updates["created_at"]
+    if isinstance(record.get("owner_id"), ObjectId):
+        updates["owner_id"] = str(record["owner_id"])
+    return updates
+
+
+@migration(1, "normalize document and folder records")
+def normalize_records(ctx: MigrationContext):
+    """
+    Give every document and folder timestamps and a string owner_id, and fill
+    fields older clients left out, so read paths can serve a plain projection.
+    """
+    def document_update(record):
+        updates = _normalize_timestamps_and_owner(record)
+        if record.get("folder_id") in ("", "none"):
+            updates["folder_id"] = None
+        return {"$set": updates} if updates else None
+
+    def folder_update(record):
+        updates = _normalize_timestamps_and_owner(record)
+        if record.get("parent_id") in ("", "none"):
+            updates["parent_id"] = None
+        return {"$set": updates} if updates else None
+
+    backfill(
+        ctx,
+        "documents",
+        {"created_at": 1, "updated_at": 1, "owner_id": 1, "folder_id": 1},
+        document_update,
+        batch_updates=[
+            ({"content": {"$exists": False}}, {"$set": {"content": ""}}),
+            ({"isPublic": {"$exists": False}}, {"$set": {"isPublic": False}}),
+        ]
+    )
+    backfill(ctx, "folders", {"created_at": 1, "updated_at": 1, "owner_id": 1, "parent_id": 1}, folder_update)
+
+
+@migration(2, "store document summaries")
+def store_document_summaries(ctx: MigrationContext):
+    """Excerpt and stats for documents written before they were computed on save"""
+    def document_update(record):
+        if all(field in record for field in SUMMARY_FIELDS):
+            return None
+        return {"$set": document_summary(record.get("content") or "")}
+
+    backfill(
+        ctx,
+        "documents",
+        {"content": 1, **{field: 1 for field in SUMMARY_FIELDS}},
+        document_update,
+        batch_updates=[
+            ({"last_edited_by": {"$exists": False}}, [{"$set": {"last_edited_by": "$owner_id"}}]),
+        ]
+    )
+
+
+@migration(3, "index document blocks")
+def index_document_blocks(ctx: MigrationContext):
+    ctx.db.document_blocks.create_index([("document_id", 1), ("position", 1)])
+
+
+def _acquire(db, item: Migration, owner: str) -> tuple[str, dict | None]:
+    """("applied", None), ("busy", None) or ("acquired", record)"""
+    now = datetime.utcnow()
+    try:
+        db.migrations.update_one(
+            {"_id": item.version},
+            {"$setOnInsert": {
+                "name": item.name,
+                "status": PENDING,
+                "checkpoint": {},
+                "processed": 0,
+                "lease_owner": None,
+                "lease_until": datetime.min,
+                "created_at": now
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass
+    record = db.migrations.find_one_and_update(
+        {"_id": item.version, "status": {"$ne": APPLIED}, "lease_until": {"$lt": now}},
+        {"$set": {
+            "status": RUNNING,
+            "lease_owner": owner,
+            "lease_until": now + timedelta(seconds=settings.MIGRATION_LEASE_SECONDS),
+            "updated_at": now
+        }},
+        return_document=ReturnDocument.AFTER
+    )
+    if record:
+        return "acquired", record
+    current = db.migrations.find_one({"_id": item.version}, {"status": 1})
+    return ("applied" if current and current["status"] == APPLIED else "busy"), None
+
+
+def run_pending_migrations(db) -> int:
+    """Apply outstanding migrations in order; blocks while another process is running one"""
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    applied = 0
+    for version in sorted(_migrations):
+        item = _migrations[version]
+        while True:
+            state, record = _acquire(db, item, owner)
+            if state == "applied":
+                break
+            if state == "busy":
+                if _stopping.wait(settings.MIGRATION_LEASE_SECONDS / 4):
+                    raise MigrationInterrupted(version)
+                continue
+            logger.info("Running migration %d: %s", version, item.name)
+            started = time.perf_counter()
+            try:
+                item.run(MigrationContext(db, record, owner))
+            except MigrationInterrupted:
+                # Release the lease so the next process to start resumes straight away
+                db.migrations.update_one(
+                    {"_id": version, "lease_owner": owner},
+                    {"$set": {"lease_owner": None, "lease_until": datetime.min}}
+                )
+                raise
+            db.migrations.update_one(
+                {"_id": version, "lease_owner": owner},
+                {"$set": {"status": APPLIED, "lease_owner": None, "applied_at": datetime.utcnow()}}
+            )
+            logger.info("Migration %d applied in %.1f s", version, time.perf_counter() - started)
+            applied += 1
+            break
+    return applied
+
+
+async def wait_for_migrations():
+    """For in-memory indexes that should be built from migrated records"""
+    await _applied.wait()
+
+
+async def run_migrations(db):
+    """
+    Lifespan task: apply pending migrations. The worker starts (and answers its
+    gunicorn heartbeat) straight away, while MigrationGateMiddleware holds API
+    requests off until every migration is applied.
+    """
+    global _started
+    _started = True
+    _stopping.clear()
+    while True:
+        try:
+            # cancellable: shutdown doesn't wait for the thread, which stops at its next checkpoint
+            await to_thread.run_sync(run_pending_migrations, db, cancellable=True)
+            _applied.set()
+            return
+        except asyncio.CancelledError:
+            _stopping.set()
+            raise
+        except MigrationInterrupted:
+            return
+        except LeaseLost as e:
+            logger.warning("Lost the lease on migration %s; retrying", e)
+        except Exception as e:
+            logger.exception("Migration failed: %s", e)
+        await asyncio.sleep(settings.MIGRATION_LEASE_SECONDS)
+
+
+def migrations_pending() -> bool:
+    return _started and not _applied.is_set()
+
+
+class MigrationGateMiddleware:
+    """
+    Answers API requests with 503 and Retry-After until this process has seen
+    every migration applied. Read paths rely on fields the backfills add
+    (readers, workspace_id), so records not reached yet would otherwise be
+    missing from listings or answer 404.
+    """
+
+    def __init__(self, app, prefix: str = "/api/"):
+        self.app = app
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not migrations_pending() or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        body = json.dumps({"detail": "Upgrading the database, please retry shortly"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(MIGRATING_RETRY_SECONDS).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+@migration(4, "index readers for sharing")
+def index_readers(ctx: MigrationContext):
+    """Empty grant lists and a readers array for records created before sharing"""
+    for collection in ("documents", "folders"):
+        backfill(
+            ctx,
+            collection,
+            {"_id": 1},
+            lambda record: None,
+            batch_updates=[
+                ({"shares": {"$exists": False}}, {"$set": {"shares": []}}),
+                ({"inherited_shares": {"$exists": False}}, {"$set": {"inherited_shares": []}}),
+                ({"readers": {"$exists": False}}, [READERS_STAGE]),
+            ]
+        )
+    ctx.db.documents.create_index([("readers", 1), ("updated_at", -1)])
+    ctx.db.folders.create_index([("readers", 1), ("name", 1)])
+
+
+def _drop_index(collection, name: str):
+    try:
+        collection.drop_index(name)
+    except OperationFailure:
+        pass
+
+
+@migration(5, "assign records to workspaces")
+def assign_workspaces(ctx: MigrationContext):
+    """
+    File existing documents and folders in their owner's personal workspace and
+    comments in their document's, then lead the per-workspace indexes with
+    workspace_id. Everyone a record is shared with joins its workspace as a
+    guest, as sharing does today; existing members keep their role.
+    """
+    ctx.db.workspaces.create_index(
+        "owner_id", unique=True, partialFilterExpression={"personal": True}
+    )
+    ctx.db.workspaces.create_index("members.user_id")
+
+    def owner_workspace(record):
+        workspace_id = record.get("workspace_id")
+        update = None
+        if workspace_id is None:
+            workspace_id = personal_workspace_id(ctx.db, str(record["owner_id"]))
+            update = {"$set": {"workspace_id": workspace_id}}
+        grantees = {share["user_id"] for share in record.get("shares") or []}
+        grantees.update(share["user_id"] for share in record.get("inherited_shares") or [])
+        grantees.discard(str(record["owner_id"]))
+        for user_id in grantees:
+            set_member(ctx.db, workspace_id, user_id, GUEST, keep_existing=True)
+        return update
+
+    projection = {"owner_id": 1, "workspace_id": 1, "shares.user_id": 1, "inherited_shares.user_id": 1}
+    for collection in ("documents", "folders"):
+        backfill(ctx, collection, projection, owner_workspace)
+
+    document_workspaces = {}
+
+    def comment_workspace(record):
+        if "workspace_id" in record:
+            return None
+        document_id = record.get("document_id")
+        if document_id not in document_workspaces:
+            document = ctx.db.documents.find_one({"_id": document_id}, {"workspace_id": 1})
+            document_workspaces[document_id] = document.get("workspace_id") if document else None
+        return {"$set": {"workspace_id": document_workspaces[document_id]}}
+
+    backfill(ctx, "comments", {"document_id": 1, "workspace_id": 1}, comment_workspace)
+
+    ctx.db.documents.create_index([("workspace_id", 1), ("readers", 1), ("updated_at", -1)])
+    ctx.db.documents.create_index([("workspace_id", 1), ("folder_id", 1)])
+    ctx.db.documents.create_index([("workspace_id", 1), ("view_count", -1)])
+    ctx.db.folders.create_index([("workspace_id", 1), ("readers", 1), ("name", 1)])
+    ctx.db.folders.create_index([("workspace_id", 1), ("parent_id", 1), ("name", 1)])
+    ctx.db.comments.create_index([("workspace_id", 1), ("document_id", 1), ("parent_id", 1), ("created_at", -1)])
+    # Requests without X-Workspace-Id list across workspaces; migration 4's readers-led indexes serve those
+    ctx.db.documents.create_index([("readers", 1), ("view_count", -1)])
+    # Superseded by the indexes above
+    _drop_index(ctx.db.documents, "view_count_-1")
+
+
+@migration(6, "index document versions")
+def index_document_versions(ctx: MigrationContext):
+    ctx.db.document_versions.create_index([("document_id", 1), ("version", -1)], unique=True)
+
+
+@migration(7, "index import keys")
+def index_import_keys(ctx: MigrationContext):
+    # Lets a retried import job recognise documents it inserted before it was interrupted
+    ctx.db.documents.create_index(
+        "import_key", unique=True, partialFilterExpression={"import_key": {"$exists": True}}
+    )
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import re
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+from anyio import to_thread
+
+from core.cache import PartitionedIndex
+from core.migrations import wait_for_migrations
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 128
+SHINGLE_SIZE = 5
+# 16 bands of 8 rows: pairs above ~0.7 Jaccard similarity almost always share a band
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_MASK_32 = np.uint64(0xFFFFFFFF)
+_SHINGLE_BASE = np.uint64(1_000_003)
+_CHUNK = 4096
+
+# Fixed seed: signatures are stored in MongoDB and must match across workers and restarts
+_rng = np.random.default_rng(0x5EED)
+_A = _rng.integers(1, int(_MERSENNE_PRIME), size=NUM_PERM, dtype=np.uint64)[:, None]
+_B = _rng.integers(0, int(_MERSENNE_PRIME), size=NUM_PERM, dtype=np.uint64)[:, None]
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_WORD_RE = re.compile(r"\w+")
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """Distinct 32-bit hashes of the overlapping word 5-grams of a text"""
+    words = _WORD_RE.findall(_TAG_RE.sub(" ", text).lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(w.encode()) for w in words), dtype=np.uint64, count=len(words))
+    if len(hashes) < SHINGLE_SIZE:
+        combined = np.uint64(0)
+        for h in hashes:
+            combined = (combined * _SHINGLE_BASE + h) & _MASK_32
+        return np.array([combined], dtype=np.uint64)
+    count = len(hashes) - SHINGLE_SIZE + 1
+    shingles = np.zeros(count, dtype=np.uint64)
+    for offset in range(SHINGLE_SIZE):
+        shingles = (shingles * _SHINGLE_BASE + hashes[offset : offset + count]) & _MASK_32
+    return np.unique(shingles)
+
+
+def signature(text: str) -> np.ndarray | None:
+    """MinHash signature of a text, or None when it has no words"""
+    shingles = shingle_hashes(text)
+    if not len(shingles):
+        return None
+    shingles %= _MERSENNE_PRIME
+    result = np.full(NUM_PERM, _MERSENNE_PRIME, dtype=np.uint64)
+    for start in range(0, len(shingles), _CHUNK):
+        chunk = shingles[None, start : start + _CHUNK]
+        np.minimum(result, ((_A * chunk + _B) % _MERSENNE_PRIME).min(axis=1), out=result)
+    return result.astype(np.uint32)
+
+
+def signature_bytes(text: str) -> bytes | None:
+    sig = signature(text)
+    return sig.tobytes() if sig is not None else None
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+class LSHIndex:
+    """Banded locality-sensitive hashing over MinHash signatures"""
+
+    def __init__(self):
+        self.signatures: dict[str, np.ndarray] = {}
+        self.buckets: list[dict[bytes, set[str]]] = [{} for _ in range(BANDS)]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    @staticmethod
+    def _band_keys(sig: np.ndarray) -> list[bytes]:
+        return [sig[band * ROWS : (band + 1) * ROWS].tobytes() for band in range(BANDS)]
+
+    def _discard(self, doc_id: str):
+        old = self.signatures.pop(doc_id, None)
+        if old is None:
+            return
+        for band, key in enumerate(self._band_keys(old)):
+            bucket = self.buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self.buckets[band][key]
+
+    def upsert(self, doc_id: str, sig: bytes | np.ndarray | None):
+        with self._lock:
+            self._discard(doc_id)
+            if sig is None:
+                return
+            if isinstance(sig, (bytes, bytearray)):
+                sig = np.frombuffer(sig, dtype=np.uint32)
+            self.signatures[doc_id] = sig
+            for band, key in enumerate(self._band_keys(sig)):
+                self.buckets[band].setdefault(key, set()).add(doc_id)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._discard(doc_id)
+
+    def duplicates(self, doc_id: str, threshold: float) -> list[tuple[str, float]]:
+        """Indexed documents whose estimated similarity to doc_id reaches threshold"""
+        with self._lock:
+            sig = self.signatures.get(doc_id)
+            if sig is None:
+                return []
+            candidates = set()
+            for band, key in enumerate(self._band_keys(sig)):
+                candidates |= self.buckets[band].get(key, set())
+            candidates.discard(doc_id)
+            scored = [(other, similarity(sig, self.signatures[other])) for other in candidates]
+        return sorted((hit for hit in scored if hit[1] >= threshold), key=lambda hit: hit[1], reverse=True)
+
+    def dedupe(self, doc_ids: list[str], threshold: float) -> list[str]:
+        """Keep the first of every group of near-duplicates, preserving order"""
+        kept: list[str] = []
+        kept_set: set[str] = set()
+        for doc_id in doc_ids:
+            if not any(other in kept_set for other, _ in self.duplicates(doc_id, threshold)):
+                kept.append(doc_id)
+                kept_set.add(doc_id)
+        return kept
+
+
+lsh_index: PartitionedIndex[LSHIndex] = PartitionedIndex(LSHIndex)
+
+
+def _load(db, since: datetime | None) -> int:
+    # Later passes also see documents trashed since, to drop them
+    query = {"updated_at": {"$gte": since}} if since else {"deleted_at": None}
+    count = 0
+    for document in db.documents.find(query, {"minhash": 1, "workspace_id": 1, "deleted_at": 1}):
+        doc_id = str(document["_id"])
+        if document.get("deleted_at"):
+            lsh_index.remove(doc_id)
+            continue
+        if "minhash" in document:
+            lsh_index.upsert(document.get("workspace_id"), doc_id, document["minhash"])
+        else:
+            # Documents written before signatures existed
+            source = db.documents.find_one({"_id": document["_id"]}, {"title": 1, "content": 1})
+            sig = signature_bytes(f"{source.get('title', '')}\n{source.get('content', '')}")
+            db.documents.update_one({"_id": document["_id"]}, {"$set": {"minhash": sig}})
+            lsh_index.upsert(document.get("workspace_id"), doc_id, sig)
+        count += 1
+    return count
+
+
+async def minhash_sync_loop(db):
+    """Load stored signatures once migrations are applied, then pick up writes made by other workers"""
+    await wait_for_migrations()
+    since = None
+    while True:
+        started = datetime.utcnow()
+        try:
+            count = await to_thread.run_sync(_load, db, since)
+            if since is None:
+                logger.info("LSH index built with %d documents", count)
+            since = started - timedelta(seconds=5)
+        except Exception as e:
+            logger.warning("LSH index sync failed: %s", e)
+        await asyncio.sleep(settings.INDEX_REFRESH_SECONDS)
@@ -0,0 +1,295 @@
+"""
+Sharing and access control. Every document and folder carries a denormalized
+`readers` array (owner, users it is shared with directly or through a parent
+folder, and "*" when public), so "what can this user see" is one query on a
+multikey index. `shares` holds the record's own grants and `inherited_shares`
+the merged grants of its folder chain; both are rewritten on share and move.
+"""
+from bson import ObjectId
+from fastapi import Depends, HTTPException, status
+
+from core.jwt import get_current_user
+from core.repositories import Repositories, get_repositories
+from core.workspaces import GUEST, Workspace, get_workspace
+from models.user import UserInDB
+
+VIEWER = "viewer"
+COMMENTER = "commenter"
+EDITOR = "editor"
+OWNER = "owner"
+ROLE_RANK = {VIEWER: 1, COMMENTER: 2, EDITOR: 3, OWNER: 4}
+SHAREABLE_ROLES = (VIEWER, COMMENTER, EDITOR)
+
+# Stands in for every user in `readers` of public documents
+PUBLIC = "*"
+
+ACCESS_FIELDS = {"owner_id": 1, "isPublic": 1, "shares": 1, "inherited_shares": 1}
+
+# The same rule as readers_of(), evaluated server-side for update_many pipelines
+_READERS_EXPR = {"$setUnion": [
+    [{"$toString": "$owner_id"}],
+    {"$ifNull": ["$shares.user_id", []]},
+    {"$ifNull": ["$inherited_shares.user_id", []]},
+    {"$cond": [{"$eq": ["$isPublic", True]}, [PUBLIC], []]},
+]}
+# Update-pipeline stage recomputing readers from the fields above
+READERS_STAGE = {"$set": {"readers": _READERS_EXPR}}
+
+
+def visible_filter(user_id: str, workspace_id: ObjectId | None = None) -> dict:
+    """Match documents or folders the user may open, within one workspace when given; never trashed ones"""
+    match = {"readers": {"$in": [user_id, PUBLIC]}, "deleted_at": None}
+    if workspace_id is not None:
+        match = {"workspace_id": workspace_id, **match}
+    return match
+
+
+def listing_filter(user_id: str, workspace: Workspace) -> dict:
+    """
+    visible_filter for lists and searches. A request naming its workspace sees
+    that workspace; one without X-Workspace-Id sees everything the user may
+    open anywhere (their own records, what was shared with them and public
+    documents), off the readers-led indexes.
+    """
+    return visible_filter(user_id, None if workspace.implicit else workspace.id)
+
+
+def merge_shares(*share_lists: list[dict]) -> list[dict]:
+    """Combine grants, keeping each user's highest role"""
+    roles: dict[str, str] = {}
+    for shares in share_lists:
+        for share in shares or []:
+            current = roles.get(share["user_id"])
+            if current is None or ROLE_RANK[share["role"]] > ROLE_RANK[current]:
+                roles[share["user_id"]] = share["role"]
+    return [{"user_id": user_id, "role": role} for user_id, role in sorted(roles.items())]
+
+
+def readers_of(record: dict) -> list[str]:
+    readers = {str(record["owner_id"])}
+    readers.update(share["user_id"] for share in record.get("shares") or [])
+    readers.update(share["user_id"] for share in record.get("inherited_shares") or [])
+    if record.get("isPublic"):
+        readers.add(PUBLIC)
+    return sorted(readers)
+
+
+def role_of(record: dict, user_id: str) -> str | None:
+    """The user's effective role on a document or folder, None if they can't see it"""
+    if str(record.get("owner_id")) == str(user_id):
+        return OWNER
+    role = None
+    for share in merge_shares(record.get("shares"), record.get("inherited_shares")):
+        if share["user_id"] == str(user_id):
+            role = share["role"]
+    if record.get("isPublic") and role is None:
+        role = VIEWER
+    return role
+
+
+def inherited_shares(db, folder_id: ObjectId | None) -> list[dict]:
+    """Grants a record placed in folder_id inherits"""
+    if folder_id is None:
+        return []
+    folder = db.folders.find_one({"_id": folder_id}, {"shares": 1, "inherited_shares": 1})
+    if not folder:
+        return []
+    return merge_shares(folder.get("inherited_shares"), folder.get("shares"))
+
+
+def access_fields(db, owner_id: str, folder_id: ObjectId | None, is_public: bool = False) -> dict:
+    """Sharing fields for a new document or folder"""
+    record = {
+        "owner_id": owner_id,
+        "isPublic": is_public,
+        "shares": [],
+        "inherited_shares": inherited_shares(db, folder_id)
+    }
+    return {
+        "shares": record["shares"],
+        "inherited_shares": record["inherited_shares"],
+        "readers": readers_of(record)
+    }
+
+
+def refresh_readers(collection, match: dict, inherited: list[dict] | None = None):
+    """Recompute readers (and optionally replace inherited_shares) for every matching record"""
+    stages = []
+    if inherited is not None:
+        stages.append({"$set": {"inherited_shares": {"$literal": inherited}}})
+    stages.append(READERS_STAGE)
+    collection.update_many(match, stages)
+
+
+def propagate_folder(db, folder_id: ObjectId):
+    """
+    Push a folder's effective grants down to its documents and subfolders,
+    one update_many per folder level rather than per record.
+    """
+    seen = set()
+    frontier = [folder_id]
+    while frontier:
+        folders = list(db.folders.find(
+            {"_id": {"$in": frontier}}, {"shares": 1, "inherited_shares": 1}
+        ))
+        frontier = []
+        for folder in folders:
+            if folder["_id"] in seen:
+                continue
+            seen.add(folder["_id"])
+            grants = merge_shares(folder.get("inherited_shares"), folder.get("shares"))
+            refresh_readers(db.documents, {"folder_id": folder["_id"]}, grants)
+            refresh_readers(db.folders, {"parent_id": folder["_id"]}, grants)
+            frontier.extend(child["_id"] for child in db.folders.find({"parent_id": folder["_id"]}, {"_id": 1}))
+
+
+def move_record(db, collection: str, record_id: ObjectId, folder_id: ObjectId | None):
+    """Re-derive inherited grants after a document or folder changes parent"""
+    refresh_readers(db[collection], {"_id": record_id}, inherited_shares(db, folder_id))
+    if collection == "folders":
+        propagate_folder(db, record_id)
+
+
+def set_share(db, collection: str, record_id: ObjectId, user_id: str, role: str | None):
+    """Grant (or with role=None revoke) a user's access, then refresh the visibility index"""
+    db[collection].update_one({"_id": record_id}, {"$pull": {"shares": {"user_id": user_id}}})
+    if role is not None:
+        db[collection].update_one({"_id": record_id}, {"$push": {"shares": {"user_id": user_id, "role": role}}})
+    refresh_readers(db[collection], {"_id": record_id})
+    if collection == "folders":
+        propagate_folder(db, record_id)
+
+
+def resolve_share_user(db, user_id: str | None, email: str | None) -> str:
+    """Id of the user a share names, by id or by email"""
+    query = None
+    if user_id:
+        try:
+            query = {"_id": ObjectId(user_id)}
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid user ID format"
+            )
+    elif email:
+        query = {"email": email}
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Give a user_id or an email"
+        )
+    user = db.users.find_one(query, {"_id": 1})
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return str(user["_id"])
+
+
+def describe_shares(db, record: dict) -> list[dict]:
+    """A record's own and inherited grants with each grantee's email and name, for display"""
+    own = record.get("shares") or []
+    granted = {share["user_id"] for share in own}
+    shares = [{**share, "inherited": False} for share in own] + [
+        {**share, "inherited": True} for share in record.get("inherited_shares") or [] if share["user_id"] not in granted
+    ]
+    users = {
+        str(user["_id"]): user
+        for user in db.users.find(
+            {"_id": {"$in": [ObjectId(share["user_id"]) for share in shares]}}, {"email": 1, "full_name": 1}
+        )
+    }
+    return [
+        {
+            **share,
+            "email": users.get(share["user_id"], {}).get("email"),
+            "full_name": users.get(share["user_id"], {}).get("full_name")
+        }
+        for share in shares
+    ]
+
+
+class Access:
+    """
+    Permission checks for one request. Records are fetched once and reused, so
+    a handler checking the same document several times hits the database once.
+    Only records in the request's workspace are found at all, except that a
+    request naming no workspace may open one record shared with the user (or
+    public) from another workspace by id; it then works in that workspace, as
+    a guest.
+    """
+
+    def __init__(self, repos: Repositories, user: UserInDB, workspace: Workspace):
+        self.repos = repos
+        self.user = user
+        self.workspace = workspace
+        self._records: dict[tuple[str, ObjectId], dict | None] = {}
+        # Keys loaded with every field
+        self._complete: set[tuple[str, ObjectId]] = set()
+        self._found = False
+
+    def _load(self, collection: str, record_id: ObjectId, fields: tuple | None) -> dict | None:
+        key = (collection, record_id)
+        record = self._records.get(key)
+        if key in self._records:
+            if record is None or key in self._complete:
+                return record
+            if fields is not None and all(field in record for field in fields):
+                return record
+        projection = None if fields is None else {**ACCESS_FIELDS, "workspace_id": 1, **{field: 1 for field in fields}}
+        match = {"_id": record_id, "workspace_id": self.workspace.id, "deleted_at": None}
+        loaded = self.repos[collection].find_one(match, projection)
+        if loaded is None and self.workspace.implicit and not self._found:
+            # A shared link or public document opened without X-Workspace-Id: find it
+            # wherever it lives, if this user may see it, and work in its workspace
+            match = {"_id": record_id, "deleted_at": None, "readers": {"$in": [self.user.id, PUBLIC]}}
+            loaded = self.repos[collection].find_one(match, projection)
+            if loaded is not None and loaded.get("workspace_id") != self.workspace.id:
+                self.workspace = Workspace(loaded["workspace_id"], GUEST)
+        if loaded is not None:
+            # Later records must come from the same workspace as this one
+            self._found = True
+        if fields is None:
+            self._complete.add(key)
+        elif loaded is not None and record:
+            loaded = {**record, **loaded}
+        self._records[key] = loaded
+        return loaded
+
+    def role(self, collection: str, record_id: ObjectId) -> str | None:
+        record = self._load(collection, record_id, ())
+        return role_of(record, self.user.id) if record else None
+
+    def require(self, collection: str, record_id: ObjectId, role: str, fields: tuple | None = ()) -> dict:
+        """
+        The record with the requested fields (fields=None for all of them), or
+        404/403 if it is missing or the user's role is too low.
+        """
+        record = self._load(collection, record_id, fields)
+        if not record:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found" if collection == "documents" else "Folder not found"
+            )
+        current = role_of(record, self.user.id)
+        if current is None or ROLE_RANK[current] < ROLE_RANK[role]:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied"
+            )
+        return record
+
+    def forget(self, collection: str, record_id: ObjectId):
+        """Drop a cached record after the handler changed it"""
+        self._records.pop((collection, record_id), None)
+        self._complete.discard((collection, record_id))
+
+
+def get_access(
+    current_user: UserInDB = Depends(get_current_user),
+    workspace: Workspace = Depends(get_workspace),
+    repos: Repositories = Depends(get_repositories)
+) -> Access:
+    """Per-request permission checker; FastAPI caches it for the request's lifetime"""
+    return Access(repos, current_user, workspace)
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from anyio import to_thread
+from pymongo import UpdateOne
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Heartbeats without a document keep the user online site-wide only
+GLOBAL = ""
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class PresenceTracker:
+    """
+    Who is online, overall and per document. Each (user, document) session
+    sits in one slot of a hashed timing wheel keyed by its expiry tick, so a
+    heartbeat is a move between two sets and each tick expires exactly the
+    sessions in the slot it passes: O(expired), with no scan and no heap.
+    Counts are maintained as sessions come and go, so lookups never iterate.
+    """
+
+    def __init__(self, ttl_seconds: float, tick_seconds: float):
+        self.tick_seconds = tick_seconds
+        self._slots: list[set[tuple[str, str]]] = [set() for _ in range(math.ceil(ttl_seconds / tick_seconds) + 2)]
+        self._deadlines: dict[tuple[str, str], int] = {}
+        self._documents: dict[str, set[str]] = {}
+        self._sessions_per_user: dict[str, int] = {}
+        self._cursor = int(time.time() / tick_seconds)
+        self._lock = threading.Lock()
+
+    def _add(self, key: tuple[str, str]):
+        user_id, document_id = key
+        self._sessions_per_user[user_id] = self._sessions_per_user.get(user_id, 0) + 1
+        if document_id != GLOBAL:
+            self._documents.setdefault(document_id, set()).add(user_id)
+
+    def _drop(self, key: tuple[str, str]):
+        user_id, document_id = key
+        del self._deadlines[key]
+        remaining = self._sessions_per_user[user_id] - 1
+        if remaining:
+            self._sessions_per_user[user_id] = remaining
+        else:
+            del self._sessions_per_user[user_id]
+        if document_id != GLOBAL:
+            users = self._documents[document_id]
+            users.discard(user_id)
+            if not users:
+                del self._documents[document_id]
+
+    def touch(self, user_id: str, document_id: str, expires_at: float):
+        """Keep a session alive until expires_at (epoch seconds); a past time ends it"""
+        key = (user_id, document_id)
+        deadline = math.ceil(expires_at / self.tick_seconds)
+        with self._lock:
+            previous = self._deadlines.get(key)
+            if previous is not None:
+                self._slots[previous % len(self._slots)].discard(key)
+            if deadline <= self._cursor:
+                if previous is not None:
+                    self._drop(key)
+                return
+            # Beyond the wheel's horizon the slot would be swept early; the next heartbeat extends it
+            deadline = min(deadline, self._cursor + len(self._slots) - 1)
+            if previous is None:
+                self._add(key)
+            self._deadlines[key] = deadline
+            self._slots[deadline % len(self._slots)].add(key)
+
+    def advance(self, now: float | None = None) -> int:
+        """Expire sessions whose tick has passed; returns how many ended"""
+        target = int((now or time.time()) / self.tick_seconds)
+        expired = 0
+        with self._lock:
+            # After a long stall every slot is due, but each only needs sweeping once
+            start = max(self._cursor, target - len(self._slots))
+            for tick in range(start + 1, target + 1):
+                slot = self._slots[tick % len(self._slots)]
+                for key in slot:
+                    self._drop(key)
+                expired += len(slot)
+                slot.clear()
+            self._cursor = max(self._cursor, target)
+        return expired
+
+    def online_count(self) -> int:
+        return len(self._sessions_per_user)
+
+    def is_online(self, user_id: str) -> bool:
+        return user_id in self._sessions_per_user
+
+    def statuses(self, user_ids) -> dict[str, str]:
+        """"online" or "offline" for each user id"""
+        online = self._sessions_per_user
+        return {user_id: "online" if user_id in online else "offline" for user_id in user_ids}
+
+    def document_users(self, document_id: str) -> list[str]:
+        with self._lock:
+            return sorted(self._documents.get(document_id, ()))
+
+    def document_counts(self, document_ids) -> dict[str, int]:
+        """Users currently on each document, for joining into listings"""
+        documents = self._documents
+        return {document_id: len(documents.get(document_id, ())) for document_id in document_ids}
+
+
+presence = PresenceTracker(settings.PRESENCE_TTL_SECONDS, settings.PRESENCE_TICK_SECONDS)
+
+
+class _Outbox:
+    """Sessions this worker saw since the last sync, last write wins"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[str, str], float] = {}
+
+    def put(self, key: tuple[str, str], expires_at: float):
+        with self._lock:
+            self._pending[key] = expires_at
+
+    def take(self) -> dict[tuple[str, str], float]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+
+_outbox = _Outbox()
+
+
+def heartbeat(user_id: str, document_id: str | None = None):
+    """Mark a user online (and on a document) for the next PRESENCE_TTL_SECONDS"""
+    expires_at = time.time() + settings.PRESENCE_TTL_SECONDS
+    for key in {(user_id, GLOBAL), (user_id, document_id or GLOBAL)}:
+        presence.touch(*key, expires_at)
+        _outbox.put(key, expires_at)
+
+
+def leave(user_id: str, document_id: str):
+    """End a user's session on a document straight away instead of waiting for it to expire"""
+    presence.touch(user_id, document_id, 0)
+    _outbox.put((user_id, document_id), 0)
+
+
+def _session_id(key: tuple[str, str]) -> str:
+    return f"{key[0]}:{key[1]}"
+
+
+def sync_presence(db, since: datetime | None) -> datetime:
+    """
+    Share sessions with the other workers: publish ours in one bulk_write, then
+    replay theirs that changed since the last sync. Rows expire through a TTL
+    index, so a crashed worker's sessions disappear on their own.
+    """
+    now = datetime.utcnow()
+    # A session that ended is written with a past expiry so other workers drop it too
+    operations = [
+        UpdateOne(
+            {"_id": _session_id(key)},
+            {"$set": {
+                "user_id": key[0],
+                "document_id": key[1],
+                "expires_at": datetime.utcfromtimestamp(expires_at) if expires_at else now,
+                "worker": WORKER_ID,
+                "updated_at": now
+            }},
+            upsert=True
+        )
+        for key, expires_at in _outbox.take().items()
+    ]
+    if operations:
+        db.presence.bulk_write(operations, ordered=False)
+
+    query = {"worker": {"$ne": WORKER_ID}}
+    if since is not None:
+        query["updated_at"] = {"$gte": since}
+    for row in db.presence.find(query, {"user_id": 1, "document_id": 1, "expires_at": 1}):
+        presence.touch(row["user_id"], row["document_id"], (row["expires_at"] - datetime(1970, 1, 1)).total_seconds())
+    presence.advance()
+    # Overlap windows slightly so rows written during this pass aren't missed
+    return now - timedelta(seconds=settings.PRESENCE_SYNC_SECONDS)
+
+
+def ensure_presence_index(db):
+    db.presence.create_index("expires_at", expireAfterSeconds=0)
+
+
+async def presence_loop(db):
+    """Expire sessions every tick and exchange them with the other workers every PRESENCE_SYNC_SECONDS"""
+    try:
+        await to_thread.run_sync(ensure_presence_index, db)
+    except Exception as e:
+        logger.warning("Could not create presence index: %s", e)
+    since = None
+    last_sync = 0.0
+    while True:
+        await asyncio.sleep(settings.PRESENCE_TICK_SECONDS)
+        presence.advance()
+        if time.monotonic() - last_sync < settings.PRESENCE_SYNC_SECONDS:
+            continue
+        last_sync = time.monotonic()
+        try:
+            since = await to_thread.run_sync(sync_presence, db, since)
+        except Exception as e:
+            logger.warning("Presence sync failed: %s", e)
@@ -0,0 +1,174 @@
+import json
+import logging
+import random
+import sys
+import threading
+from collections import Counter
+from typing import Any
+
+from core.settings import settings
+
+slow_logger = logging.getLogger("collabradoc.slow")
+
+# Sub-documents of a command that describe what is being matched, per command name
+_FILTER_KEYS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "aggregate": "pipeline",
+    "update": "updates",
+    "delete": "deletes",
+}
+
+MAX_RECORDED_COMMANDS = 200
+
+
+def command_filter(command_name: str, command: dict) -> Any:
+    """Return a reference to the filter part of a command without copying it"""
+    key = _FILTER_KEYS.get(command_name)
+    if key is None:
+        return None
+    value = command.get(key)
+    if command_name in ("update", "delete") and value:
+        return [stmt.get("q") for stmt in value[:1]]
+    return value
+
+
+def redact_shape(value: Any, depth: int = 0) -> Any:
+    """Keep the keys and operators of a filter, replacing every value with '?'"""
+    if depth > 8:
+        return "…"
+    if isinstance(value, dict):
+        return {key: redact_shape(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return []
+        shapes = [redact_shape(item, depth + 1) for item in value[:3]]
+        if all(shape == "?" for shape in shapes):
+            return ["?"]
+        return shapes
+    return "?"
+
+
+# Name anyio gives the threads that run sync endpoints, dependencies and run_sync work
+WORKER_THREAD_NAME = "AnyIO worker thread"
+# Frames of a worker waiting for its next job rather than running one
+_IDLE_FILES = ("threading.py", "queue.py")
+
+
+class StackSampler:
+    """Statistical profiler sampling the stacks of a set of threads and of busy threadpool workers"""
+
+    def __init__(self, interval: float, threads: set):
+        self.interval = interval
+        self.threads = threads
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> list:
+        self._stop.set()
+        self._thread.join()
+        total = sum(self.samples.values())
+        return [
+            {"stack": stack, "samples": count, "share": round(count / total, 3)}
+            for stack, count in self.samples.most_common(settings.PROFILE_TOP_STACKS)
+        ]
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            threads = set(self.threads)
+            # Every busy worker, so sync handlers and run_sync work are sampled before their
+            # first MongoDB command; other requests' pool work may show up alongside
+            workers = {
+                thread.ident for thread in threading.enumerate()
+                if thread.name == WORKER_THREAD_NAME
+            }
+            for thread_id in threads | workers:
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own_id:
+                    continue
+                if thread_id not in threads and _idle(frame):
+                    continue
+                self.samples[_collapse(frame)] += 1
+
+
+def _idle(frame) -> bool:
+    """Whether a worker thread is blocked waiting for a job, i.e. runs no code of ours"""
+    while frame is not None and frame.f_code.co_filename.endswith(_IDLE_FILES):
+        frame = frame.f_back
+    return frame is None or (frame.f_code.co_name == "run" and "anyio" in frame.f_code.co_filename)
+
+
+def _collapse(frame) -> str:
+    parts = []
+    while frame is not None and len(parts) < 64:
+        code = frame.f_code
+        parts.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+def should_profile(scope) -> bool:
+    """Profile when the request carries the profiling token or is picked by sampling"""
+    if settings.PROFILE_TOKEN:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-profile" and value.decode("latin-1") == settings.PROFILE_TOKEN:
+                return True
+    return settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE
+
+
+def start_profile(metrics) -> StackSampler:
+    metrics.threads = {threading.get_ident()}
+    sampler = StackSampler(settings.PROFILE_INTERVAL_MS / 1000, metrics.threads)
+    sampler.start()
+    return sampler
+
+
+def _command_entries(commands: list) -> list:
+    return [
+        {
+            "command": name,
+            "collection": collection,
+            "duration_ms": round(duration * 1000, 2),
+            "shape": redact_shape(filter_ref),
+        }
+        for name, collection, duration, filter_ref in commands
+    ]
+
+
+def log_slow_query(name: str, collection: str, duration: float, filter_ref: Any):
+    """Log a single command that exceeded SLOW_QUERY_MS"""
+    slow_logger.warning(json.dumps({
+        "event": "slow_query",
+        **_command_entries([(name, collection, duration, filter_ref)])[0],
+    }, default=str))
+
+
+def log_request(scope, metrics, total: float, status_code: int, route: str, profile: list | None):
+    """Log a request that was slow or explicitly profiled"""
+    if total * 1000 < settings.SLOW_REQUEST_MS and profile is None:
+        return
+    entry = {
+        "event": "slow_request" if total * 1000 >= settings.SLOW_REQUEST_MS else "profiled_request",
+        "method": scope["method"],
+        "route": route,
+        "status": status_code,
+        "total_ms": round(total * 1000, 2),
+        "db_ms": round(metrics.db_time * 1000, 2),
+        "db_commands": metrics.db_count,
+        "auth_ms": round(metrics.deps_time * 1000, 2),
+        "serialize_ms": round(metrics.serialize_time * 1000, 2),
+        "commands": _command_entries(metrics.commands),
+    }
+    if metrics.db_count > len(metrics.commands):
+        entry["commands_truncated"] = metrics.db_count - len(metrics.commands)
+    if profile is not None:
+        entry["profile"] = profile
+    slow_logger.warning(json.dumps(entry, default=str))
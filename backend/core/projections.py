@@ -0,0 +1,73 @@
+"""
+Server-side projections shaping stored records into response models, so read
+paths don't fix up ids and timestamps in Python row by row.
+"""
+
+# Records written before migration 1 may lack these fields; the fallbacks keep them readable
+# while the backfill is still running
+_CREATED_AT = {"$ifNull": ["$created_at", {"$toDate": "$_id"}]}
+
+DOCUMENT_OUT = {
+    "_id": 0,
+    "id": {"$toString": "$_id"},
+    "title": 1,
+    "content": {"$ifNull": ["$content", ""]},
+    "folder_id": {"$toString": "$folder_id"},
+    "isPublic": {"$ifNull": ["$isPublic", False]},
+    "owner_id": {"$toString": "$owner_id"},
+    "created_at": _CREATED_AT,
+    "updated_at": {"$ifNull": ["$updated_at", _CREATED_AT]},
+    "version": {"$ifNull": ["$blocks_version", 0]},
+    # Set while block edits are waiting to be folded back into content
+    "content_stale": {"$ifNull": ["$content_stale", False]},
+}
+
+# Listing rows: the stored summary instead of the body, so content never leaves the server
+DOCUMENT_SUMMARY = {
+    "_id": 0,
+    "id": {"$toString": "$_id"},
+    "title": 1,
+    "excerpt": {"$ifNull": ["$excerpt", ""]},
+    "word_count": {"$ifNull": ["$word_count", 0]},
+    "char_count": {"$ifNull": ["$char_count", 0]},
+    "reading_minutes": {"$ifNull": ["$reading_minutes", 0]},
+    "folder_id": {"$toString": "$folder_id"},
+    "isPublic": {"$ifNull": ["$isPublic", False]},
+    "owner_id": {"$toString": "$owner_id"},
+    "last_edited_by": {"$toString": {"$ifNull": ["$last_edited_by", "$owner_id"]}},
+    "created_at": _CREATED_AT,
+    "updated_at": {"$ifNull": ["$updated_at", _CREATED_AT]},
+}
+
+TRASH_SUMMARY = {
+    **DOCUMENT_SUMMARY,
+    "deleted_at": 1,
+}
+
+ACTIVITY_SUMMARY = {
+    **DOCUMENT_SUMMARY,
+    "view_count": {"$ifNull": ["$view_count", 0]},
+    "edit_count": {"$ifNull": ["$edit_count", 0]},
+    "last_viewed_at": 1,
+}
+
+FOLDER_OUT = {
+    "_id": 0,
+    "id": {"$toString": "$_id"},
+    "name": 1,
+    "parent_id": {"$toString": "$parent_id"},
+    "owner_id": {"$toString": "$owner_id"},
+    "created_at": _CREATED_AT,
+    "updated_at": {"$ifNull": ["$updated_at", _CREATED_AT]},
+}
+
+
+def find_projected(collection, match: dict, projection: dict, sort: list | None = None, limit: int | None = None) -> list[dict]:
+    """Run match -> sort -> limit -> project as one aggregation"""
+    pipeline = [{"$match": match}]
+    if sort:
+        pipeline.append({"$sort": dict(sort)})
+    if limit:
+        pipeline.append({"$limit": limit})
+    pipeline.append({"$project": projection})
+    return list(collection.aggregate(pipeline))
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from anyio import to_thread
+from pymongo import ReturnDocument
+
+from core.cache import PartitionedLRU
+from core.settings import settings
+from core.jwt import decode_access_token
+from core.metrics import registry
+from core.database import get_client, pool_stats
+
+RATE_LIMITED_TOTAL = registry.counter(
+    "collabradoc_rate_limited_total", "Requests rejected by the rate limiter", ("rule",)
+)
+SHED_TOTAL = registry.counter(
+    "collabradoc_shed_total", "Requests shed by admission control", ("reason",)
+)
+
+# Paths that are never limited: health checks, scraping and CORS preflights
+EXEMPT_PATHS = {"/", "/metrics"}
+
+# Left to their own rules only: anonymous reads of cached public snapshots would otherwise
+# share the catch-all's per-IP bucket, which behind a proxy is one bucket for everyone
+DEFAULT_RULE_EXEMPT_PREFIXES = ("/api/public/",)
+
+# Rule key is "METHOD /path/template"; value is "<requests>/<s|m|h>"
+DEFAULT_RATE_LIMITS = {
+    "POST /api/auth/login": "10/m",
+    "POST /api/auth/signup": "5/m",
+    "PUT /api/documents/{document_id}": "120/m",
+    "GET /api/documents/search": "60/m",
+}
+
+_PERIODS = {"s": 1, "m": 60, "h": 3600}
+
+# RATE_LIMIT_DEFAULT's rule, matching every route without a rule of its own
+DEFAULT_RULE = "* *"
+
+
+def parse_rate(rate: str) -> tuple[float, float]:
+    """Parse "30/m" into (bucket capacity, tokens refilled per second)"""
+    count, _, period = rate.partition("/")
+    capacity = float(count)
+    seconds = _PERIODS.get(period.strip() or "s")
+    if seconds is None or capacity <= 0:
+        raise ValueError(f"Invalid rate limit {rate!r}")
+    return capacity, capacity / seconds
+
+
+def _template_pattern(template: str) -> re.Pattern:
+    """Compile "/api/documents/{document_id}" into a regex matching concrete paths"""
+    if template == "*":
+        return re.compile(".*")
+    parts = re.split(r"(\{[^/]+?\})", template)
+    return re.compile("^" + "".join("[^/]+" if p.startswith("{") else re.escape(p) for p in parts) + "/?$")
+
+
+class RateLimitRule:
+    def __init__(self, key: str, rate: str):
+        method, _, template = key.partition(" ")
+        self.name = key
+        self.method = method.upper()
+        self.pattern = _template_pattern(template)
+        self.capacity, self.refill_rate = parse_rate(rate)
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.method == "*" or self.method == method) and self.pattern.match(path) is not None
+
+
+def load_rules() -> list[RateLimitRule]:
+    configured = dict(DEFAULT_RATE_LIMITS)
+    if settings.RATE_LIMITS:
+        configured.update(json.loads(settings.RATE_LIMITS))
+    rules = [RateLimitRule(key, rate) for key, rate in configured.items() if rate]
+    if settings.RATE_LIMIT_DEFAULT:
+        rules.append(RateLimitRule(DEFAULT_RULE, settings.RATE_LIMIT_DEFAULT))
+    return rules
+
+
+class RateLimitBackend:
+    """Token-bucket storage; acquire() returns 0 when allowed, else seconds to wait"""
+    blocking = False
+
+    def acquire(self, key: str, capacity: float, refill_rate: float) -> float:
+        raise NotImplementedError
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    Per-process buckets, bounded by LRU eviction; also the local stand-in for the
+    shared backend. Each rule (the key up to "|") evicts only its own buckets, so
+    a flood of anonymous logins can't push out the workspace buckets.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets = PartitionedLRU(max_keys)
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, capacity: float, refill_rate: float) -> float:
+        now = time.monotonic()
+        partition = key.partition("|")[0]
+        with self._lock:
+            bucket = self._buckets.get(partition, key)
+            if bucket is None:
+                bucket = [capacity, now]
+                self._buckets.put(partition, key, bucket)
+            else:
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill_rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / refill_rate
+
+
+class MongoRateLimitBackend(RateLimitBackend):
+    """Buckets shared by every worker, updated atomically with a single pipeline update"""
+    blocking = True
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def acquire(self, key: str, capacity: float, refill_rate: float) -> float:
+        now = time.time()
+        refilled = {"$min": [
+            capacity,
+            {"$add": [
+                {"$ifNull": ["$tokens", capacity]},
+                {"$multiply": [{"$subtract": [now, {"$ifNull": ["$ts", now]}]}, refill_rate]},
+            ]},
+        ]}
+        bucket = self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "ts": now}},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", 1]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": datetime.utcnow() + timedelta(seconds=capacity / refill_rate),
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket["allowed"]:
+            return 0.0
+        return (1 - bucket["tokens"]) / refill_rate
+
+
+def create_backend() -> RateLimitBackend:
+    if settings.RATE_LIMIT_BACKEND == "mongo":
+        return MongoRateLimitBackend(get_client()["CollabraDoc"].rate_limits)
+    return InMemoryRateLimitBackend()
+
+
+def request_header(scope, name: bytes) -> str | None:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_identity(scope) -> str:
+    """The token's subject when a valid bearer token is sent, otherwise the client IP"""
+    authorization = request_header(scope, b"authorization")
+    if authorization and authorization[:7].lower() == "bearer ":
+        subject = decode_access_token(authorization[7:]).get("sub")
+        if subject:
+            return f"user:{subject}"
+    if settings.RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request_header(scope, b"x-forwarded-for")
+        if forwarded:
+            return f"ip:{forwarded.split(',')[0].strip()}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+async def _reject(send, status_code: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, int(retry_after + 0.999))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _is_exempt(scope) -> bool:
+    return scope["method"] == "OPTIONS" or scope["path"] in EXEMPT_PATHS
+
+
+class RateLimitMiddleware:
+    """Per-route token buckets keyed on the JWT subject, or the client IP when anonymous"""
+
+    def __init__(self, app, backend: RateLimitBackend | None = None):
+        self.app = app
+        self.rules = load_rules()
+        self.backend = backend
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED or _is_exempt(scope):
+            await self.app(scope, receive, send)
+            return
+
+        rule = next((r for r in self.rules if r.matches(scope["method"], scope["path"])), None)
+        if rule is not None and rule.name == DEFAULT_RULE and scope["path"].startswith(DEFAULT_RULE_EXEMPT_PREFIXES):
+            rule = None
+        if rule is not None:
+            if self.backend is None:
+                self.backend = create_backend()
+            key = f"{rule.name}|{client_identity(scope)}"
+            if self.backend.blocking:
+                retry_after = await to_thread.run_sync(self.backend.acquire, key, rule.capacity, rule.refill_rate)
+            else:
+                retry_after = self.backend.acquire(key, rule.capacity, rule.refill_rate)
+            if retry_after > 0:
+                RATE_LIMITED_TOTAL.inc(rule.name)
+                await _reject(send, 429, "Too many requests", retry_after)
+                return
+
+        await self.app(scope, receive, send)
+
+
+class AdmissionControlMiddleware:
+    """Caps in-flight requests per worker and sheds load once the Mongo pool is backed up"""
+    in_flight = 0
+
+    def __init__(self, app):
+        self.app = app
+        self._slots: asyncio.Semaphore | None = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _is_exempt(scope):
+            await self.app(scope, receive, send)
+            return
+
+        if settings.ADMISSION_MAX_DB_WAITERS and pool_stats.waiting >= settings.ADMISSION_MAX_DB_WAITERS:
+            SHED_TOTAL.inc("db_pool")
+            await _reject(send, 503, "Server is busy, please retry", 1)
+            return
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(settings.MAX_CONCURRENT_REQUESTS)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), settings.ADMISSION_QUEUE_TIMEOUT_MS / 1000)
+        except asyncio.TimeoutError:
+            SHED_TOTAL.inc("concurrency")
+            await _reject(send, 503, "Server is busy, please retry", 1)
+            return
+
+        AdmissionControlMiddleware.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            AdmissionControlMiddleware.in_flight -= 1
+            self._slots.release()
+
+
+registry.gauge(
+    "collabradoc_requests_in_flight", "Requests currently being served",
+    lambda: AdmissionControlMiddleware.in_flight,
+)
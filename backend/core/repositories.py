@@ -0,0 +1,447 @@
+"""
+Repository layer over the documents, folders, comments and users collections,
+used by the user, auth, comment and presence routes and by permission checks.
+Callers use a small Mongo-flavoured interface (find_one, find, insert,
+update_one, update_many, delete_many, count), and every operation is timed
+here, so caching, batching and instrumentation have one place to live.
+
+Storage is MongoDB. The in-memory engine with secondary indexes is a test
+and benchmark fixture, swapped in with memory_repositories() and a
+dependency override; it is not a storage backend, since document and folder
+routes work on the raw collections.
+
+The in-memory engine understands the query shapes the repository callers use:
+equality (including array membership), $in, $nin, $ne, $exists, $gt/$gte/
+$lt/$lte, $or and $and, dotted paths, inclusion or exclusion projections,
+multi-key sorts and $set/$unset/$inc/$push/$pull updates. Aggregations and
+update pipelines stay on the raw collections.
+"""
+import copy
+import threading
+import time
+from dataclasses import dataclass
+
+from bson import ObjectId
+from fastapi import Depends
+from pymongo.errors import DuplicateKeyError
+
+from core.database import get_db, get_read_db
+from core.metrics import LATENCY_BUCKETS, registry
+
+REPOSITORY_NAMES = ("documents", "folders", "comments", "users")
+
+# Secondary indexes of the in-memory engine: field -> unique
+MEMORY_INDEXES = {
+    "documents": {"workspace_id": False, "folder_id": False, "owner_id": False},
+    "folders": {"workspace_id": False, "parent_id": False},
+    "comments": {"document_id": False, "parent_id": False},
+    "users": {"email": True},
+}
+
+REPOSITORY_DURATION = registry.histogram(
+    "collabradoc_repository_operation_seconds", "Time spent in repository operations",
+    LATENCY_BUCKETS, ("repository", "operation")
+)
+
+
+class Repository:
+    """One collection's storage; methods mirror the PyMongo calls they replace"""
+    name: str
+
+    def find_one(self, match: dict, fields: dict | None = None) -> dict | None:
+        raise NotImplementedError
+
+    def find(self, match: dict, fields: dict | None = None, sort: list | None = None, limit: int | None = None) -> list[dict]:
+        raise NotImplementedError
+
+    def insert(self, record: dict) -> ObjectId:
+        raise NotImplementedError
+
+    def update_one(self, match: dict, changes: dict) -> int:
+        """Apply changes to the first match; returns how many records changed (0 or 1)"""
+        raise NotImplementedError
+
+    def update_many(self, match: dict, changes: dict) -> int:
+        raise NotImplementedError
+
+    def delete_many(self, match: dict) -> int:
+        raise NotImplementedError
+
+    def count(self, match: dict) -> int:
+        raise NotImplementedError
+
+
+def _timed(operation: str):
+    def decorate(method):
+        def timed(self, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                REPOSITORY_DURATION.observe(time.perf_counter() - started, self.name, operation)
+        timed.__name__ = method.__name__
+        timed.__doc__ = method.__doc__
+        return timed
+    return decorate
+
+
+class MongoRepository(Repository):
+    def __init__(self, collection):
+        self.name = collection.name
+        self.collection = collection
+
+    @_timed("find_one")
+    def find_one(self, match, fields=None):
+        return self.collection.find_one(match, fields)
+
+    @_timed("find")
+    def find(self, match, fields=None, sort=None, limit=None):
+        cursor = self.collection.find(match, fields)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+    @_timed("insert")
+    def insert(self, record):
+        return self.collection.insert_one(record).inserted_id
+
+    @_timed("update_one")
+    def update_one(self, match, changes):
+        return self.collection.update_one(match, changes).modified_count
+
+    @_timed("update_many")
+    def update_many(self, match, changes):
+        return self.collection.update_many(match, changes).modified_count
+
+    @_timed("delete_many")
+    def delete_many(self, match):
+        return self.collection.delete_many(match).deleted_count
+
+    @_timed("count")
+    def count(self, match):
+        return self.collection.count_documents(match)
+
+
+_MISSING = object()
+
+
+def _values(record, path: str) -> list:
+    """Every value at a dotted path, descending into arrays the way MongoDB does"""
+    current = [record]
+    for part in path.split("."):
+        found = []
+        for value in current:
+            if isinstance(value, dict):
+                if part in value:
+                    found.append(value[part])
+            elif isinstance(value, list):
+                found.extend(item[part] for item in value if isinstance(item, dict) and part in item)
+        current = found
+    flattened = []
+    for value in current:
+        if isinstance(value, list):
+            flattened.extend(value)
+        flattened.append(value)
+    return flattened
+
+
+def _equals(values: list, expected) -> bool:
+    if expected is None:
+        return not values or any(value is None for value in values)
+    return any(value == expected for value in values)
+
+
+def _compare(values: list, op, operand) -> bool:
+    for value in values:
+        try:
+            if value is not None and op(value, operand):
+                return True
+        except TypeError:
+            continue
+    return False
+
+
+_COMPARISONS = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+
+def _matches_condition(values: list, condition) -> bool:
+    if not isinstance(condition, dict) or not any(key.startswith("$") for key in condition):
+        return _equals(values, condition)
+    for op, operand in condition.items():
+        if op == "$in":
+            if not any(_equals(values, expected) for expected in operand):
+                return False
+        elif op == "$nin":
+            if any(_equals(values, expected) for expected in operand):
+                return False
+        elif op == "$ne":
+            if _equals(values, operand):
+                return False
+        elif op == "$exists":
+            if bool(values) != bool(operand):
+                return False
+        elif op in _COMPARISONS:
+            if not _compare(values, _COMPARISONS[op], operand):
+                return False
+        else:
+            raise NotImplementedError(f"{op} is not supported by the in-memory repository")
+    return True
+
+
+def matches(record: dict, match: dict) -> bool:
+    for key, condition in match.items():
+        if key == "$or":
+            if not any(matches(record, clause) for clause in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(record, clause) for clause in condition):
+                return False
+        elif not _matches_condition(_values(record, key), condition):
+            return False
+    return True
+
+
+def _project(record: dict, fields: dict | None) -> dict:
+    if not fields:
+        return copy.deepcopy(record)
+    include = {key for key, value in fields.items() if value and key != "_id"}
+    if include:
+        result = {"_id": record["_id"]} if fields.get("_id", 1) and "_id" in record else {}
+        result.update((key, copy.deepcopy(record[key])) for key in include if key in record)
+        return result
+    return {key: copy.deepcopy(value) for key, value in record.items() if fields.get(key, 1)}
+
+
+def _sort_key(value):
+    # MongoDB orders missing/null before everything else
+    return (0, 0) if value is _MISSING or value is None else (1, value)
+
+
+def _apply(record: dict, changes: dict):
+    for op, fields in changes.items():
+        for key, value in fields.items():
+            if op == "$set":
+                record[key] = copy.deepcopy(value)
+            elif op == "$unset":
+                record.pop(key, None)
+            elif op == "$inc":
+                record[key] = record.get(key, 0) + value
+            elif op == "$push":
+                record.setdefault(key, []).append(copy.deepcopy(value))
+            elif op == "$pull":
+                record[key] = [
+                    item for item in record.get(key, [])
+                    if not (matches(item, value) if isinstance(value, dict) else item == value)
+                ]
+            elif op == "$setOnInsert":
+                continue
+            else:
+                raise NotImplementedError(f"{op} is not supported by the in-memory repository")
+
+
+class SecondaryIndex:
+    """Value -> record ids for one field; array fields index every element, like a multikey index"""
+
+    def __init__(self, field: str, unique: bool = False):
+        self.field = field
+        self.unique = unique
+        self._ids: dict[object, set] = {}
+
+    def _keys(self, record: dict) -> set:
+        values = [value for value in _values(record, self.field) if not isinstance(value, (list, dict))]
+        return set(values) if values else {None}
+
+    def check(self, record: dict, record_id):
+        if not self.unique:
+            return
+        for key in self._keys(record):
+            if key is not None and self._ids.get(key, set()) - {record_id}:
+                raise DuplicateKeyError(f"Duplicate key for {self.field}: {key!r}")
+
+    def add(self, record: dict, record_id):
+        for key in self._keys(record):
+            self._ids.setdefault(key, set()).add(record_id)
+
+    def remove(self, record: dict, record_id):
+        for key in self._keys(record):
+            ids = self._ids.get(key)
+            if ids is not None:
+                ids.discard(record_id)
+                if not ids:
+                    del self._ids[key]
+
+    def lookup(self, condition) -> set | None:
+        """Candidate ids for a condition on this field, or None if the index can't narrow it"""
+        if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+            if "$in" not in condition:
+                return None
+            wanted = condition["$in"]
+        else:
+            wanted = [condition]
+        if any(isinstance(value, (list, dict)) for value in wanted):
+            return None
+        if len(wanted) == 1:
+            # The index's own set; callers only read it
+            return self._ids.get(wanted[0], set())
+        ids = set()
+        for value in wanted:
+            ids |= self._ids.get(value, set())
+        return ids
+
+
+class MemoryRepository(Repository):
+    """
+    Records in a dict keyed by _id plus hash indexes on the declared fields.
+    A query narrows its candidates with the most selective indexed equality or
+    $in condition (or _id) before filtering, so lookups by document, parent or
+    email touch only the matching records. Everything is copied in and out,
+    so callers can't mutate stored state.
+    """
+
+    def __init__(self, name: str, indexes: dict[str, bool] | None = None):
+        self.name = name
+        self._records: dict[object, dict] = {}
+        # Insertion sequence per id, so results come back in collection-scan order
+        self._sequence: dict[object, int] = {}
+        self._inserted = 0
+        self._indexes = [SecondaryIndex(field, unique) for field, unique in (indexes or {}).items()]
+        self._lock = threading.RLock()
+
+    def _candidates(self, match: dict):
+        best = None
+        if "_id" in match:
+            condition = match["_id"]
+            if isinstance(condition, dict) and "$in" in condition:
+                best = set(condition["$in"])
+            elif not isinstance(condition, dict):
+                best = {condition}
+        for index in self._indexes:
+            if index.field in match:
+                ids = index.lookup(match[index.field])
+                if ids is not None and (best is None or len(ids) < len(best)):
+                    best = ids
+        if best is None:
+            return list(self._records.values())
+        return sorted(
+            (self._records[record_id] for record_id in best if record_id in self._records),
+            key=lambda record: self._sequence[record["_id"]]
+        )
+
+    def _select(self, match: dict, sort: list | None = None, limit: int | None = None) -> list[dict]:
+        found = [record for record in self._candidates(match) if matches(record, match)]
+        if sort:
+            for field, direction in reversed(sort):
+                found.sort(
+                    key=lambda record: _sort_key(next(iter(_values(record, field)), _MISSING)),
+                    reverse=direction < 0
+                )
+        return found[:limit] if limit else found
+
+    def _replace(self, record_id, updated: dict):
+        previous = self._records[record_id]
+        for index in self._indexes:
+            index.check(updated, record_id)
+        for index in self._indexes:
+            index.remove(previous, record_id)
+            index.add(updated, record_id)
+        self._records[record_id] = updated
+
+    @_timed("find_one")
+    def find_one(self, match, fields=None):
+        with self._lock:
+            found = self._select(match, limit=1)
+            return _project(found[0], fields) if found else None
+
+    @_timed("find")
+    def find(self, match, fields=None, sort=None, limit=None):
+        with self._lock:
+            return [_project(record, fields) for record in self._select(match, sort, limit)]
+
+    @_timed("insert")
+    def insert(self, record):
+        with self._lock:
+            stored = copy.deepcopy(record)
+            stored.setdefault("_id", ObjectId())
+            if stored["_id"] in self._records:
+                raise DuplicateKeyError(f"Duplicate _id {stored['_id']!r}")
+            for index in self._indexes:
+                index.check(stored, stored["_id"])
+            for index in self._indexes:
+                index.add(stored, stored["_id"])
+            self._records[stored["_id"]] = stored
+            self._inserted += 1
+            self._sequence[stored["_id"]] = self._inserted
+            # PyMongo sets _id on the caller's dict too
+            record["_id"] = stored["_id"]
+            return stored["_id"]
+
+    def _update(self, match, changes, limit):
+        with self._lock:
+            changed = 0
+            for record in self._select(match, limit=limit):
+                updated = copy.deepcopy(record)
+                _apply(updated, changes)
+                if updated != record:
+                    self._replace(record["_id"], updated)
+                    changed += 1
+            return changed
+
+    @_timed("update_one")
+    def update_one(self, match, changes):
+        return self._update(match, changes, 1)
+
+    @_timed("update_many")
+    def update_many(self, match, changes):
+        return self._update(match, changes, None)
+
+    @_timed("delete_many")
+    def delete_many(self, match):
+        with self._lock:
+            found = self._select(match)
+            for record in found:
+                for index in self._indexes:
+                    index.remove(record, record["_id"])
+                del self._records[record["_id"]]
+                del self._sequence[record["_id"]]
+            return len(found)
+
+    @_timed("count")
+    def count(self, match):
+        with self._lock:
+            return len(self._select(match))
+
+
+@dataclass
+class Repositories:
+    documents: Repository
+    folders: Repository
+    comments: Repository
+    users: Repository
+
+    def __getitem__(self, name: str) -> Repository:
+        return getattr(self, name)
+
+
+def mongo_repositories(db) -> Repositories:
+    return Repositories(**{name: MongoRepository(db[name]) for name in REPOSITORY_NAMES})
+
+
+def memory_repositories() -> Repositories:
+    return Repositories(**{name: MemoryRepository(name, MEMORY_INDEXES[name]) for name in REPOSITORY_NAMES})
+
+
+def get_repositories(db = Depends(get_db("CollabraDoc"))) -> Repositories:
+    """Request dependency: repositories over MongoDB"""
+    return mongo_repositories(db)
+
+
+def get_read_repositories(db = Depends(get_read_db("CollabraDoc"))) -> Repositories:
+    """Like get_repositories, with Mongo reads routed by MONGO_LISTING_READ_PREFERENCE"""
+    return mongo_repositories(db)
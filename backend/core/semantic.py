@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import re
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+from anyio import to_thread
+
+from core.cache import PartitionedIndex
+from core.migrations import wait_for_migrations
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_TOKEN_RE = re.compile(r"[a-z0-9]{2,}")
+_STOPWORDS = frozenset(
+    "an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased word tokens with HTML tags and stopwords stripped"""
+    return [t for t in _TOKEN_RE.findall(_TAG_RE.sub(" ", text).lower()) if t not in _STOPWORDS]
+
+
+class SemanticIndex:
+    """
+    Hashed TF-IDF vectors for every document, one L2-normalized row per document
+    in a dense float32 matrix. Rows hold sublinear term frequencies; IDF weights
+    are applied to the query side so they stay current as documents come and go.
+    """
+
+    def __init__(self, dim: int, initial_capacity: int = 1024):
+        self.dim = dim
+        self.matrix = np.zeros((initial_capacity, dim), dtype=np.float32)
+        self.ids: list[str | None] = []
+        self.rows: dict[str, int] = {}
+        self.free_rows: list[int] = []
+        self.doc_freq = np.zeros(dim, dtype=np.float64)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def vectorize(self, text: str) -> np.ndarray:
+        """Signed feature hashing of log-scaled term counts, L2-normalized"""
+        tokens = tokenize(text)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if not tokens:
+            return vector
+        hashes = np.fromiter((zlib.crc32(t.encode()) for t in tokens), dtype=np.uint32, count=len(tokens))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+        counts = np.bincount(hashes % self.dim, weights=signs, minlength=self.dim)
+        vector[:] = np.sign(counts) * np.log1p(np.abs(counts))
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+    def idf(self) -> np.ndarray:
+        return (np.log((1 + len(self.rows)) / (1 + self.doc_freq)) + 1).astype(np.float32)
+
+    def _grow(self):
+        grown = np.zeros((self.matrix.shape[0] * 2, self.dim), dtype=np.float32)
+        grown[: self.matrix.shape[0]] = self.matrix
+        self.matrix = grown
+
+    def upsert(self, doc_id: str, text: str):
+        vector = self.vectorize(text)
+        with self._lock:
+            row = self.rows.get(doc_id)
+            if row is not None:
+                self.doc_freq -= self.matrix[row] != 0
+            else:
+                if self.free_rows:
+                    row = self.free_rows.pop()
+                    self.ids[row] = doc_id
+                else:
+                    row = len(self.ids)
+                    if row >= self.matrix.shape[0]:
+                        self._grow()
+                    self.ids.append(doc_id)
+                self.rows[doc_id] = row
+            self.matrix[row] = vector
+            self.doc_freq += vector != 0
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            row = self.rows.pop(doc_id, None)
+            if row is None:
+                return
+            self.doc_freq -= self.matrix[row] != 0
+            self.matrix[row] = 0
+            self.ids[row] = None
+            self.free_rows.append(row)
+
+    def _top_k(self, queries: np.ndarray, k: int, exclude: list[str | None]) -> list[list[tuple[str, float]]]:
+        with self._lock:
+            used = len(self.ids)
+            if not used:
+                return [[] for _ in range(len(queries))]
+            weighted = queries * self.idf()
+            norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+            weighted /= np.where(norms == 0, 1, norms)
+            scores = self.matrix[:used] @ weighted.T
+            ids = list(self.ids)
+        results = []
+        for column, skip in zip(scores.T, exclude):
+            take = min(k + 1, used)
+            top = np.argpartition(-column, take - 1)[:take]
+            top = top[np.argsort(-column[top])]
+            hits = []
+            for row in top:
+                doc_id = ids[row]
+                if doc_id is None or doc_id == skip or column[row] <= 0:
+                    continue
+                hits.append((doc_id, float(column[row])))
+                if len(hits) == k:
+                    break
+            results.append(hits)
+        return results
+
+    def search(self, texts: list[str], k: int) -> list[list[tuple[str, float]]]:
+        """Batched cosine top-k for free-text queries"""
+        queries = np.stack([self.vectorize(text) for text in texts])
+        return self._top_k(queries, k, [None] * len(texts))
+
+    def related(self, doc_id: str, k: int) -> list[tuple[str, float]]:
+        with self._lock:
+            row = self.rows.get(doc_id)
+            if row is None:
+                return []
+            query = self.matrix[row : row + 1].copy()
+        return self._top_k(query, k, [doc_id])[0]
+
+
+# One index per workspace, each starting small since most workspaces hold few documents
+semantic_index: PartitionedIndex[SemanticIndex] = PartitionedIndex(
+    lambda: SemanticIndex(settings.SEMANTIC_DIM, initial_capacity=64)
+)
+
+
+def document_text(document: dict) -> str:
+    return f"{document.get('title', '')}\n{document.get('content', '')}"
+
+
+def _load(db, since: datetime | None) -> int:
+    # Later passes also see documents trashed since, to drop them
+    query = {"updated_at": {"$gte": since}} if since else {"deleted_at": None}
+    count = 0
+    for document in db.documents.find(query, {"title": 1, "content": 1, "workspace_id": 1, "deleted_at": 1}):
+        if document.get("deleted_at"):
+            semantic_index.remove(str(document["_id"]))
+            continue
+        semantic_index.upsert(document.get("workspace_id"), str(document["_id"]), document_text(document))
+        count += 1
+    return count
+
+
+async def semantic_sync_loop(db):
+    """Build the index once migrations are applied, then pick up writes made by other workers"""
+    await wait_for_migrations()
+    since = None
+    while True:
+        started = datetime.utcnow()
+        try:
+            count = await to_thread.run_sync(_load, db, since)
+            if since is None:
+                logger.info("Semantic index built with %d documents", count)
+            # Overlap windows slightly so writes racing the previous pass aren't missed
+            since = started - timedelta(seconds=5)
+        except Exception as e:
+            logger.warning("Semantic index sync failed: %s", e)
+        await asyncio.sleep(settings.INDEX_REFRESH_SECONDS)
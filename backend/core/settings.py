@@ -10,6 +10,131 @@ class Settings(BaseSettings):
     SECRET_KEY: str = os.getenv("SECRET_KEY")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
+    REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+    TOKEN_CACHE_SIZE: int = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+    REVOCATION_SYNC_SECONDS: int = int(os.getenv("REVOCATION_SYNC_SECONDS", "10"))
+
+    # MongoDB connection pool, timeouts and read routing
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    MONGO_CONNECT_TIMEOUT_MS: int = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+    MONGO_SOCKET_TIMEOUT_MS: int = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+    MONGO_COMPRESSORS: str = os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+    MONGO_LISTING_READ_PREFERENCE: str = os.getenv("MONGO_LISTING_READ_PREFERENCE", "secondaryPreferred")
+
+    # Rate limiting and admission control
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_DEFAULT: str = os.getenv("RATE_LIMIT_DEFAULT", "600/m")
+    RATE_LIMITS: str = os.getenv("RATE_LIMITS", "")
+    # Shared by all users of a workspace, on top of the per-user limits above
+    RATE_LIMIT_WORKSPACE: str = os.getenv("RATE_LIMIT_WORKSPACE", "3000/m")
+    # Key anonymous callers on X-Forwarded-For; must be on behind a proxy such as Render's,
+    # or every anonymous caller shares the proxy's bucket
+    RATE_LIMIT_TRUST_FORWARDED: bool = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+    MAX_CONCURRENT_REQUESTS: int = int(os.getenv("MAX_CONCURRENT_REQUESTS", "200"))
+    ADMISSION_QUEUE_TIMEOUT_MS: int = int(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "250"))
+    ADMISSION_MAX_DB_WAITERS: int = int(os.getenv("ADMISSION_MAX_DB_WAITERS", "25"))
+
+    # In-memory document indexes (semantic search, near-duplicate detection)
+    SEMANTIC_DIM: int = int(os.getenv("SEMANTIC_DIM", "256"))
+    DEDUP_THRESHOLD: float = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+    INDEX_REFRESH_SECONDS: int = int(os.getenv("INDEX_REFRESH_SECONDS", "30"))
+
+    # Export: documents above EXPORT_INLINE_BYTES are converted in the process pool
+    EXPORT_INLINE_BYTES: int = int(os.getenv("EXPORT_INLINE_BYTES", "65536"))
+    EXPORT_CHUNK_BYTES: int = int(os.getenv("EXPORT_CHUNK_BYTES", "65536"))
+
+    # Listing summaries stored alongside each document
+    EXCERPT_CHARS: int = int(os.getenv("EXCERPT_CHARS", "240"))
+    READING_WORDS_PER_MINUTE: int = int(os.getenv("READING_WORDS_PER_MINUTE", "200"))
+
+    # View/edit counters are buffered in memory and flushed in bulk
+    ACTIVITY_FLUSH_SECONDS: float = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "5"))
+    ACTIVITY_FEED_BYTES: int = int(os.getenv("ACTIVITY_FEED_BYTES", str(16 * 1024 * 1024)))
+
+    # Workspace membership lookups are cached per workspace for this long
+    WORKSPACE_CACHE_SECONDS: float = float(os.getenv("WORKSPACE_CACHE_SECONDS", "30"))
+    WORKSPACE_CACHE_USERS: int = int(os.getenv("WORKSPACE_CACHE_USERS", "10000"))
+    # Workspaces whose member directory (for @mention suggestions) each worker keeps
+    DIRECTORY_CACHE_WORKSPACES: int = int(os.getenv("DIRECTORY_CACHE_WORKSPACES", "1000"))
+
+    # Presence: sessions expire PRESENCE_TTL_SECONDS after the last heartbeat
+    PRESENCE_TTL_SECONDS: float = float(os.getenv("PRESENCE_TTL_SECONDS", "30"))
+    PRESENCE_TICK_SECONDS: float = float(os.getenv("PRESENCE_TICK_SECONDS", "1"))
+    PRESENCE_SYNC_SECONDS: float = float(os.getenv("PRESENCE_SYNC_SECONDS", "2"))
+
+    # Large documents are also stored as blocks of roughly this size for partial loading
+    BLOCK_TARGET_BYTES: int = int(os.getenv("BLOCK_TARGET_BYTES", str(16 * 1024)))
+    BLOCK_PAGE_SIZE: int = int(os.getenv("BLOCK_PAGE_SIZE", "50"))
+
+    # Bulk import of document archives
+    IMPORT_MAX_BYTES: int = int(os.getenv("IMPORT_MAX_BYTES", str(512 * 1024 * 1024)))
+    IMPORT_MAX_FILE_BYTES: int = int(os.getenv("IMPORT_MAX_FILE_BYTES", str(10 * 1024 * 1024)))
+    IMPORT_BATCH_SIZE: int = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+
+    # Attachments (GridFS, content-addressed by SHA-256)
+    ATTACHMENT_MAX_BYTES: int = int(os.getenv("ATTACHMENT_MAX_BYTES", str(25 * 1024 * 1024)))
+    ATTACHMENT_CHUNK_BYTES: int = int(os.getenv("ATTACHMENT_CHUNK_BYTES", str(255 * 1024)))
+    ATTACHMENT_GC_SECONDS: int = int(os.getenv("ATTACHMENT_GC_SECONDS", "600"))
+    ATTACHMENT_GC_GRACE_SECONDS: int = int(os.getenv("ATTACHMENT_GC_GRACE_SECONDS", "86400"))
+
+    # Trash: deleted documents and comments are purged TRASH_RETENTION_SECONDS later, in throttled batches
+    TRASH_RETENTION_SECONDS: int = int(os.getenv("TRASH_RETENTION_SECONDS", str(30 * 24 * 3600)))
+    TRASH_PURGE_SECONDS: int = int(os.getenv("TRASH_PURGE_SECONDS", "300"))
+    TRASH_PURGE_BATCH_SIZE: int = int(os.getenv("TRASH_PURGE_BATCH_SIZE", "200"))
+    TRASH_PURGE_THROTTLE_MS: int = int(os.getenv("TRASH_PURGE_THROTTLE_MS", "100"))
+
+    # Background jobs and the shared process pool for CPU-bound work
+    JOB_CONCURRENCY: int = int(os.getenv("JOB_CONCURRENCY", "2"))
+    JOB_POLL_SECONDS: float = float(os.getenv("JOB_POLL_SECONDS", "2"))
+    JOB_LEASE_SECONDS: int = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_RETRY_BASE_SECONDS: float = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+    JOB_RETRY_MAX_SECONDS: float = float(os.getenv("JOB_RETRY_MAX_SECONDS", "300"))
+    JOB_DRAIN_SECONDS: float = float(os.getenv("JOB_DRAIN_SECONDS", "20"))
+    JOB_RETENTION_SECONDS: int = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+    CPU_WORKERS: int = int(os.getenv("CPU_WORKERS", "2"))
+
+    # Content snapshots kept per document for merging saves made against older versions
+    DOCUMENT_VERSIONS_KEPT: int = int(os.getenv("DOCUMENT_VERSIONS_KEPT", "50"))
+
+    # Idempotency-Key replay for create endpoints
+    IDEMPOTENCY_ENABLED: bool = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+    IDEMPOTENCY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+    # A duplicate waits this long for the first attempt on another worker before getting 409
+    IDEMPOTENCY_WAIT_SECONDS: float = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+    IDEMPOTENCY_POLL_MS: int = int(os.getenv("IDEMPOTENCY_POLL_MS", "100"))
+    # A claim not finished within this long is assumed abandoned and may be taken over
+    IDEMPOTENCY_LOCK_SECONDS: int = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+    IDEMPOTENCY_MAX_BODY_BYTES: int = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(1024 * 1024)))
+    # Requests carrying a key are buffered to fingerprint them; larger ones get 413
+    IDEMPOTENCY_MAX_REQUEST_BYTES: int = int(os.getenv("IDEMPOTENCY_MAX_REQUEST_BYTES", str(16 * 1024 * 1024)))
+
+    # Anonymous reads of public documents: rendered snapshots cached per worker (at most
+    # PUBLIC_CACHE_TOTAL_BYTES in all, none larger than PUBLIC_CACHE_MAX_BYTES), and the
+    # Cache-Control lifetimes sent to reverse proxies. A worker rechecks a cached snapshot
+    # against the database once it is PUBLIC_MAX_AGE_SECONDS old.
+    PUBLIC_CACHE_TOTAL_BYTES: int = int(os.getenv("PUBLIC_CACHE_TOTAL_BYTES", str(64 * 1024 * 1024)))
+    PUBLIC_CACHE_MAX_BYTES: int = int(os.getenv("PUBLIC_CACHE_MAX_BYTES", str(2 * 1024 * 1024)))
+    PUBLIC_MAX_AGE_SECONDS: int = int(os.getenv("PUBLIC_MAX_AGE_SECONDS", "30"))
+    PUBLIC_STALE_SECONDS: int = int(os.getenv("PUBLIC_STALE_SECONDS", "300"))
+
+    # Data migrations (batched backfills run at startup)
+    MIGRATION_BATCH_SIZE: int = int(os.getenv("MIGRATION_BATCH_SIZE", "500"))
+    MIGRATION_THROTTLE_MS: int = int(os.getenv("MIGRATION_THROTTLE_MS", "50"))
+    MIGRATION_LEASE_SECONDS: int = int(os.getenv("MIGRATION_LEASE_SECONDS", "60"))
+
+    # Slow-request/slow-query logging and sampled profiling
+    SLOW_REQUEST_MS: int = int(os.getenv("SLOW_REQUEST_MS", "500"))
+    SLOW_QUERY_MS: int = int(os.getenv("SLOW_QUERY_MS", "100"))
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_TOKEN: str = os.getenv("PROFILE_TOKEN", "")
+    PROFILE_INTERVAL_MS: float = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    PROFILE_TOP_STACKS: int = int(os.getenv("PROFILE_TOP_STACKS", "20"))
 
 
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,27 @@
+import math
+import re
+
+from core.export import html_to_text
+from core.settings import settings
+
+SUMMARY_FIELDS = ("excerpt", "word_count", "char_count", "reading_minutes")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"\w+(?:['’-]\w+)*")
+
+
+def document_summary(content: str) -> dict:
+    """Excerpt and size stats for a document's HTML, stored so listings can skip the body"""
+    text = _WHITESPACE_RE.sub(" ", html_to_text(content)).strip()
+    words = sum(1 for _ in _WORD_RE.finditer(text))
+    excerpt = text
+    if len(text) > settings.EXCERPT_CHARS:
+        # Cut at a word boundary so the preview doesn't end mid-word
+        cut = text.rfind(" ", 0, settings.EXCERPT_CHARS + 1)
+        excerpt = text[:cut if cut > 0 else settings.EXCERPT_CHARS].rstrip() + "…"
+    return {
+        "excerpt": excerpt,
+        "word_count": words,
+        "char_count": len(text),
+        "reading_minutes": math.ceil(words / settings.READING_WORDS_PER_MINUTE) if words else 0
+    }
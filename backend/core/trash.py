@@ -0,0 +1,151 @@
+"""
+Soft delete. Deleting a document or comment only stamps `deleted_at`, so the
+request returns at once and the owner can restore it. Once the retention
+window has passed, the purger removes documents with their comments, blocks,
+versions and attachment references in small throttled batches, so a large
+delete doesn't crowd out everyone else's queries.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+from anyio import to_thread
+from bson import ObjectId
+
+from core.attachments import update_references
+from core.blocks import load_content
+from core.minhash import lsh_index
+from core.permissions import move_record
+from core.semantic import document_text, semantic_index
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Records in the trash; restoring unsets deleted_at, so the partial indexes only hold these
+TRASHED = {"deleted_at": {"$exists": True}}
+
+# Removed together with their document
+DEPENDENT_COLLECTIONS = ("comments", "document_blocks", "document_versions")
+
+
+def purge_at(deleted_at: datetime) -> datetime:
+    return deleted_at + timedelta(seconds=settings.TRASH_RETENTION_SECONDS)
+
+
+def trash_documents(db, document_ids: list[ObjectId], user_id: str) -> int:
+    """Move documents to the trash and out of search; returns how many were trashed"""
+    now = datetime.utcnow()
+    result = db.documents.update_many(
+        {"_id": {"$in": document_ids}, "deleted_at": None},
+        # updated_at moves so other workers' index sync drops them too
+        {"$set": {"deleted_at": now, "deleted_by": user_id, "updated_at": now}}
+    )
+    for document_id in document_ids:
+        semantic_index.remove(str(document_id))
+        lsh_index.remove(str(document_id))
+    return result.modified_count
+
+
+def trash_comment(repos, comment_id: ObjectId, user_id: str) -> int:
+    """Move a comment and its replies to the trash"""
+    now = datetime.utcnow()
+    return repos.comments.update_many(
+        {"$or": [{"_id": comment_id}, {"parent_id": comment_id}], "deleted_at": None},
+        {"$set": {"deleted_at": now, "deleted_by": user_id}}
+    )
+
+
+def restore_document(db, document: dict) -> bool:
+    """
+    Take a document back out of the trash. If its folder was deleted meanwhile
+    it lands at the top level. False if the purger has already claimed it.
+    """
+    changes = {"updated_at": datetime.utcnow()}
+    folder_id = document.get("folder_id")
+    if folder_id is not None and not db.folders.find_one({"_id": folder_id}, {"_id": 1}):
+        changes["folder_id"] = None
+    result = db.documents.update_one(
+        {"_id": document["_id"], **TRASHED, "purging": {"$ne": True}},
+        {"$set": changes, "$unset": {"deleted_at": "", "deleted_by": ""}}
+    )
+    if not result.modified_count:
+        return False
+    # Its folders may have been re-shared or deleted while it sat in the trash
+    move_record(db, "documents", document["_id"], changes.get("folder_id", folder_id))
+    text = document_text({**document, "content": load_content(db, document)})
+    semantic_index.upsert(document["workspace_id"], str(document["_id"]), text)
+    if document.get("minhash"):
+        lsh_index.upsert(document["workspace_id"], str(document["_id"]), document["minhash"])
+    return True
+
+
+def _pause():
+    time.sleep(settings.TRASH_PURGE_THROTTLE_MS / 1000)
+
+
+def _delete_in_batches(collection, match: dict) -> int:
+    deleted = 0
+    while True:
+        ids = [row["_id"] for row in collection.find(match, {"_id": 1}).limit(settings.TRASH_PURGE_BATCH_SIZE)]
+        if not ids:
+            return deleted
+        deleted += collection.delete_many({"_id": {"$in": ids}}).deleted_count
+        _pause()
+
+
+def purge_trash(db, now: datetime | None = None) -> dict:
+    """Permanently delete everything trashed more than TRASH_RETENTION_SECONDS ago"""
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=settings.TRASH_RETENTION_SECONDS)
+    expired = {"deleted_at": {"$lt": cutoff}}
+    counts = {"documents": 0, "comments": 0}
+    while True:
+        candidates = [
+            row["_id"] for row in db.documents.find(expired, {"_id": 1}).limit(settings.TRASH_PURGE_BATCH_SIZE)
+        ]
+        if not candidates:
+            break
+        # Claim the batch first so a restore racing the purge can't bring back a document without its comments
+        db.documents.update_many({"_id": {"$in": candidates}, **expired}, {"$set": {"purging": True}})
+        documents = list(db.documents.find(
+            {"_id": {"$in": candidates}, "purging": True}, {"workspace_id": 1, "attachments": 1}
+        ))
+        ids = [document["_id"] for document in documents]
+        for collection in DEPENDENT_COLLECTIONS:
+            match = {"document_id": {"$in": ids}}
+            if collection == "comments":
+                # Comments are indexed under their workspace first
+                match = {"workspace_id": {"$in": list({document.get("workspace_id") for document in documents})}, **match}
+            deleted = _delete_in_batches(db[collection], match)
+            if collection == "comments":
+                counts["comments"] += deleted
+        # Released before the documents go; a crash in between over-releases, which attachment GC corrects
+        for document in documents:
+            update_references(db, set(), set(document.get("attachments", [])))
+        counts["documents"] += db.documents.delete_many({"_id": {"$in": ids}}).deleted_count
+        _pause()
+    counts["comments"] += _delete_in_batches(db.comments, expired)
+    return counts
+
+
+def ensure_trash_indexes(db):
+    for collection in ("documents", "comments"):
+        db[collection].create_index("deleted_at", partialFilterExpression=TRASHED)
+
+
+async def trash_purge_loop(db):
+    """Create the trash indexes, then purge expired trash every TRASH_PURGE_SECONDS"""
+    try:
+        await to_thread.run_sync(ensure_trash_indexes, db)
+    except Exception as e:
+        logger.warning("Could not create trash indexes: %s", e)
+    while True:
+        await asyncio.sleep(settings.TRASH_PURGE_SECONDS)
+        try:
+            counts = await to_thread.run_sync(purge_trash, db)
+            if any(counts.values()):
+                logger.info(
+                    "Purged %d documents and %d comments from the trash", counts["documents"], counts["comments"]
+                )
+        except Exception as e:
+            logger.warning("Trash purge failed: %s", e)
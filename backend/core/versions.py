@@ -0,0 +1,37 @@
+"""
+Content snapshots by version, so a save made against an older version can be
+merged into the current content (core/merge.py) instead of overwriting what
+others saved since. A document's version is its blocks_version, which every
+content change already bumps; the newest DOCUMENT_VERSIONS_KEPT are kept.
+"""
+from datetime import datetime
+
+from bson import ObjectId
+
+from core.settings import settings
+
+
+def current_version(document: dict) -> int:
+    return document.get("blocks_version") or 0
+
+
+def record_version(db, document_id: ObjectId, workspace_id, version: int, title: str, content: str):
+    db.document_versions.update_one(
+        {"document_id": document_id, "version": version},
+        {"$setOnInsert": {
+            "workspace_id": workspace_id,
+            "title": title,
+            "content": content,
+            "created_at": datetime.utcnow()
+        }},
+        upsert=True
+    )
+    if settings.DOCUMENT_VERSIONS_KEPT > 0:
+        db.document_versions.delete_many(
+            {"document_id": document_id, "version": {"$lte": version - settings.DOCUMENT_VERSIONS_KEPT}}
+        )
+
+
+def version_snapshot(db, document_id: ObjectId, version: int) -> dict | None:
+    """Title and content as of a version, None once it has been pruned or was never recorded"""
+    return db.document_versions.find_one({"document_id": document_id, "version": version}, {"title": 1, "content": 1})
@@ -0,0 +1,511 @@
+"""
+Wire format for collaboration messages (update, cursor, presence, awareness,
+plus init and join/leave notices). Two codecs share one message model:
+
+- JSON: the envelopes websocket-server/server.js and YjsEditor exchange
+  today (`{"type": "update", "content": ..., "documentId": ...}`), so
+  existing clients keep working unchanged.
+- Binary (protocol version 1): a framed format of one version byte, one type
+  byte and a payload of varints and length-prefixed UTF-8. The document id is
+  left out (the socket is opened per document), ObjectId user ids take 12
+  bytes instead of 26, and an update carries an edit script against the
+  previous version instead of the whole content.
+
+The codec is picked per connection from the WebSocket subprotocols the client
+offers (`negotiate`); a client that offers none gets JSON. A message sent to
+many connections is encoded once per codec with `Broadcast`, not once per
+recipient.
+
+Edit offsets and lengths, and cursor positions, count UTF-16 code units, as
+JavaScript string indexes do, so a browser can apply an edit script with
+plain slice() calls: an emoji outside the BMP is 2, not 1. Only the byte
+length framing an inserted string on the binary wire counts UTF-8 bytes.
+
+Nothing sends or receives these codecs yet. The collaboration relay is
+websocket-server/server.js, which exchanges the JSON envelopes itself; this
+module is the protocol's reference implementation, for a relay to call
+negotiate() on when it accepts a connection.
+"""
+import json
+import re
+from dataclasses import dataclass, field
+
+BINARY_VERSION = 1
+
+# Subprotocol names, in the server's order of preference
+BINARY_PROTOCOL = "collabradoc.v1"
+JSON_PROTOCOL = "collabradoc.json"
+
+# Message types on the binary wire; new types get new numbers, never reuse one
+INIT = 1
+UPDATE = 2
+CURSOR = 3
+PRESENCE = 4
+AWARENESS = 5
+USER_JOINED = 6
+USER_LEFT = 7
+
+# Edit operations of an update
+RETAIN = "retain"
+INSERT = "insert"
+DELETE = "delete"
+_OP_TAGS = {RETAIN: 0, INSERT: 1, DELETE: 2}
+_TAG_OPS = {tag: op for op, tag in _OP_TAGS.items()}
+
+_UPDATE_FULL = 1
+
+# Ids sent as 12 raw bytes; lowercase only, so they decode to the same string
+_OBJECT_ID_RE = re.compile(r"[0-9a-f]{24}")
+
+
+class WireError(ValueError):
+    """A frame that can't be decoded, or a message that can't be encoded in the codec asked for"""
+
+
+@dataclass
+class Init:
+    """The document as a connection joins it"""
+    content: str
+    version: int = 0
+
+
+@dataclass
+class Update:
+    """
+    A content change producing `version`. `ops` edits version - 1; `content`
+    is the full text after the change. Either may be missing on a received
+    update; a relay fills in `content` (apply_ops) before sending to JSON
+    clients, which only understand full content.
+    """
+    version: int = 0
+    ops: list[tuple[str, int | str]] | None = None
+    content: str | None = None
+
+
+@dataclass
+class Cursor:
+    user_id: str
+    # In UTF-16 units, like edit offsets
+    position: int
+
+
+@dataclass
+class PresenceUser:
+    user_id: str
+    name: str | None = None
+    email: str | None = None
+    color: str | None = None
+
+
+@dataclass
+class Presence:
+    users: list[PresenceUser] = field(default_factory=list)
+
+
+@dataclass
+class AwarenessState:
+    """One user's awareness entry; `state` None means the user has gone"""
+    user_id: str
+    clock: int
+    state: dict | None = None
+
+
+@dataclass
+class Awareness:
+    states: list[AwarenessState] = field(default_factory=list)
+
+
+@dataclass
+class UserJoined:
+    user_id: str | None = None
+
+
+@dataclass
+class UserLeft:
+    user_id: str | None = None
+
+
+Message = Init | Update | Cursor | Presence | Awareness | UserJoined | UserLeft
+
+
+def _utf16(text: str) -> bytes:
+    # surrogatepass: JavaScript strings may hold unpaired surrogates, and so may text decoded from them
+    return text.encode("utf-16-le", "surrogatepass")
+
+
+def utf16_length(text: str) -> int:
+    """Length of text in UTF-16 code units, i.e. JavaScript's string.length"""
+    return len(_utf16(text)) // 2
+
+
+def diff_ops(old: str, new: str) -> list[tuple[str, int | str]]:
+    """
+    Edit script turning old into new: one replaced region between the common
+    prefix and suffix, which is exactly what a keystroke, paste or cut
+    produces. A trailing retain is left implicit. Counts are UTF-16 units.
+    """
+    limit = min(len(old), len(new))
+    prefix = 0
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-suffix - 1] == new[-suffix - 1]:
+        suffix += 1
+    ops = []
+    if prefix:
+        ops.append((RETAIN, utf16_length(old[:prefix])))
+    if len(old) - suffix > prefix:
+        ops.append((DELETE, utf16_length(old[prefix:len(old) - suffix])))
+    if len(new) - suffix > prefix:
+        ops.append((INSERT, new[prefix:len(new) - suffix]))
+    return ops
+
+
+def apply_ops(content: str, ops: list[tuple[str, int | str]]) -> str:
+    """Apply an edit script counted in UTF-16 units, working on the UTF-16 form of the content"""
+    units = _utf16(content)
+    pieces = []
+    index = 0
+    for op, value in ops:
+        if op == RETAIN:
+            if index + value * 2 > len(units):
+                raise WireError("Update retains past the end of the document")
+            pieces.append(units[index:index + value * 2])
+            index += value * 2
+        elif op == DELETE:
+            if index + value * 2 > len(units):
+                raise WireError("Update deletes past the end of the document")
+            index += value * 2
+        elif op == INSERT:
+            pieces.append(_utf16(value))
+        else:
+            raise WireError(f"Unknown edit operation {op!r}")
+    pieces.append(units[index:])
+    # An offset inside a surrogate pair splits it, just as slice() would in the browser
+    return b"".join(pieces).decode("utf-16-le", "surrogatepass")
+
+
+class _Writer:
+    def __init__(self, message_type: int):
+        self.buffer = bytearray((BINARY_VERSION, message_type))
+
+    def varint(self, value: int):
+        if value < 0:
+            raise WireError("Negative value in an unsigned field")
+        while value > 0x7F:
+            self.buffer.append((value & 0x7F) | 0x80)
+            value >>= 7
+        self.buffer.append(value)
+
+    def raw(self, data: bytes):
+        self.varint(len(data))
+        self.buffer += data
+
+    def text(self, value: str):
+        self.raw(_encode_utf8(value))
+
+    def optional_text(self, value: str | None):
+        # 0 for None, otherwise length + 1
+        if value is None:
+            self.varint(0)
+        else:
+            data = _encode_utf8(value)
+            self.varint(len(data) + 1)
+            self.buffer += data
+
+    def user_id(self, value: str | None):
+        # 0 for None, 1 for an ObjectId as 12 raw bytes, otherwise length + 2 and UTF-8
+        if value is None:
+            self.varint(0)
+            return
+        if _OBJECT_ID_RE.fullmatch(value):
+            self.buffer.append(1)
+            self.buffer += bytes.fromhex(value)
+            return
+        data = _encode_utf8(value)
+        self.varint(len(data) + 2)
+        self.buffer += data
+
+
+def _encode_utf8(value: str) -> bytes:
+    try:
+        return value.encode("utf-8")
+    except UnicodeEncodeError:
+        raise WireError("Text with an unpaired surrogate can't be sent as UTF-8")
+
+
+def _utf8(data: bytes) -> str:
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        raise WireError("Invalid UTF-8 in a text field")
+
+
+class _Reader:
+    def __init__(self, frame: bytes):
+        self.frame = memoryview(frame)
+        self.offset = 2
+
+    def varint(self) -> int:
+        value = 0
+        shift = 0
+        while True:
+            if self.offset >= len(self.frame):
+                raise WireError("Frame ends inside a varint")
+            byte = self.frame[self.offset]
+            self.offset += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def take(self, size: int) -> bytes:
+        end = self.offset + size
+        if end > len(self.frame):
+            raise WireError("Frame ends inside a field")
+        data = self.frame[self.offset:end]
+        self.offset = end
+        return bytes(data)
+
+    def text(self) -> str:
+        return _utf8(self.take(self.varint()))
+
+    def optional_text(self) -> str | None:
+        size = self.varint()
+        return None if size == 0 else _utf8(self.take(size - 1))
+
+    def user_id(self) -> str | None:
+        size = self.varint()
+        if size == 0:
+            return None
+        if size == 1:
+            return self.take(12).hex()
+        return _utf8(self.take(size - 2))
+
+    def finish(self):
+        if self.offset != len(self.frame):
+            raise WireError("Trailing bytes after the message")
+
+
+
+class BinaryCodec:
+    protocol = BINARY_PROTOCOL
+    binary = True
+
+    def encode(self, message: Message, document_id: str = "") -> bytes:
+        if isinstance(message, Update):
+            writer = _Writer(UPDATE)
+            writer.varint(message.version)
+            if message.ops is None:
+                if message.content is None:
+                    raise WireError("Update has neither ops nor content")
+                writer.varint(_UPDATE_FULL)
+                writer.text(message.content)
+            else:
+                writer.varint(0)
+                writer.varint(len(message.ops))
+                for op, value in message.ops:
+                    if op == INSERT:
+                        data = _encode_utf8(value)
+                        # Tag in the low two bits; an insert's length is in bytes
+                        writer.varint(len(data) << 2 | _OP_TAGS[INSERT])
+                        writer.buffer += data
+                    elif op in _OP_TAGS:
+                        writer.varint(value << 2 | _OP_TAGS[op])
+                    else:
+                        raise WireError(f"Unknown edit operation {op!r}")
+        elif isinstance(message, Cursor):
+            writer = _Writer(CURSOR)
+            writer.user_id(message.user_id)
+            writer.varint(message.position)
+        elif isinstance(message, Presence):
+            writer = _Writer(PRESENCE)
+            writer.varint(len(message.users))
+            for user in message.users:
+                writer.user_id(user.user_id)
+                writer.optional_text(user.name)
+                writer.optional_text(user.email)
+                writer.optional_text(user.color)
+        elif isinstance(message, Awareness):
+            writer = _Writer(AWARENESS)
+            writer.varint(len(message.states))
+            for entry in message.states:
+                writer.user_id(entry.user_id)
+                writer.varint(entry.clock)
+                writer.optional_text(
+                    None if entry.state is None else json.dumps(entry.state, separators=(",", ":"))
+                )
+        elif isinstance(message, Init):
+            writer = _Writer(INIT)
+            writer.varint(message.version)
+            writer.text(message.content)
+        elif isinstance(message, UserJoined):
+            writer = _Writer(USER_JOINED)
+            writer.user_id(message.user_id)
+        elif isinstance(message, UserLeft):
+            writer = _Writer(USER_LEFT)
+            writer.user_id(message.user_id)
+        else:
+            raise WireError(f"Can't encode {type(message).__name__}")
+        return bytes(writer.buffer)
+
+    def decode(self, frame: bytes) -> Message:
+        if len(frame) < 2:
+            raise WireError("Frame too short")
+        if frame[0] != BINARY_VERSION:
+            raise WireError(f"Unsupported protocol version {frame[0]}")
+        message_type = frame[1]
+        reader = _Reader(frame)
+        if message_type == UPDATE:
+            version = reader.varint()
+            if reader.varint() & _UPDATE_FULL:
+                message = Update(version, content=reader.text())
+            else:
+                ops = []
+                for _ in range(reader.varint()):
+                    head = reader.varint()
+                    tag, value = head & 3, head >> 2
+                    if tag not in _TAG_OPS:
+                        raise WireError(f"Unknown edit operation tag {tag}")
+                    if tag == _OP_TAGS[INSERT]:
+                        ops.append((INSERT, _utf8(reader.take(value))))
+                    else:
+                        ops.append((_TAG_OPS[tag], value))
+                message = Update(version, ops=ops)
+        elif message_type == CURSOR:
+            message = Cursor(reader.user_id(), reader.varint())
+        elif message_type == PRESENCE:
+            message = Presence([
+                PresenceUser(reader.user_id(), reader.optional_text(), reader.optional_text(), reader.optional_text())
+                for _ in range(reader.varint())
+            ])
+        elif message_type == AWARENESS:
+            states = []
+            for _ in range(reader.varint()):
+                user_id, clock, state = reader.user_id(), reader.varint(), reader.optional_text()
+                states.append(AwarenessState(user_id, clock, None if state is None else _json_object(state)))
+            message = Awareness(states)
+        elif message_type == INIT:
+            version = reader.varint()
+            message = Init(reader.text(), version)
+        elif message_type == USER_JOINED:
+            message = UserJoined(reader.user_id())
+        elif message_type == USER_LEFT:
+            message = UserLeft(reader.user_id())
+        else:
+            raise WireError(f"Unknown message type {message_type}")
+        reader.finish()
+        return message
+
+
+def _json_object(text: str | bytes) -> dict:
+    try:
+        value = json.loads(text)
+    except ValueError:
+        raise WireError("Invalid JSON")
+    if not isinstance(value, dict):
+        raise WireError("Expected a JSON object")
+    return value
+
+
+class JsonCodec:
+    """The envelopes the existing websocket server and editor use"""
+    protocol = JSON_PROTOCOL
+    binary = False
+
+    def encode(self, message: Message, document_id: str = "") -> str:
+        if isinstance(message, Update):
+            if message.content is None:
+                raise WireError("JSON clients need the full content of an update")
+            envelope = {"type": "update", "content": message.content}
+        elif isinstance(message, Cursor):
+            envelope = {"type": "cursor", "userId": message.user_id, "position": message.position}
+        elif isinstance(message, Presence):
+            envelope = {"type": "presence", "users": [
+                [user.user_id, {"name": user.name, "email": user.email, "color": user.color}]
+                for user in message.users
+            ]}
+        elif isinstance(message, Awareness):
+            envelope = {"type": "awareness", "states": [
+                [entry.user_id, entry.clock, entry.state] for entry in message.states
+            ]}
+        elif isinstance(message, Init):
+            envelope = {"type": "init", "content": message.content}
+        elif isinstance(message, UserJoined):
+            envelope = {"type": "user_joined"}
+            if message.user_id is not None:
+                envelope["userId"] = message.user_id
+        elif isinstance(message, UserLeft):
+            envelope = {"type": "user_left"}
+            if message.user_id is not None:
+                envelope["userId"] = message.user_id
+        else:
+            raise WireError(f"Can't encode {type(message).__name__}")
+        envelope["documentId"] = document_id
+        return json.dumps(envelope)
+
+    def decode(self, frame: str | bytes) -> Message:
+        data = _json_object(frame)
+        message_type = data.get("type")
+        try:
+            if message_type == "update":
+                return Update(content=data["content"])
+            if message_type == "cursor":
+                return Cursor(data["userId"], data["position"])
+            if message_type == "presence":
+                if "users" in data:
+                    return Presence([
+                        PresenceUser(user_id, info.get("name"), info.get("email"), info.get("color"))
+                        for user_id, info in data["users"]
+                    ])
+                # A client announcing itself
+                return Presence([PresenceUser(data["userId"], data.get("name"), data.get("email"), data.get("color"))])
+            if message_type == "awareness":
+                return Awareness([AwarenessState(user_id, clock, state) for user_id, clock, state in data["states"]])
+            if message_type == "init":
+                return Init(data["content"])
+            if message_type == "user_joined":
+                return UserJoined(data.get("userId"))
+            if message_type == "user_left":
+                return UserLeft(data.get("userId"))
+        except (KeyError, TypeError, ValueError):
+            raise WireError(f"Malformed {message_type} message")
+        raise WireError(f"Unknown message type {message_type!r}")
+
+
+BINARY = BinaryCodec()
+JSON = JsonCodec()
+
+CODECS = {codec.protocol: codec for codec in (BINARY, JSON)}
+
+
+def negotiate(offered: str | list[str] | None) -> BinaryCodec | JsonCodec:
+    """
+    The codec for a connection, from its Sec-WebSocket-Protocol offer (the raw
+    header or the parsed list). The binary protocol wins when offered; no
+    offer, or only unknown ones, means a client from before the binary
+    protocol, which gets JSON. Echo `codec.protocol` back only if the client
+    offered it.
+    """
+    if isinstance(offered, str):
+        offered = [protocol.strip() for protocol in offered.split(",")]
+    offered = set(offered or ())
+    for protocol, codec in CODECS.items():
+        if protocol in offered:
+            return codec
+    return JSON
+
+
+class Broadcast:
+    """One message for every connection on a document, encoded once per codec in use"""
+
+    def __init__(self, message: Message, document_id: str):
+        self.message = message
+        self.document_id = document_id
+        self._frames: dict[str, bytes | str] = {}
+
+    def frame(self, codec: BinaryCodec | JsonCodec) -> bytes | str:
+        frame = self._frames.get(codec.protocol)
+        if frame is None:
+            frame = self._frames[codec.protocol] = codec.encode(self.message, self.document_id)
+        return frame
@@ -0,0 +1,174 @@
+"""
+Workspaces keep teams sharing one cluster apart. Documents, folders and
+comments carry a workspace_id that leads every compound index on them, and
+each request works inside one workspace: the one named by the X-Workspace-Id
+header, or the caller's personal workspace when the header is absent.
+"""
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from anyio import to_thread
+from bson import ObjectId
+from fastapi import Depends, HTTPException, Request, status
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from core.cache import PartitionedLRU
+from core.database import get_db
+from core.jwt import get_current_user
+from core.metrics import current_request_metrics
+from core.ratelimit import RATE_LIMITED_TOTAL, create_backend, parse_rate
+from core.settings import settings
+from models.user import UserInDB
+
+WORKSPACE_HEADER = "X-Workspace-Id"
+
+OWNER = "owner"
+MEMBER = "member"
+# Added when someone shares a document or folder with a non-member; sees only what is shared
+GUEST = "guest"
+MEMBER_ROLES = (MEMBER, GUEST)
+
+# workspace -> user -> (role or None, cached until); one workspace's churn never evicts another's
+_memberships = PartitionedLRU(settings.WORKSPACE_CACHE_USERS)
+_personal = PartitionedLRU(settings.WORKSPACE_CACHE_USERS * 10, max_partitions=1)
+
+_rate_backend = None
+
+
+@dataclass
+class Workspace:
+    id: ObjectId
+    role: str
+    # No X-Workspace-Id was sent; a record shared from another workspace may still be opened by id
+    implicit: bool = False
+
+    def require_member(self):
+        """Guests may work inside what was shared with them but not add to the workspace itself"""
+        if self.role == GUEST:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Guests can't create items at the top of a workspace"
+            )
+
+
+def personal_workspace_id(db, user_id: str) -> ObjectId:
+    """The user's personal workspace, created on first use"""
+    cached = _personal.get(None, user_id)
+    if cached is not None:
+        return cached
+    now = datetime.utcnow()
+    try:
+        workspace = db.workspaces.find_one_and_update(
+            {"owner_id": user_id, "personal": True},
+            {"$setOnInsert": {
+                "name": "Personal",
+                "members": [{"user_id": user_id, "role": OWNER}],
+                "created_at": now,
+                "updated_at": now
+            }},
+            projection={"_id": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Lost a race with a concurrent first request; the unique index kept one
+        workspace = db.workspaces.find_one({"owner_id": user_id, "personal": True}, {"_id": 1})
+    _personal.put(None, user_id, workspace["_id"])
+    return workspace["_id"]
+
+
+def member_role(db, workspace_id: ObjectId, user_id: str) -> str | None:
+    """The user's role in the workspace, None if they aren't a member; cached for WORKSPACE_CACHE_SECONDS"""
+    cached = _memberships.get(workspace_id, user_id)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+    workspace = db.workspaces.find_one(
+        {"_id": workspace_id, "members.user_id": user_id}, {"members": {"$elemMatch": {"user_id": user_id}}}
+    )
+    role = workspace["members"][0]["role"] if workspace else None
+    _memberships.put(workspace_id, user_id, (role, time.monotonic() + settings.WORKSPACE_CACHE_SECONDS))
+    return role
+
+
+def set_member(db, workspace_id: ObjectId, user_id: str, role: str | None, keep_existing: bool = False):
+    """
+    Add, change or (role=None) remove a member. With keep_existing an existing
+    member's role is left alone, which is what sharing with them wants.
+    """
+    if keep_existing:
+        db.workspaces.update_one(
+            {"_id": workspace_id, "members.user_id": {"$ne": user_id}},
+            {"$push": {"members": {"user_id": user_id, "role": role}}}
+        )
+    else:
+        # The owner's entry is never touched here
+        db.workspaces.update_one(
+            {"_id": workspace_id},
+            {"$pull": {"members": {"user_id": user_id, "role": {"$ne": OWNER}}}}
+        )
+        if role is not None:
+            db.workspaces.update_one(
+                {"_id": workspace_id, "members.user_id": {"$ne": user_id}},
+                {"$push": {"members": {"user_id": user_id, "role": role}}}
+            )
+    _memberships.pop(workspace_id, user_id)
+
+
+def _workspace_backend():
+    global _rate_backend
+    if _rate_backend is None:
+        _rate_backend = create_backend()
+    return _rate_backend
+
+
+async def _throttle(workspace_id: ObjectId):
+    """One token bucket per workspace, so a single busy team can't use up every worker"""
+    if not settings.RATE_LIMIT_ENABLED or not settings.RATE_LIMIT_WORKSPACE:
+        return
+    capacity, refill_rate = parse_rate(settings.RATE_LIMIT_WORKSPACE)
+    backend = _workspace_backend()
+    key = f"workspace|{workspace_id}"
+    if backend.blocking:
+        retry_after = await to_thread.run_sync(backend.acquire, key, capacity, refill_rate)
+    else:
+        retry_after = backend.acquire(key, capacity, refill_rate)
+    if retry_after > 0:
+        RATE_LIMITED_TOTAL.inc("workspace")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests for this workspace",
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
+        )
+
+
+async def get_workspace(
+    request: Request,
+    current_user: UserInDB = Depends(get_current_user),
+    db = Depends(get_db("CollabraDoc"))
+) -> Workspace:
+    """The workspace this request works in; 404 if the caller isn't a member"""
+    header = request.headers.get(WORKSPACE_HEADER)
+    if header:
+        try:
+            workspace_id = ObjectId(header)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid workspace ID format"
+            )
+        role = member_role(db, workspace_id, current_user.id)
+        if role is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Workspace not found"
+            )
+    else:
+        workspace_id = personal_workspace_id(db, current_user.id)
+        role = OWNER
+    await _throttle(workspace_id)
+    metrics = current_request_metrics()
+    if metrics is not None:
+        metrics.workspace = str(workspace_id)
+    return Workspace(workspace_id, role, implicit=not header)
@@ -1,9 +1,68 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from routes import api_router
 from fastapi.middleware.cors import CORSMiddleware 
+from core.metrics import MetricsMiddleware, registry
+from core.database import get_client, close_client
+from core.ratelimit import AdmissionControlMiddleware, RateLimitMiddleware
+from core.idempotency import IdempotencyMiddleware
+from core.jwt import revocation_sync_loop
+from core.semantic import semantic_sync_loop
+from core.minhash import minhash_sync_loop
+from core.presence import presence_loop
+from core.executor import shutdown_process_pool
+from core.attachments import attachment_gc_loop
+from core.trash import trash_purge_loop
+from core.jobs import job_runner
+from core.migrations import MigrationGateMiddleware, run_migrations
+from core.activity import activity, activity_flush_loop
 
-app = FastAPI(title="CollabraDoc")
+logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the pool up front so the first request doesn't pay for it
+    db = get_client()["CollabraDoc"]
+    background = [
+        asyncio.create_task(run_migrations(db)),
+        asyncio.create_task(revocation_sync_loop(db)),
+        asyncio.create_task(semantic_sync_loop(db)),
+        asyncio.create_task(minhash_sync_loop(db)),
+        asyncio.create_task(presence_loop(db)),
+        asyncio.create_task(attachment_gc_loop(db)),
+        asyncio.create_task(trash_purge_loop(db)),
+        asyncio.create_task(activity_flush_loop(db)),
+    ]
+    job_runner.start(db)
+    yield
+    # Let in-flight jobs finish (or requeue them) before the pools they use go away
+    await job_runner.stop()
+    for task in background:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    try:
+        activity.flush(db)
+    except Exception as e:
+        logger.warning("Could not flush activity counters at shutdown: %s", e)
+    shutdown_process_pool()
+    close_client()
+
+
+app = FastAPI(title="CollabraDoc", lifespan=lifespan)
+
+# Added innermost-first: rate limiting runs before a concurrency slot is taken,
+# and both sit inside CORS so 429/503 responses still carry CORS headers.
+# Retries replayed from an Idempotency-Key still count against both, and
+# nothing reaches the API until migrations are applied.
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(MigrationGateMiddleware)
+app.add_middleware(AdmissionControlMiddleware)
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -15,22 +74,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After", "X-Next-Cursor", "Idempotent-Replayed"],
 )
 
+# Outermost so the recorded total covers CORS handling as well
+app.add_middleware(MetricsMiddleware)
+
 
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to CollabraDoc API"}
 
-app.include_router(api_router, prefix="/api", tags=["api"])
-
-@app.get("/documents/")
-async def read_documents():
-    # Placeholder for document data retrieval logic
-    return [{"id": 1, "title": "Document 1"}, {"id": 2, "title": "Document 2"}]
 
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
-@app.get("/workspace/")
-async def read_workspaces():
-    # Placeholder for workspace data retrieval logic
-    return [{"id": 1, "name": "Workspace 1"}, {"id": 2, "name": "Workspace 2"}]
\ No newline at end of file
+app.include_router(api_router, prefix="/api", tags=["api"])
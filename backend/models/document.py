@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Literal, Optional, List
 from bson import ObjectId
 from datetime import datetime
 from core.database import PyObjectId
@@ -31,3 +31,19 @@ class DocumentUpdate(BaseModel):
     content: Optional[str] = None
     folder_id: Optional[str] = None
     isPublic: Optional[bool] = None
+    base_version: Optional[int] = Field(
+        None, description="Version the edit was made against; newer saves by others are merged in rather than overwritten"
+    )
+
+
+class BlockEdit(BaseModel):
+    op: Literal["replace", "insert", "delete"]
+    block_id: Optional[str] = Field(None, description="Block to replace or delete, or to insert after (omit to insert first)")
+    html: Optional[str] = None
+
+
+class BlockEdits(BaseModel):
+    edits: List[BlockEdit] = Field(..., min_length=1)
+    base_version: int = Field(
+        ..., ge=0, description="Version the outline was loaded at; 409 if the document has changed since"
+    )
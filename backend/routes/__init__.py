@@ -4,6 +4,13 @@ from .auth import router as auth_router
 from .document import router as document_router
 from .folder import router as folder_router
 from .comments import router as comments_router
+from .imports import router as imports_router
+from .attachments import router as attachments_router
+from .jobs import router as jobs_router
+from .activity import router as activity_router
+from .presence import router as presence_router
+from .workspaces import router as workspaces_router
+from .public import router as public_router
 
 api_router = APIRouter()
 api_router.include_router(users_router)
@@ -11,3 +18,10 @@ api_router.include_router(auth_router)
 api_router.include_router(document_router)
 api_router.include_router(folder_router)
 api_router.include_router(comments_router)
+api_router.include_router(imports_router)
+api_router.include_router(attachments_router)
+api_router.include_router(jobs_router)
+api_router.include_router(activity_router)
+api_router.include_router(presence_router)
+api_router.include_router(workspaces_router)
+api_router.include_router(public_router)
@@ -0,0 +1,120 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from typing import List
+from bson import ObjectId
+from core.activity import FEED_COLLECTION
+from core.database import get_read_db
+from core.metrics import InstrumentedRoute
+from core.permissions import listing_filter, visible_filter
+from core.workspaces import Workspace, get_workspace
+from core.projections import ACTIVITY_SUMMARY, find_projected
+from schemas import ActivityDocumentOut, ActivityOut
+from core.jwt import get_current_user
+from models.user import UserInDB
+
+router = APIRouter(prefix="/activity", tags=["activity"], route_class=InstrumentedRoute)
+
+
+@router.get("/recent", response_model=List[ActivityDocumentOut])
+async def get_recently_viewed(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: UserInDB = Depends(get_current_user),
+    workspace: Workspace = Depends(get_workspace),
+    db = Depends(get_read_db("CollabraDoc"))
+):
+    """Documents the current user opened most recently"""
+    try:
+        # Over-fetch: some of these may have been deleted or made private since
+        views = list(
+            db.document_views.find(
+                {"user_id": current_user.id, "last_viewed_at": {"$exists": True}},
+                {"document_id": 1, "last_viewed_at": 1}
+            ).sort("last_viewed_at", -1).limit(limit * 2)
+        )
+        if not views:
+            return []
+        documents = find_projected(
+            db.documents,
+            {"$and": [
+                {"_id": {"$in": [ObjectId(view["document_id"]) for view in views]}},
+                listing_filter(current_user.id, workspace)
+            ]},
+            ACTIVITY_SUMMARY
+        )
+        by_id = {doc["id"]: doc for doc in documents}
+        result = []
+        for view in views:
+            doc = by_id.get(view["document_id"])
+            if doc:
+                # This user's last visit rather than anyone's
+                result.append(ActivityDocumentOut(**{**doc, "last_viewed_at": view["last_viewed_at"]}))
+        return result[:limit]
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve recent documents: {str(e)}"
+        )
+
+
+@router.get("/popular", response_model=List[ActivityDocumentOut])
+async def get_most_viewed(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: UserInDB = Depends(get_current_user),
+    workspace: Workspace = Depends(get_workspace),
+    db = Depends(get_read_db("CollabraDoc"))
+):
+    """Visible documents with the most views"""
+    try:
+        documents = find_projected(
+            db.documents,
+            {"$and": [{"view_count": {"$gt": 0}}, listing_filter(current_user.id, workspace)]},
+            ACTIVITY_SUMMARY,
+            sort=[("view_count", -1)],
+            limit=limit
+        )
+        return [ActivityDocumentOut(**doc) for doc in documents]
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve popular documents: {str(e)}"
+        )
+
+
+@router.get("/feed", response_model=List[ActivityOut])
+async def get_activity_feed(
+    limit: int = Query(50, ge=1, le=200),
+    current_user: UserInDB = Depends(get_current_user),
+    workspace: Workspace = Depends(get_workspace),
+    db = Depends(get_read_db("CollabraDoc"))
+):
+    """Latest views and edits on documents the current user can see, newest first"""
+    try:
+        # Entries of this workspace only, newest first off the (workspace_id, at) index;
+        # over-fetch for documents in it that this user can't see
+        entries = list(
+            db[FEED_COLLECTION].find({"workspace_id": workspace.id}, {"_id": 0, "workspace_id": 0})
+            .sort("at", -1)
+            .limit(limit * 4)
+        )
+        if not entries:
+            return []
+        ids = {entry["document_id"] for entry in entries}
+        titles = {
+            str(doc["_id"]): doc["title"]
+            for doc in db.documents.find(
+                {"$and": [{"_id": {"$in": [ObjectId(doc_id) for doc_id in ids]}}, visible_filter(current_user.id, workspace.id)]},
+                {"title": 1}
+            )
+        }
+        return [
+            ActivityOut(**entry, document_title=titles[entry["document_id"]])
+            for entry in entries
+            if entry["document_id"] in titles
+        ][:limit]
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve activity: {str(e)}"
+        )
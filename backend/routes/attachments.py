@@ -0,0 +1,152 @@
+import hashlib
+import os
+import tempfile
+from anyio import to_thread
+from fastapi import APIRouter, HTTPException, Depends, File, Request, UploadFile, status
+from fastapi.responses import Response, StreamingResponse
+from core.attachments import (
+    DOWNLOAD_CSP, INLINE_TYPES, attachment_url, is_attachment_id, open_download, parse_range, store_attachment,
+    stream_range
+)
+from core.database import get_db
+from core.export import content_disposition
+from core.metrics import InstrumentedRoute
+from core.settings import settings
+from schemas import AttachmentOut
+from core.jwt import get_current_user
+from models.user import UserInDB
+
+router = APIRouter(prefix="/attachments", tags=["attachments"], route_class=InstrumentedRoute)
+
+_COPY_CHUNK = 1024 * 1024
+
+
+def _attachment_out(record: dict) -> AttachmentOut:
+    return AttachmentOut(id=record["_id"], url=attachment_url(record["_id"]), **{
+        key: record[key] for key in ("filename", "content_type", "size", "created_at")
+    })
+
+
+@router.post("/", response_model=AttachmentOut, status_code=status.HTTP_201_CREATED)
+async def upload_attachment(
+    file: UploadFile = File(...),
+    current_user: UserInDB = Depends(get_current_user),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Upload a file; identical content is stored once and gets the same URL"""
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.TemporaryFile() as spool:
+            while chunk := await file.read(_COPY_CHUNK):
+                size += len(chunk)
+                if size > settings.ATTACHMENT_MAX_BYTES:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Attachment exceeds {settings.ATTACHMENT_MAX_BYTES} bytes"
+                    )
+                digest.update(chunk)
+                await to_thread.run_sync(spool.write, chunk)
+            if not size:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Empty file"
+                )
+            spool.seek(0)
+            record = await to_thread.run_sync(
+                store_attachment,
+                db,
+                digest.hexdigest(),
+                spool,
+                size,
+                os.path.basename(file.filename or "attachment")
+            )
+        return _attachment_out(record)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload attachment: {str(e)}"
+        )
+
+
+@router.get("/{attachment_id}")
+async def download_attachment(
+    attachment_id: str,
+    request: Request,
+    db = Depends(get_db("CollabraDoc"))
+):
+    """
+    Download an attachment, honouring single-range Range requests. No bearer token
+    is needed so <img> tags work; the 256-bit content hash is not guessable.
+    """
+    try:
+        if not is_attachment_id(attachment_id):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid attachment ID format"
+            )
+
+        etag = f'"{attachment_id}"'
+        headers = {
+            "ETag": etag,
+            "Accept-Ranges": "bytes",
+            # Content-addressed: the bytes behind a URL never change
+            "Cache-Control": "private, max-age=31536000, immutable",
+            "X-Content-Type-Options": "nosniff",
+            "Content-Security-Policy": DOWNLOAD_CSP,
+        }
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        grid_out = await to_thread.run_sync(open_download, db, attachment_id)
+        if grid_out is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Attachment not found"
+            )
+
+        size = grid_out.length
+        content_type = (grid_out.metadata or {}).get("content_type", "application/octet-stream")
+        disposition = content_disposition(grid_out.filename or attachment_id)
+        if content_type in INLINE_TYPES:
+            disposition = disposition.replace("attachment", "inline", 1)
+        headers["Content-Disposition"] = disposition
+
+        # If-Range with a stale validator means the client must take the whole file
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if if_range and if_range != etag:
+            range_header = None
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            grid_out.close()
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+
+        if byte_range is None:
+            start, end, status_code = 0, size - 1, status.HTTP_200_OK
+        else:
+            (start, end), status_code = byte_range, status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+
+        return StreamingResponse(
+            stream_range(grid_out, start, end),
+            status_code=status_code,
+            media_type=content_type,
+            headers=headers
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to download attachment: {str(e)}"
+        )
@@ -1,15 +1,21 @@
 from fastapi.security  import OAuth2PasswordRequestForm
 from fastapi.responses import Response, JSONResponse
 from core.database import get_db
-from core.jwt import create_access_token
+from core.metrics import InstrumentedRoute
+from core.repositories import Repositories, get_repositories
+from core.jwt import (
+    claim_token, create_access_token, create_refresh_token, decode_access_token, decode_refresh_token, revoke_token
+)
 from core.security import verify_password
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from bson import ObjectId
 from schemas import UserOut
-from schemas import UserCreate, UserOut
+from schemas import UserCreate, UserOut, TokenRefresh, LogoutRequest
 from core.security import hash_password
 
 
-router = APIRouter(prefix="/auth", tags=["auth"])
+router = APIRouter(prefix="/auth", tags=["auth"], route_class=InstrumentedRoute)
 
 # Add OPTIONS route handler for CORS preflight requests
 @router.options("/{path:path}")
@@ -20,9 +26,9 @@ async def auth_options_handler(path: str):
 @router.post("/signup", response_model=UserOut, status_code=status.HTTP_201_CREATED)
 def create_user(
     user_in: UserCreate,
-    db = Depends(get_db("CollabraDoc"))
+    repos: Repositories = Depends(get_repositories)
 ):
-    if db.users.find_one({"email": user_in.email}):
+    if repos.users.find_one({"email": user_in.email}, {"_id": 1}):
         raise HTTPException(400, "Email already exists")
         
     hashed_password = hash_password(user_in.password)
@@ -31,22 +37,22 @@ def create_user(
 
     user_data["password"] = hashed_password
     
-    result = db.users.insert_one(user_data)
+    user_id = repos.users.insert(user_data)
 
-    return UserOut(id=str(result.inserted_id), **user_data)
+    return UserOut(id=str(user_id), **user_data)
 
 
 
 @router.post("/login")
 def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db = Depends(get_db("CollabraDoc"))
+    repos: Repositories = Depends(get_repositories)
 ):
     # With OAuth2PasswordRequestForm, username field contains the email
     email = form_data.username
     password = form_data.password
     
-    user_doc = db.users.find_one({"email": email})
+    user_doc = repos.users.find_one({"email": email})
     if not user_doc:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -64,6 +70,7 @@ def login(
         )
     
     token = create_access_token(data={"sub": str(user_doc["_id"])})
+    refresh_token = create_refresh_token(data={"sub": str(user_doc["_id"])})
 
     user_data = {
         "id" : str(user_doc["_id"]),
@@ -77,13 +84,57 @@ def login(
             "message": "Login successful",
             "user": user_data,
             "access_token": token,
+            "refresh_token": refresh_token,
+        }
+    )
+
+
+@router.post("/refresh")
+def refresh(
+    token_data: TokenRefresh,
+    repos: Repositories = Depends(get_repositories),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Exchange a refresh token for a new access/refresh token pair"""
+    payload = decode_refresh_token(token_data.refresh_token)
+    user_id = payload.get("sub")
+    if not user_id or not ObjectId.is_valid(user_id) or not repos.users.find_one({"_id": ObjectId(user_id)}, {"_id": 1}):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    # Refresh tokens are single use: rotating them limits the damage of a leaked one.
+    # The jti is claimed in the database before minting, so two concurrent refreshes
+    # with the same token (on any workers) yield one new pair, not two.
+    if not claim_token(db, payload):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "access_token": create_access_token(data={"sub": user_id}),
+            "refresh_token": create_refresh_token(data={"sub": user_id}),
         }
     )
 
 
 @router.post("/logout")
-def logout():
-    """Logout user"""
+def logout(
+    logout_data: LogoutRequest | None = None,
+    credentials: HTTPAuthorizationCredentials | None = Depends(HTTPBearer(auto_error=False)),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Logout user, revoking the presented access and refresh tokens"""
+    if credentials:
+        revoke_token(db, decode_access_token(credentials.credentials))
+    if logout_data and logout_data.refresh_token:
+        revoke_token(db, decode_refresh_token(logout_data.refresh_token))
     return JSONResponse(
         status_code=status.HTTP_200_OK,
         content={"message": "Logout successful"}
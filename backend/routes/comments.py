@@ -2,19 +2,37 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from typing import List
 from bson import ObjectId
 from datetime import datetime
-from core.database import get_db
+from core.metrics import InstrumentedRoute
+from core.permissions import COMMENTER, OWNER, VIEWER, Access, get_access
+from core.repositories import Repositories, get_repositories
+from core.trash import trash_comment
 from models.comment import Comment, CommentCreate, CommentUpdate, CommentOut
 from schemas import ErrorResponse
 from core.jwt import get_current_user
 from models.user import UserInDB
 
-router = APIRouter(prefix="/comments", tags=["comments"])
+router = APIRouter(prefix="/comments", tags=["comments"], route_class=InstrumentedRoute)
+
+
+def _find_comment(repos: Repositories, access: Access, comment_id: ObjectId) -> dict | None:
+    """
+    A comment in the request's workspace. Without X-Workspace-Id, also one on a
+    document shared from another workspace; the document check that follows
+    decides whether the caller may see it.
+    """
+    match = {"_id": comment_id, "deleted_at": None}
+    comment = repos.comments.find_one({**match, "workspace_id": access.workspace.id})
+    if comment is None and access.workspace.implicit:
+        comment = repos.comments.find_one(match)
+    return comment
+
 
 @router.post("/", response_model=CommentOut, status_code=status.HTTP_201_CREATED)
 async def create_comment(
     comment_data: CommentCreate,
     current_user: UserInDB = Depends(get_current_user),
-    db = Depends(get_db("CollabraDoc"))
+    access: Access = Depends(get_access),
+    repos: Repositories = Depends(get_repositories)
 ):
     """Create a new comment"""
     try:
@@ -27,20 +45,8 @@ async def create_comment(
                 detail="Invalid document ID format"
             )
 
-        # Check if document exists and user has access
-        document = db.documents.find_one({"_id": document_id})
-        if not document:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Document not found"
-            )
-
-        # Check if user has access to this document
-        if not document.get("isPublic") and str(document.get("owner_id")) != str(current_user.id):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
+        # Check if document exists and user may comment on it
+        access.require("documents", document_id, COMMENTER)
 
         # Validate parent_id if provided
         parent_id = None
@@ -48,7 +54,9 @@ async def create_comment(
             try:
                 parent_id = ObjectId(comment_data.parent_id)
                 # Check if parent comment exists
-                parent_comment = db.comments.find_one({"_id": parent_id})
+                parent_comment = repos.comments.find_one(
+                    {"_id": parent_id, "workspace_id": access.workspace.id, "document_id": document_id, "deleted_at": None}
+                )
                 if not parent_comment:
                     raise HTTPException(
                         status_code=status.HTTP_404_NOT_FOUND,
@@ -62,6 +70,7 @@ async def create_comment(
 
         # Create comment
         comment_dict = {
+            "workspace_id": access.workspace.id,
             "document_id": document_id,
             "content": comment_data.content,
             "author": {
@@ -79,10 +88,10 @@ async def create_comment(
             "parent_id": parent_id
         }
 
-        result = db.comments.insert_one(comment_dict)
+        comment_id = repos.comments.insert(comment_dict)
         
         # Get the created comment
-        created_comment = db.comments.find_one({"_id": result.inserted_id})
+        created_comment = repos.comments.find_one({"_id": comment_id})
         
         # Convert ObjectIds to strings
         created_comment["id"] = str(created_comment["_id"])
@@ -104,7 +113,8 @@ async def create_comment(
 async def get_document_comments(
     document_id: str,
     current_user: UserInDB = Depends(get_current_user),
-    db = Depends(get_db("CollabraDoc"))
+    access: Access = Depends(get_access),
+    repos: Repositories = Depends(get_repositories)
 ):
     """Get all comments for a document"""
     try:
@@ -118,25 +128,15 @@ async def get_document_comments(
             )
 
         # Check if document exists and user has access
-        document = db.documents.find_one({"_id": obj_id})
-        if not document:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Document not found"
-            )
-
-        # Check if user has access to this document
-        if not document.get("isPublic") and str(document.get("owner_id")) != str(current_user.id):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
+        access.require("documents", obj_id, VIEWER)
 
         # Get all comments for the document (only top-level comments)
-        comments = list(db.comments.find({
+        comments = repos.comments.find({
+            "workspace_id": access.workspace.id,
             "document_id": obj_id,
-            "parent_id": None
-        }).sort("created_at", -1))
+            "parent_id": None,
+            "deleted_at": None
+        }, sort=[("created_at", -1)])
 
         # Convert ObjectIds to strings and get replies
         for comment in comments:
@@ -146,9 +146,12 @@ async def get_document_comments(
                 comment["parent_id"] = str(comment["parent_id"])
 
             # Get replies for this comment
-            replies = list(db.comments.find({
-                "parent_id": comment["_id"]
-            }).sort("created_at", 1))
+            replies = repos.comments.find({
+                "workspace_id": access.workspace.id,
+                "document_id": obj_id,
+                "parent_id": comment["_id"],
+                "deleted_at": None
+            }, sort=[("created_at", 1)])
 
             for reply in replies:
                 reply["id"] = str(reply["_id"])
@@ -172,7 +175,8 @@ async def get_document_comments(
 async def get_comment(
     comment_id: str,
     current_user: UserInDB = Depends(get_current_user),
-    db = Depends(get_db("CollabraDoc"))
+    access: Access = Depends(get_access),
+    repos: Repositories = Depends(get_repositories)
 ):
     """Get a specific comment by ID"""
     try:
@@ -185,7 +189,7 @@ async def get_comment(
                 detail="Invalid comment ID format"
             )
 
-        comment = db.comments.find_one({"_id": obj_id})
+        comment = _find_comment(repos, access, obj_id)
         if not comment:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -193,18 +197,7 @@ async def get_comment(
             )
 
         # Check if user has access to the document
-        document = db.documents.find_one({"_id": comment["document_id"]})
-        if not document:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Document not found"
-            )
-
-        if not document.get("isPublic") and str(document.get("owner_id")) != str(current_user.id):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
+        access.require("documents", comment["document_id"], VIEWER)
 
         # Convert ObjectIds to strings
         comment["id"] = str(comment["_id"])
@@ -213,9 +206,11 @@ async def get_comment(
             comment["parent_id"] = str(comment["parent_id"])
 
         # Get replies
-        replies = list(db.comments.find({
-            "parent_id": comment["_id"]
-        }).sort("created_at", 1))
+        replies = repos.comments.find({
+            "workspace_id": access.workspace.id,
+            "parent_id": comment["_id"],
+            "deleted_at": None
+        }, sort=[("created_at", 1)])
 
         for reply in replies:
             reply["id"] = str(reply["_id"])
@@ -240,7 +235,8 @@ async def update_comment(
     comment_id: str,
     comment_data: CommentUpdate,
     current_user: UserInDB = Depends(get_current_user),
-    db = Depends(get_db("CollabraDoc"))
+    access: Access = Depends(get_access),
+    repos: Repositories = Depends(get_repositories)
 ):
     """Update a comment"""
     try:
@@ -254,19 +250,20 @@ async def update_comment(
             )
 
         # Check if comment exists
-        comment = db.comments.find_one({"_id": obj_id})
+        comment = _find_comment(repos, access, obj_id)
         if not comment:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Comment not found"
             )
 
-        # Check if user owns the comment
+        # Check if user owns the comment and can still comment on the document
         if str(comment.get("author", {}).get("id")) != str(current_user.id):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Access denied"
             )
+        access.require("documents", comment["document_id"], COMMENTER)
 
         # Prepare update data
         update_data = {"updated_at": datetime.utcnow()}
@@ -276,28 +273,30 @@ async def update_comment(
             update_data["resolved"] = comment_data.resolved
 
         # Update comment
-        result = db.comments.update_one(
+        modified = repos.comments.update_one(
             {"_id": obj_id},
             {"$set": update_data}
         )
 
-        if result.modified_count == 0:
+        if modified == 0:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to update comment"
             )
 
         # Get updated comment
-        updated_comment = db.comments.find_one({"_id": obj_id})
+        updated_comment = repos.comments.find_one({"_id": obj_id})
         updated_comment["id"] = str(updated_comment["_id"])
         updated_comment["document_id"] = str(updated_comment["document_id"])
         if updated_comment.get("parent_id"):
             updated_comment["parent_id"] = str(updated_comment["parent_id"])
 
         # Get replies
-        replies = list(db.comments.find({
-            "parent_id": updated_comment["_id"]
-        }).sort("created_at", 1))
+        replies = repos.comments.find({
+            "workspace_id": access.workspace.id,
+            "parent_id": updated_comment["_id"],
+            "deleted_at": None
+        }, sort=[("created_at", 1)])
 
         for reply in replies:
             reply["id"] = str(reply["_id"])
@@ -321,7 +320,8 @@ async def update_comment(
 async def delete_comment(
     comment_id: str,
     current_user: UserInDB = Depends(get_current_user),
-    db = Depends(get_db("CollabraDoc"))
+    access: Access = Depends(get_access),
+    repos: Repositories = Depends(get_repositories)
 ):
     """Delete a comment"""
     try:
@@ -335,7 +335,7 @@ async def delete_comment(
             )
 
         # Check if comment exists
-        comment = db.comments.find_one({"_id": obj_id})
+        comment = _find_comment(repos, access, obj_id)
         if not comment:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -343,31 +343,13 @@ async def delete_comment(
             )
 
         # Check if user owns the comment or is document owner
-        document = db.documents.find_one({"_id": comment["document_id"]})
-        if not document:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Document not found"
-            )
-
-        is_comment_owner = str(comment.get("author", {}).get("id")) == str(current_user.id)
-        is_document_owner = str(document.get("owner_id")) == str(current_user.id)
-
-        if not is_comment_owner and not is_document_owner:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
-
-        # Delete comment and all its replies
-        result = db.comments.delete_many({
-            "$or": [
-                {"_id": obj_id},
-                {"parent_id": obj_id}
-            ]
-        })
+        if str(comment.get("author", {}).get("id")) == str(current_user.id):
+            access.require("documents", comment["document_id"], VIEWER)
+        else:
+            access.require("documents", comment["document_id"], OWNER)
 
-        if result.deleted_count == 0:
+        # Trash comment and all its replies; the purger deletes them later
+        if not trash_comment(repos, obj_id, current_user.id):
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to delete comment"
@@ -1,20 +1,51 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Query
+from fastapi.responses import StreamingResponse
+from anyio import to_thread
 from typing import List
 from bson import ObjectId
+from pymongo import ReturnDocument
 from datetime import datetime
-from core.database import get_db
-from models.document import Document, DocumentCreate, DocumentUpdate
-from schemas import DocumentOut, ErrorResponse
+from core.database import get_db, get_read_db
+from core.metrics import InstrumentedRoute
+from core.presence import presence
+from models.document import Document, DocumentCreate, DocumentUpdate, BlockEdits
+from schemas import (
+    BlockInfo, BlockOut, DocumentOut, DocumentOutlineOut, DocumentSummaryOut, ScoredDocumentOut, ShareCreate, ShareOut,
+    TrashedDocumentOut, ErrorResponse
+)
 from core.jwt import get_current_user
+from core.semantic import semantic_index, document_text
+from core.minhash import lsh_index, signature_bytes
+from core.settings import settings
+from core.executor import run_cpu_bound
+from core.export import FORMATS, convert, iter_chunks, safe_filename, content_disposition
+from core.projections import DOCUMENT_OUT, DOCUMENT_SUMMARY, TRASH_SUMMARY, find_projected
+from core.summary import document_summary
+from core.activity import activity
+from core.permissions import (
+    EDITOR, OWNER, VIEWER, Access, access_fields, describe_shares, get_access, move_record, refresh_readers,
+    listing_filter, resolve_share_user, set_share, visible_filter
+)
+from core.workspaces import GUEST, Workspace, get_workspace, set_member
+from core.blocks import (
+    BlockNotFound, apply_block_edits, assemble_content, ensure_blocks, load_content, plan_block_edits,
+    schedule_assembly, sync_blocks, version_filter
+)
+from core.attachments import extract_inline_images, referenced_attachments, update_references
+from core.trash import TRASHED, purge_at, restore_document, trash_documents
+from core.merge import Conflict, merge3
+from core.versions import current_version, record_version, version_snapshot
+from core.public import public_snapshots
 from models.user import UserInDB
 
-router = APIRouter(prefix="/documents", tags=["documents"])
+router = APIRouter(prefix="/documents", tags=["documents"], route_class=InstrumentedRoute)
 
 
 @router.post("/", response_model=DocumentOut, status_code=status.HTTP_201_CREATED)
 async def create_document(
     document_data: DocumentCreate,
     current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
     db = Depends(get_db("CollabraDoc"))
 ):
     """Create a new document"""
@@ -29,19 +60,34 @@ async def create_document(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Invalid folder ID format"
                 )
+            access.require("folders", folder_id, EDITOR)
+        else:
+            access.workspace.require_member()
 
         # Create document document
+        content = extract_inline_images(db, document_data.content)
         document_dict = {
             "title": document_data.title,
-            "content": document_data.content,
+            "content": content,
             "folder_id": folder_id,
+            "workspace_id": access.workspace.id,
             "isPublic": document_data.isPublic,
             "owner_id": current_user.id,
+            "attachments": sorted(referenced_attachments(content)),
+            "last_edited_by": current_user.id,
             "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
+            "updated_at": datetime.utcnow(),
+            **access_fields(db, current_user.id, folder_id, document_data.isPublic)
         }
+        document_dict.update(await run_cpu_bound(document_summary, content, size=len(content)))
+        text = document_text(document_dict)
+        document_dict["minhash"] = signature_bytes(text)
         
         result = db.documents.insert_one(document_dict)
+        update_references(db, set(document_dict["attachments"]), set())
+        record_version(db, result.inserted_id, access.workspace.id, 0, document_dict["title"], content)
+        semantic_index.upsert(access.workspace.id, str(result.inserted_id), text)
+        lsh_index.upsert(access.workspace.id, str(result.inserted_id), document_dict["minhash"])
         
         # Get the created document
         created_document = db.documents.find_one({"_id": result.inserted_id})
@@ -54,6 +100,8 @@ async def create_document(
         
         return DocumentOut(**created_document)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -63,33 +111,25 @@ async def create_document(
 
 @router.get("/", response_model=List[DocumentOut])
 async def get_documents(
+    dedup: bool = Query(False, description="Collapse near-duplicate documents, keeping the most recent"),
     current_user: UserInDB = Depends(get_current_user),
-    db = Depends(get_db("CollabraDoc"))
+    workspace: Workspace = Depends(get_workspace),
+    db = Depends(get_read_db("CollabraDoc"))
 ):
     """Get all documents for the current user"""
     try:
         # Get documents owned by user or public documents
-        documents = list(db.documents.find({
-            "$or": [
-                {"owner_id": current_user.id},
-                {"isPublic": True}
-            ]
-        }).sort("updated_at", -1))
-        
-        # Convert ObjectIds to strings
-        for doc in documents:
-            doc["id"] = str(doc["_id"])
-            doc["owner_id"] = str(doc["owner_id"])
-            if doc.get("folder_id"):
-                doc["folder_id"] = str(doc["folder_id"])
-            
-            # Add default timestamps if missing (for existing documents)
-            if "created_at" not in doc:
-                doc["created_at"] = datetime.utcnow()
-            if "updated_at" not in doc:
-                doc["updated_at"] = doc.get("created_at", datetime.utcnow())
+        documents = find_projected(
+            db.documents,
+            listing_filter(current_user.id, workspace),
+            DOCUMENT_OUT,
+            sort=[("updated_at", -1)]
+        )
+        if dedup:
+            documents = _dedupe(documents, workspace)
+        online = presence.document_counts(doc["id"] for doc in documents)
         
-        return [DocumentOut(**doc) for doc in documents]
+        return [DocumentOut(**doc, online_users=online[doc["id"]]) for doc in documents]
         
     except Exception as e:
         raise HTTPException(
@@ -98,35 +138,113 @@ async def get_documents(
         )
 
 
+def _dedupe(documents: list[dict], workspace: Workspace) -> list[dict]:
+    """Drop documents that are near-duplicates of one earlier in the list"""
+    kept = set(lsh_index.get(workspace.id).dedupe([doc["id"] for doc in documents], settings.DEDUP_THRESHOLD))
+    return [doc for doc in documents if doc["id"] in kept]
+
+
+def _visible_documents_by_rank(
+    db, ranked: list[tuple[str, float]], current_user: UserInDB, workspace: Workspace, limit: int
+) -> list[dict]:
+    """Load ranked document ids the user may see, keeping rank order and attaching scores"""
+    scores = dict(ranked)
+    documents = find_projected(
+        db.documents,
+        {"$and": [
+            {"_id": {"$in": [ObjectId(doc_id) for doc_id, _ in ranked]}},
+            listing_filter(current_user.id, workspace)
+        ]},
+        DOCUMENT_OUT
+    )
+    result = []
+    for doc in documents:
+        doc["score"] = scores[doc["id"]]
+        result.append(doc)
+    result.sort(key=lambda doc: doc["score"], reverse=True)
+    return result[:limit]
+
+
+def _keyword_filter(q: str, current_user: UserInDB, workspace: Workspace) -> dict:
+    return {"$and": [
+        listing_filter(current_user.id, workspace),
+        {"$or": [
+            {"title": {"$regex": q, "$options": "i"}},
+            {"content": {"$regex": q, "$options": "i"}}
+        ]}
+    ]}
+
+
+@router.get("/summaries", response_model=List[DocumentSummaryOut])
+async def get_document_summaries(
+    q: str = Query(None, description="Keyword filter on title and content"),
+    dedup: bool = Query(False, description="Collapse near-duplicate documents, keeping the most recent"),
+    current_user: UserInDB = Depends(get_current_user),
+    workspace: Workspace = Depends(get_workspace),
+    db = Depends(get_read_db("CollabraDoc"))
+):
+    """List or keyword-search documents as title, excerpt and stats, without their content"""
+    try:
+        if q:
+            match = _keyword_filter(q, current_user, workspace)
+        else:
+            match = listing_filter(current_user.id, workspace)
+        documents = find_projected(db.documents, match, DOCUMENT_SUMMARY, sort=[("updated_at", -1)])
+        if dedup:
+            documents = _dedupe(documents, workspace)
+        online = presence.document_counts(doc["id"] for doc in documents)
+        return [DocumentSummaryOut(**doc, online_users=online[doc["id"]]) for doc in documents]
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve document summaries: {str(e)}"
+        )
+
+
+@router.get("/trash", response_model=List[TrashedDocumentOut])
+async def get_trashed_documents(
+    current_user: UserInDB = Depends(get_current_user),
+    workspace: Workspace = Depends(get_workspace),
+    db = Depends(get_read_db("CollabraDoc"))
+):
+    """The current user's deleted documents in this workspace, most recently deleted first"""
+    try:
+        documents = find_projected(
+            db.documents,
+            {"workspace_id": workspace.id, "owner_id": current_user.id, **TRASHED},
+            TRASH_SUMMARY,
+            sort=[("deleted_at", -1)]
+        )
+        return [TrashedDocumentOut(**doc, purge_at=purge_at(doc["deleted_at"])) for doc in documents]
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve trash: {str(e)}"
+        )
+
+
 @router.get("/search", response_model=List[DocumentOut])
 async def search_documents(
     q: str = Query(..., description="Search query"),
+    mode: str = Query("keyword", pattern="^(keyword|semantic)$", description="keyword (substring) or semantic (similarity)"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum results for semantic mode"),
+    dedup: bool = Query(False, description="Collapse near-duplicate documents, keeping the best ranked"),
     current_user: UserInDB = Depends(get_current_user),
-    db = Depends(get_db("CollabraDoc"))
+    workspace: Workspace = Depends(get_workspace),
+    db = Depends(get_read_db("CollabraDoc"))
 ):
-    """Search documents by title or content (case-insensitive, partial match)"""
+    """Search documents by title or content (case-insensitive, partial match) or by similarity"""
     try:
-        documents = list(db.documents.find({
-            "$and": [
-                {"$or": [
-                    {"owner_id": current_user.id},
-                    {"isPublic": True}
-                ]},
-                {"$or": [
-                    {"title": {"$regex": q, "$options": "i"}},
-                    {"content": {"$regex": q, "$options": "i"}}
-                ]}
-            ]
-        }).sort("updated_at", -1))
-        for doc in documents:
-            doc["id"] = str(doc["_id"])
-            doc["owner_id"] = str(doc["owner_id"])
-            if doc.get("folder_id"):
-                doc["folder_id"] = str(doc["folder_id"])
-            if "created_at" not in doc:
-                doc["created_at"] = datetime.utcnow()
-            if "updated_at" not in doc:
-                doc["updated_at"] = doc.get("created_at", datetime.utcnow())
+        if mode == "semantic":
+            # Over-fetch so documents the user can't see don't starve the result
+            ranked = semantic_index.get(workspace.id).search([q], limit * 4)[0]
+            documents = _visible_documents_by_rank(db, ranked, current_user, workspace, limit) if ranked else []
+        else:
+            documents = find_projected(
+                db.documents, _keyword_filter(q, current_user, workspace), DOCUMENT_OUT, sort=[("updated_at", -1)]
+            )
+        if dedup:
+            documents = _dedupe(documents, workspace)
         return [DocumentOut(**doc) for doc in documents]
     except Exception as e:
         raise HTTPException(
@@ -135,10 +253,396 @@ async def search_documents(
         )
 
 
+@router.get("/{document_id}/related", response_model=List[ScoredDocumentOut])
+async def get_related_documents(
+    document_id: str,
+    limit: int = Query(10, ge=1, le=50),
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
+    db = Depends(get_read_db("CollabraDoc"))
+):
+    """Documents most similar to the given one"""
+    try:
+        try:
+            obj_id = ObjectId(document_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid document ID format"
+            )
+
+        access.require("documents", obj_id, VIEWER)
+
+        ranked = semantic_index.get(access.workspace.id).related(document_id, limit * 4)
+        documents = _visible_documents_by_rank(db, ranked, current_user, access.workspace, limit) if ranked else []
+        return [ScoredDocumentOut(**doc) for doc in documents]
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve related documents: {str(e)}"
+        )
+
+
+@router.get("/{document_id}/duplicates", response_model=List[ScoredDocumentOut])
+async def get_duplicate_documents(
+    document_id: str,
+    threshold: float = Query(None, ge=0.1, le=1.0, description="Minimum estimated similarity"),
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
+    db = Depends(get_read_db("CollabraDoc"))
+):
+    """Near-duplicates of a document, by estimated Jaccard similarity of word shingles"""
+    try:
+        try:
+            obj_id = ObjectId(document_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid document ID format"
+            )
+
+        access.require("documents", obj_id, VIEWER)
+
+        ranked = lsh_index.get(access.workspace.id).duplicates(document_id, threshold or settings.DEDUP_THRESHOLD)
+        documents = _visible_documents_by_rank(
+            db, ranked, current_user, access.workspace, len(ranked)
+        ) if ranked else []
+        return [ScoredDocumentOut(**doc) for doc in documents]
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve duplicate documents: {str(e)}"
+        )
+
+
+@router.get("/{document_id}/export")
+async def export_document(
+    document_id: str,
+    format: str = Query("md", pattern="^(md|html|txt)$", description="Output format"),
+    metadata: bool = Query(False, description="Prepend a front matter block (md only)"),
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Download a document as Markdown, HTML or plain text"""
+    try:
+        try:
+            obj_id = ObjectId(document_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid document ID format"
+            )
+
+        document = access.require(
+            "documents", obj_id, VIEWER, fields=("title", "content", "content_stale", "updated_at")
+        )
+
+        source = {key: document.get(key) for key in ("title", "updated_at")}
+        source["content"] = load_content(db, document)
+        text = await run_cpu_bound(convert, source, format, metadata, size=len(source["content"] or ""))
+        media_type, extension = FORMATS[format]
+        filename = f"{safe_filename(source['title'] or '')}.{extension}"
+        return StreamingResponse(
+            iter_chunks(text.encode(), settings.EXPORT_CHUNK_BYTES),
+            media_type=media_type,
+            headers={"Content-Disposition": content_disposition(filename)}
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to export document: {str(e)}"
+        )
+
+
+def _document_outline(db, document: dict) -> DocumentOutlineOut:
+    blocks = [
+        BlockInfo(id=str(row["_id"]), **{key: row.get(key) for key in ("position", "size", "heading", "level")})
+        for row in db.document_blocks.find({"document_id": document["_id"]}, {"html": 0}).sort("position", 1)
+    ]
+    return DocumentOutlineOut(
+        id=str(document["_id"]),
+        title=document["title"],
+        size=sum(block.size for block in blocks),
+        updated_at=document["updated_at"],
+        version=current_version(document),
+        blocks=blocks
+    )
+
+
+@router.get("/{document_id}/outline", response_model=DocumentOutlineOut)
+async def get_document_outline(
+    document_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Block list with sizes and headings, so large documents can be loaded a viewport at a time"""
+    try:
+        try:
+            obj_id = ObjectId(document_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid document ID format"
+            )
+
+        document = access.require(
+            "documents", obj_id, VIEWER, fields=("title", "updated_at", "blocks_synced", "blocks_version")
+        )
+
+        await to_thread.run_sync(ensure_blocks, db, document)
+        activity.record("view", str(obj_id), current_user.id, access.workspace.id)
+        return await to_thread.run_sync(_document_outline, db, document)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve document outline: {str(e)}"
+        )
+
+
+@router.get("/{document_id}/blocks", response_model=List[BlockOut])
+async def get_document_blocks(
+    document_id: str,
+    ids: str = Query(None, description="Comma-separated block ids; otherwise blocks in order from start"),
+    start: int = Query(0, ge=0, description="Index of the first block to return"),
+    limit: int = Query(None, ge=1, le=500),
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """HTML of selected blocks of a document"""
+    try:
+        try:
+            obj_id = ObjectId(document_id)
+            block_ids = [ObjectId(block_id) for block_id in ids.split(",") if block_id] if ids else None
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid document or block ID format"
+            )
+
+        document = access.require("documents", obj_id, VIEWER, fields=("blocks_synced",))
+
+        await to_thread.run_sync(ensure_blocks, db, document)
+        query = {"document_id": obj_id}
+        if block_ids is not None:
+            query["_id"] = {"$in": block_ids}
+        cursor = db.document_blocks.find(query, {"position": 1, "html": 1}).sort("position", 1)
+        if block_ids is None:
+            cursor = cursor.skip(start).limit(limit or settings.BLOCK_PAGE_SIZE)
+        return [BlockOut(id=str(row["_id"]), position=row["position"], html=row["html"]) for row in cursor]
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve document blocks: {str(e)}"
+        )
+
+
+@router.patch("/{document_id}/blocks", response_model=DocumentOutlineOut)
+async def edit_document_blocks(
+    document_id: str,
+    block_edits: BlockEdits,
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """
+    Replace, insert or delete individual blocks of the version the outline was
+    loaded at. Only the touched blocks are written; content, summary and search
+    data catch up in a background job. 409 if the document was saved since.
+    """
+    try:
+        try:
+            obj_id = ObjectId(document_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid document ID format"
+            )
+
+        document = access.require("documents", obj_id, EDITOR, fields=("title", "blocks_synced", "blocks_version"))
+        stale_message = "The document changed since the outline was loaded; reload it"
+        if current_version(document) != block_edits.base_version:
+            raise _version_conflict(stale_message, current_version(document), [])
+
+        await to_thread.run_sync(ensure_blocks, db, document)
+        edits = [edit.model_dump() for edit in block_edits.edits]
+        for edit in edits:
+            if edit["html"] is not None:
+                edit["html"] = extract_inline_images(db, edit["html"])
+        try:
+            operations = await to_thread.run_sync(plan_block_edits, db, obj_id, edits)
+        except BlockNotFound as e:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Block {e} not found; reload the outline"
+            )
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+
+        # Take the next version before writing: a save that landed since is refused here,
+        # and one made against the version we replace fails its own base_version check
+        now = datetime.utcnow()
+        saved = db.documents.find_one_and_update(
+            {"_id": obj_id, **version_filter(block_edits.base_version)},
+            {
+                "$set": {
+                    "content_stale": True,
+                    "blocks_synced": True,
+                    "last_edited_by": current_user.id,
+                    "updated_at": now
+                },
+                "$inc": {"blocks_version": 1}
+            },
+            projection={"blocks_version": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if saved is None:
+            latest = db.documents.find_one({"_id": obj_id}, {"blocks_version": 1}) or {}
+            raise _version_conflict(stale_message, current_version(latest), [])
+        await to_thread.run_sync(apply_block_edits, db, operations)
+        schedule_assembly(db, obj_id, current_user.id)
+        public_snapshots.invalidate(obj_id)
+        activity.record("edit", str(obj_id), current_user.id, access.workspace.id)
+        return await to_thread.run_sync(
+            _document_outline, db, {**document, "updated_at": now, "blocks_version": saved["blocks_version"]}
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to edit document blocks: {str(e)}"
+        )
+
+
+@router.get("/{document_id}/shares", response_model=List[ShareOut])
+async def get_document_shares(
+    document_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Who the document is shared with, directly or through its folders"""
+    try:
+        try:
+            obj_id = ObjectId(document_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid document ID format"
+            )
+
+        document = access.require("documents", obj_id, EDITOR)
+        return [ShareOut(**share) for share in describe_shares(db, document)]
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve shares: {str(e)}"
+        )
+
+
+@router.put("/{document_id}/shares", response_model=List[ShareOut])
+async def share_document(
+    document_id: str,
+    share: ShareCreate,
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Share the document with a user as viewer, commenter or editor, replacing any earlier grant"""
+    try:
+        try:
+            obj_id = ObjectId(document_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid document ID format"
+            )
+
+        access.require("documents", obj_id, OWNER)
+        user_id = resolve_share_user(db, share.user_id, share.email)
+        if user_id == str(current_user.id):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The owner already has full access"
+            )
+        # Sharing with someone outside the workspace brings them in as a guest
+        set_member(db, access.workspace.id, user_id, GUEST, keep_existing=True)
+        set_share(db, "documents", obj_id, user_id, share.role)
+        access.forget("documents", obj_id)
+        document = access.require("documents", obj_id, OWNER)
+        return [ShareOut(**share) for share in describe_shares(db, document)]
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to share document: {str(e)}"
+        )
+
+
+@router.delete("/{document_id}/shares/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def unshare_document(
+    document_id: str,
+    user_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Revoke a user's direct access; access through a shared folder is unaffected"""
+    try:
+        try:
+            obj_id = ObjectId(document_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid document ID format"
+            )
+
+        access.require("documents", obj_id, OWNER)
+        user_id = resolve_share_user(db, user_id, None)
+        set_share(db, "documents", obj_id, user_id, None)
+        access.forget("documents", obj_id)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to unshare document: {str(e)}"
+        )
+
+
 @router.get("/{document_id}", response_model=DocumentOut)
 async def get_document(
     document_id: str,
     current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
     db = Depends(get_db("CollabraDoc"))
 ):
     """Get a specific document by ID"""
@@ -152,33 +656,28 @@ async def get_document(
                 detail="Invalid document ID format"
             )
         
-        document = db.documents.find_one({"_id": obj_id})
-        
-        if not document:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Document not found"
+        # The visibility filter rides along on the one query; only a miss needs a closer look
+        documents = find_projected(
+            db.documents, {"_id": obj_id, **visible_filter(current_user.id, access.workspace.id)}, DOCUMENT_OUT,
+            limit=1
+        )
+        if not documents:
+            access.require("documents", obj_id, VIEWER)
+            # Shared from another workspace: the check above moved the request there
+            documents = find_projected(
+                db.documents, {"_id": obj_id, **visible_filter(current_user.id, access.workspace.id)}, DOCUMENT_OUT,
+                limit=1
             )
-        
-        # Check if user has access to this document
-        if not document.get("isPublic") and str(document.get("owner_id")) != str(current_user.id):
+        if not documents:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Access denied"
             )
+        document = documents[0]
         
-        # Convert ObjectIds to strings
-        document["id"] = str(document["_id"])
-        document["owner_id"] = str(document["owner_id"])
-        if document.get("folder_id"):
-            document["folder_id"] = str(document["folder_id"])
-        
-        # Add default timestamps if missing (for existing documents)
-        if "created_at" not in document:
-            document["created_at"] = datetime.utcnow()
-        if "updated_at" not in document:
-            document["updated_at"] = document.get("created_at", datetime.utcnow())
-        
+        if document.pop("content_stale"):
+            document["content"] = assemble_content(db, obj_id)
+        activity.record("view", document["id"], current_user.id, access.workspace.id)
         return DocumentOut(**document)
         
     except HTTPException:
@@ -195,6 +694,7 @@ async def update_document(
     document_id: str,
     document_data: DocumentUpdate,
     current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
     db = Depends(get_db("CollabraDoc"))
 ):
     """Update a document"""
@@ -208,26 +708,40 @@ async def update_document(
                 detail="Invalid document ID format"
             )
         
-        # Check if document exists and user owns it
-        document = db.documents.find_one({"_id": obj_id})
-        if not document:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Document not found"
-            )
-        
-        if str(document.get("owner_id")) != str(current_user.id):
+        # Editors may change the text; visibility and location stay with the owner
+        document = access.require("documents", obj_id, EDITOR, fields=None)
+        current_folder = str(document["folder_id"]) if document.get("folder_id") else None
+        moves = document_data.folder_id is not None and (document_data.folder_id or None) != current_folder
+        publishes = document_data.isPublic is not None and document_data.isPublic != bool(document.get("isPublic"))
+        if (moves or publishes) and access.role("documents", obj_id) != OWNER:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
+                detail="Only the owner can change visibility or folder"
             )
         
+        version = current_version(document)
+        if document_data.base_version is not None and document_data.base_version != version:
+            # Others saved since this edit began; fold it into their version instead of overwriting it
+            await _merge_concurrent_edit(db, document, document_data)
+
         # Prepare update data
         update_data = {}
+        content_changed = False
         if document_data.title is not None:
             update_data["title"] = document_data.title
         if document_data.content is not None:
-            update_data["content"] = document_data.content
+            update_data["content"] = extract_inline_images(db, document_data.content)
+            update_data["attachments"] = sorted(referenced_attachments(update_data["content"]))
+            # Autosave often rewrites an unchanged body; only re-derive the summary when it moved
+            content_changed = update_data["content"] != document.get("content") or document.get("content_stale")
+            if content_changed or "excerpt" not in document:
+                update_data.update(await run_cpu_bound(
+                    document_summary, update_data["content"], size=len(update_data["content"])
+                ))
+            if content_changed:
+                # A full save supersedes pending block edits; blocks are re-split from it
+                update_data["content_stale"] = False
+                update_data["blocks_synced"] = False
         if document_data.isPublic is not None:
             update_data["isPublic"] = document_data.isPublic
         if document_data.folder_id is not None:
@@ -239,27 +753,75 @@ async def update_document(
                         status_code=status.HTTP_400_BAD_REQUEST,
                         detail="Invalid folder ID format"
                     )
+                access.require("folders", update_data["folder_id"], EDITOR)
             else:
                 update_data["folder_id"] = None
         
+        update_data["last_edited_by"] = current_user.id
         update_data["updated_at"] = datetime.utcnow()
+
+        text = None
+        if "title" in update_data or "content" in update_data:
+            text = document_text({**document, "content": load_content(db, document), **update_data})
+            update_data["minhash"] = signature_bytes(text)
         
         # Update document
-        result = db.documents.update_one(
-            {"_id": obj_id},
-            {"$set": update_data}
+        changes = {"$set": update_data}
+        match = {"_id": obj_id}
+        guarded = content_changed and document_data.base_version is not None
+        if content_changed:
+            changes["$inc"] = {"blocks_version": 1}
+        if guarded:
+            # Only over the version that was merged against
+            match.update(version_filter(version))
+        # Read back the version this write produced: an unguarded save may land on top of others
+        saved = db.documents.find_one_and_update(
+            match, changes, projection={"blocks_version": 1}, return_document=ReturnDocument.AFTER
         )
         
-        if result.modified_count == 0:
+        if saved is None:
+            if guarded:
+                latest = db.documents.find_one({"_id": obj_id}, {"blocks_version": 1}) or {}
+                raise _version_conflict(
+                    "The document changed while saving; retry with the same base_version", current_version(latest), []
+                )
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to update document"
             )
+        if content_changed:
+            await to_thread.run_sync(
+                record_version, db, obj_id, access.workspace.id, current_version(saved),
+                update_data.get("title", document.get("title", "")), update_data["content"]
+            )
         
+        if "attachments" in update_data:
+            previous = set(document.get("attachments", []))
+            current = set(update_data["attachments"])
+            update_references(db, current - previous, previous - current)
+
+        if "folder_id" in update_data and update_data["folder_id"] != document.get("folder_id"):
+            move_record(db, "documents", obj_id, update_data["folder_id"])
+        elif "isPublic" in update_data:
+            refresh_readers(db.documents, {"_id": obj_id})
+
+        if content_changed and len(update_data["content"]) > settings.BLOCK_TARGET_BYTES:
+            # Large documents are opened block by block; re-split now so the next open needn't
+            await to_thread.run_sync(
+                sync_blocks, db, obj_id, update_data["content"], current_version(saved)
+            )
+
         # Get updated document
         updated_document = db.documents.find_one({"_id": obj_id})
+        updated_document["content"] = load_content(db, updated_document)
+        public_snapshots.refresh(updated_document)
+        activity.record("edit", str(obj_id), current_user.id, access.workspace.id)
+        if text is not None:
+            semantic_index.upsert(access.workspace.id, document_id, text)
+            lsh_index.upsert(access.workspace.id, document_id, update_data["minhash"])
         updated_document["id"] = str(updated_document["_id"])
         updated_document["owner_id"] = str(updated_document["owner_id"])
+        updated_document["version"] = current_version(updated_document)
         if updated_document.get("folder_id"):
             updated_document["folder_id"] = str(updated_document["folder_id"])
         
@@ -274,13 +836,50 @@ async def update_document(
         )
 
 
+def _version_conflict(message: str, version: int, conflicts: List[Conflict]) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail={"message": message, "version": version, "conflicts": [conflict.to_dict() for conflict in conflicts]}
+    )
+
+
+async def _merge_concurrent_edit(db, document: dict, document_data: DocumentUpdate):
+    """
+    Three-way merge of the client's title and content with what was saved since
+    its base_version. Rewrites document_data in place, or raises 409 with the
+    overlapping edits if the two really disagree.
+    """
+    version = current_version(document)
+    base = await to_thread.run_sync(version_snapshot, db, document["_id"], document_data.base_version)
+    if base is None:
+        raise _version_conflict("Base version is no longer available; reload the document", version, [])
+    conflicts = []
+    if document_data.title is not None:
+        base_title = base.get("title", "")
+        current_title = document.get("title", "")
+        if document_data.title == base_title:
+            # Untouched by this client; keep whatever was saved since
+            document_data.title = None
+        elif current_title not in (base_title, document_data.title):
+            conflicts.append(Conflict(base_title, current_title, document_data.title))
+    if document_data.content is not None:
+        current = load_content(db, document)
+        incoming = extract_inline_images(db, document_data.content)
+        merged = await run_cpu_bound(merge3, base.get("content", ""), current, incoming, size=len(current))
+        conflicts.extend(merged.conflicts)
+        document_data.content = merged.text
+    if conflicts:
+        raise _version_conflict("Conflicting edits; reload and reapply yours", version, conflicts)
+
+
 @router.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_document(
     document_id: str,
     current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
     db = Depends(get_db("CollabraDoc"))
 ):
-    """Delete a document"""
+    """Move a document to the trash; it can be restored until TRASH_RETENTION_SECONDS have passed"""
     try:
         # Validate ObjectId format
         try:
@@ -292,27 +891,15 @@ async def delete_document(
             )
         
         # Check if document exists and user owns it
-        document = db.documents.find_one({"_id": obj_id})
-        if not document:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Document not found"
-            )
-        
-        if str(document.get("owner_id")) != str(current_user.id):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
-        
-        # Delete document
-        result = db.documents.delete_one({"_id": obj_id})
+        access.require("documents", obj_id, OWNER)
         
-        if result.deleted_count == 0:
+        # Move it to the trash; comments, blocks and attachments go when the purger removes it
+        if not trash_documents(db, [obj_id], current_user.id):
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to delete document"
             )
+        public_snapshots.invalidate(obj_id)
         
     except HTTPException:
         raise
@@ -321,3 +908,43 @@ async def delete_document(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to delete document: {str(e)}"
         )
+
+
+@router.post("/{document_id}/restore", response_model=DocumentOut)
+async def restore_trashed_document(
+    document_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    workspace: Workspace = Depends(get_workspace),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Take a deleted document back out of the trash"""
+    try:
+        try:
+            obj_id = ObjectId(document_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid document ID format"
+            )
+
+        document = db.documents.find_one(
+            {"_id": obj_id, "workspace_id": workspace.id, "owner_id": current_user.id, **TRASHED}
+        )
+        if not document or not await to_thread.run_sync(restore_document, db, document):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found in trash"
+            )
+
+        restored = find_projected(db.documents, {"_id": obj_id}, DOCUMENT_OUT, limit=1)[0]
+        if restored.pop("content_stale"):
+            restored["content"] = assemble_content(db, obj_id)
+        return DocumentOut(**restored)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to restore document: {str(e)}"
+        )
@@ -1,66 +1,69 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+import logging
+from anyio import to_thread
+from fastapi import APIRouter, HTTPException, Depends, status, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import List
 from bson import ObjectId
 from datetime import datetime
-from core.database import get_db
+from core.database import get_db, get_read_db, iterate_cursor
+from core.executor import run_cpu_bound
+from core.export import FORMATS, ZipStreamWriter, convert, safe_filename, content_disposition
+from core.jobs import JobContext, enqueue_job, job_handler
+from core.projections import FOLDER_OUT, find_projected
+from core.permissions import (
+    EDITOR, OWNER, VIEWER, Access, access_fields, describe_shares, get_access, move_record, refresh_readers,
+    listing_filter, resolve_share_user, set_share, visible_filter
+)
+from core.workspaces import GUEST, Workspace, get_workspace, set_member
+from core.trash import trash_documents
+from routes.jobs import job_out
+from core.metrics import InstrumentedRoute
 from models.folder import Folder, FolderCreate, FolderUpdate
-from schemas import FolderOut
+from schemas import FolderOut, ShareCreate, ShareOut
 from core.jwt import get_current_user
 from models.user import UserInDB
 
-router = APIRouter(prefix="/folders", tags=["folders"])
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/folders", tags=["folders"], route_class=InstrumentedRoute)
 
 
 @router.post("/", response_model=FolderOut, status_code=status.HTTP_201_CREATED)
 async def create_folder(
     folder_data: FolderCreate,
     current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
     db = Depends(get_db("CollabraDoc"))
 ):
     """Create a new folder"""
     try:
-        print(f"Creating folder: {folder_data.name}, parent_id: {folder_data.parent_id}")
-        print(f"Current user ID: {current_user.id}")
+        logger.debug("Creating folder %r (parent_id=%s) for user %s", folder_data.name, folder_data.parent_id, current_user.id)
         
         # Convert parent_id string to ObjectId if provided
         parent_id = None
         if folder_data.parent_id and folder_data.parent_id != "none":
             try:
                 parent_id = ObjectId(folder_data.parent_id)
-                print(f"Looking for parent folder with ID: {parent_id}")
-                
-                # Verify parent folder exists and user has access
-                parent_folder = db.folders.find_one({"_id": parent_id})
-                if not parent_folder:
-                    print(f"Parent folder not found: {parent_id}")
-                    raise HTTPException(
-                        status_code=status.HTTP_404_NOT_FOUND,
-                        detail="Parent folder not found"
-                    )
-                
-                parent_owner_id = str(parent_folder.get("owner_id"))
-                current_user_id = str(current_user.id)
-                print(f"Parent owner ID: {parent_owner_id}, Current user ID: {current_user_id}")
                 
-                if parent_owner_id != current_user_id:
-                    print(f"Access denied: {parent_owner_id} != {current_user_id}")
-                    raise HTTPException(
-                        status_code=status.HTTP_403_FORBIDDEN,
-                        detail="Access denied to parent folder"
-                    )
+                # Verify parent folder exists and user may add to it
+                access.require("folders", parent_id, EDITOR)
             except Exception as e:
                 if isinstance(e, HTTPException):
                     raise
-                print(f"Error processing parent_id: {e}")
+                logger.debug("Error processing parent_id: %s", e)
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Invalid parent folder ID format"
                 )
+        else:
+            access.workspace.require_member()
 
         # Check if folder with same name already exists in the same parent
         existing_folder = db.folders.find_one({
-            "name": folder_data.name,
+            "workspace_id": access.workspace.id,
             "parent_id": parent_id,
+            "name": folder_data.name,
             "owner_id": current_user.id
         })
         
@@ -74,12 +77,13 @@ async def create_folder(
         folder_dict = {
             "name": folder_data.name,
             "parent_id": parent_id,
+            "workspace_id": access.workspace.id,
             "owner_id": current_user.id,
+            **access_fields(db, current_user.id, parent_id),
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
         }
         
-        print(f"Creating folder with data: {folder_dict}")
         result = db.folders.insert_one(folder_dict)
         
         # Get the created folder
@@ -96,7 +100,7 @@ async def create_folder(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Unexpected error in create_folder: {e}")
+        logger.exception("Unexpected error in create_folder: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create folder: {str(e)}"
@@ -106,27 +110,14 @@ async def create_folder(
 @router.get("/", response_model=List[FolderOut])
 async def get_folders(
     current_user: UserInDB = Depends(get_current_user),
-    db = Depends(get_db("CollabraDoc"))
+    workspace: Workspace = Depends(get_workspace),
+    db = Depends(get_read_db("CollabraDoc"))
 ):
-    """Get all folders for the current user"""
+    """Get all folders the current user owns or has been given access to"""
     try:
-        # Get folders owned by user
-        folders = list(db.folders.find({
-            "owner_id": current_user.id
-        }).sort("name", 1))
-        
-        # Convert ObjectIds to strings and add missing timestamps
-        for folder in folders:
-            folder["id"] = str(folder["_id"])
-            folder["owner_id"] = str(folder["owner_id"])
-            if folder.get("parent_id"):
-                folder["parent_id"] = str(folder["parent_id"])
-            
-            # Add default timestamps if missing (for existing folders)
-            if "created_at" not in folder:
-                folder["created_at"] = datetime.utcnow()
-            if "updated_at" not in folder:
-                folder["updated_at"] = folder.get("created_at", datetime.utcnow())
+        folders = find_projected(
+            db.folders, listing_filter(current_user.id, workspace), FOLDER_OUT, sort=[("name", 1)]
+        )
         
         return [FolderOut(**folder) for folder in folders]
         
@@ -141,6 +132,7 @@ async def get_folders(
 async def get_folder(
     folder_id: str,
     current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
     db = Depends(get_db("CollabraDoc"))
 ):
     """Get a specific folder by ID"""
@@ -154,34 +146,17 @@ async def get_folder(
                 detail="Invalid folder ID format"
             )
         
-        folder = db.folders.find_one({"_id": obj_id})
-        
-        if not folder:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Folder not found"
-            )
-        
-        # Check if user owns this folder
-        if str(folder.get("owner_id")) != str(current_user.id):
+        folders = find_projected(
+            db.folders, {"_id": obj_id, **visible_filter(current_user.id, access.workspace.id)}, FOLDER_OUT, limit=1
+        )
+        if not folders:
+            access.require("folders", obj_id, VIEWER)
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Access denied"
             )
         
-        # Convert ObjectIds to strings
-        folder["id"] = str(folder["_id"])
-        folder["owner_id"] = str(folder["owner_id"])
-        if folder.get("parent_id"):
-            folder["parent_id"] = str(folder["parent_id"])
-        
-        # Add default timestamps if missing (for existing folders)
-        if "created_at" not in folder:
-            folder["created_at"] = datetime.utcnow()
-        if "updated_at" not in folder:
-            folder["updated_at"] = folder.get("created_at", datetime.utcnow())
-        
-        return FolderOut(**folder)
+        return FolderOut(**folders[0])
         
     except HTTPException:
         raise
@@ -192,11 +167,201 @@ async def get_folder(
         )
 
 
+def _folder_subtree(db, root: dict, scope: dict) -> dict:
+    """Map each folder id in the subtree under root (limited to folders matching scope) to its path inside the archive"""
+    paths = {root["_id"]: safe_filename(root.get("name", ""), "folder")}
+    frontier = [root["_id"]]
+    while frontier:
+        children = list(db.folders.find(
+            {"parent_id": {"$in": frontier}, **scope},
+            {"name": 1, "parent_id": 1}
+        ))
+        frontier = []
+        for child in children:
+            if child["_id"] in paths:
+                continue
+            paths[child["_id"]] = f"{paths[child['parent_id']]}/{safe_filename(child.get('name', ''), 'folder')}"
+            frontier.append(child["_id"])
+    return paths
+
+
+async def _stream_folder_zip(db, paths: dict, scope: dict, fmt: str, metadata: bool):
+    writer = ZipStreamWriter()
+    for path in sorted(paths.values()):
+        yield writer.add_directory(path)
+
+    _, extension = FORMATS[fmt]
+    cursor = db.documents.find(
+        {
+            "folder_id": {"$in": list(paths)},
+            **scope
+        },
+        {"title": 1, "content": 1, "folder_id": 1, "updated_at": 1}
+    )
+    try:
+        async for document in iterate_cursor(cursor, batch_size=20):
+            source = {key: document.get(key) for key in ("title", "content", "updated_at")}
+            text = await run_cpu_bound(convert, source, fmt, metadata, size=len(source["content"] or ""))
+            path = f"{paths[document['folder_id']]}/{safe_filename(source['title'] or '')}.{extension}"
+            chunk = await to_thread.run_sync(writer.add_file, path, text.encode(), source["updated_at"])
+            if chunk:
+                yield chunk
+        yield writer.close()
+    except Exception:
+        # Headers are already sent; abort so the client sees a truncated download
+        logger.exception("Folder export failed part-way")
+        raise
+    finally:
+        cursor.close()
+
+
+@router.get("/{folder_id}/export")
+async def export_folder(
+    folder_id: str,
+    format: str = Query("md", pattern="^(md|html|txt)$", description="Format of each document"),
+    metadata: bool = Query(False, description="Prepend a front matter block (md only)"),
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Download a folder and its subfolders as a zip archive, streamed as it is built"""
+    try:
+        try:
+            obj_id = ObjectId(folder_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid folder ID format"
+            )
+
+        folder = access.require("folders", obj_id, VIEWER, fields=("name",))
+
+        scope = visible_filter(current_user.id, access.workspace.id)
+        paths = await to_thread.run_sync(_folder_subtree, db, folder, scope)
+        filename = f"{paths[obj_id]}.zip"
+        return StreamingResponse(
+            _stream_folder_zip(db, paths, scope, format, metadata),
+            media_type="application/zip",
+            headers={"Content-Disposition": content_disposition(filename)}
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to export folder: {str(e)}"
+        )
+
+
+@router.get("/{folder_id}/shares", response_model=List[ShareOut])
+async def get_folder_shares(
+    folder_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Who the folder is shared with, directly or through its parents"""
+    try:
+        try:
+            obj_id = ObjectId(folder_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid folder ID format"
+            )
+
+        folder = access.require("folders", obj_id, EDITOR)
+        return [ShareOut(**share) for share in describe_shares(db, folder)]
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve shares: {str(e)}"
+        )
+
+
+@router.put("/{folder_id}/shares", response_model=List[ShareOut])
+async def share_folder(
+    folder_id: str,
+    share: ShareCreate,
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Share the folder, and everything filed under it, with a user"""
+    try:
+        try:
+            obj_id = ObjectId(folder_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid folder ID format"
+            )
+
+        access.require("folders", obj_id, OWNER)
+        user_id = resolve_share_user(db, share.user_id, share.email)
+        if user_id == str(current_user.id):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The owner already has full access"
+            )
+        # Sharing with someone outside the workspace brings them in as a guest
+        set_member(db, access.workspace.id, user_id, GUEST, keep_existing=True)
+        await to_thread.run_sync(set_share, db, "folders", obj_id, user_id, share.role)
+        access.forget("folders", obj_id)
+        folder = access.require("folders", obj_id, OWNER)
+        return [ShareOut(**share) for share in describe_shares(db, folder)]
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to share folder: {str(e)}"
+        )
+
+
+@router.delete("/{folder_id}/shares/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def unshare_folder(
+    folder_id: str,
+    user_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Revoke a user's direct access to the folder and what it contains"""
+    try:
+        try:
+            obj_id = ObjectId(folder_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid folder ID format"
+            )
+
+        access.require("folders", obj_id, OWNER)
+        user_id = resolve_share_user(db, user_id, None)
+        await to_thread.run_sync(set_share, db, "folders", obj_id, user_id, None)
+        access.forget("folders", obj_id)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to unshare folder: {str(e)}"
+        )
+
+
 @router.put("/{folder_id}", response_model=FolderOut)
 async def update_folder(
     folder_id: str,
     folder_data: FolderUpdate,
     current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
     db = Depends(get_db("CollabraDoc"))
 ):
     """Update a folder"""
@@ -211,18 +376,7 @@ async def update_folder(
             )
         
         # Check if folder exists and user owns it
-        folder = db.folders.find_one({"_id": obj_id})
-        if not folder:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Folder not found"
-            )
-        
-        if str(folder.get("owner_id")) != str(current_user.id):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
+        folder = access.require("folders", obj_id, OWNER, fields=("parent_id",))
         
         # Prepare update data
         update_data = {}
@@ -232,18 +386,8 @@ async def update_folder(
             if folder_data.parent_id:
                 try:
                     parent_obj_id = ObjectId(folder_data.parent_id)
-                    # Verify parent folder exists and user has access
-                    parent_folder = db.folders.find_one({"_id": parent_obj_id})
-                    if not parent_folder:
-                        raise HTTPException(
-                            status_code=status.HTTP_404_NOT_FOUND,
-                            detail="Parent folder not found"
-                        )
-                    if str(parent_folder.get("owner_id")) != str(current_user.id):
-                        raise HTTPException(
-                            status_code=status.HTTP_403_FORBIDDEN,
-                            detail="Access denied to parent folder"
-                        )
+                    # Verify parent folder exists and user may add to it
+                    access.require("folders", parent_obj_id, EDITOR)
                     update_data["parent_id"] = parent_obj_id
                 except Exception as e:
                     if isinstance(e, HTTPException):
@@ -269,6 +413,10 @@ async def update_folder(
                 detail="Failed to update folder"
             )
         
+        if "parent_id" in update_data and update_data["parent_id"] != folder.get("parent_id"):
+            # Re-inherit the new parent's grants, down the whole subtree
+            await to_thread.run_sync(move_record, db, "folders", obj_id, update_data["parent_id"])
+        
         # Get updated folder
         updated_folder = db.folders.find_one({"_id": obj_id})
         updated_folder["id"] = str(updated_folder["_id"])
@@ -287,10 +435,76 @@ async def update_folder(
         )
 
 
+_DELETE_BATCH_SIZE = 500
+
+
+def _trash_document_batch(db, folder_ids: list, scope: dict, user_id) -> int:
+    ids = [
+        document["_id"]
+        for document in db.documents.find(
+            {"folder_id": {"$in": folder_ids}, **scope, "deleted_at": None}, {"_id": 1}
+        ).limit(_DELETE_BATCH_SIZE)
+    ]
+    if not ids:
+        return 0
+    trash_documents(db, ids, user_id)
+    return len(ids)
+
+
+def _release_children(db, folder_ids: list) -> int:
+    """
+    Move what is left in folders about to be deleted (other users' documents
+    and subfolders) to the top level, dropping the grants they inherited from
+    them, as moving them there would. Returns how many subfolders moved.
+    """
+    refresh_readers(db.documents, {"folder_id": {"$in": folder_ids}}, [])
+    db.documents.update_many({"folder_id": {"$in": folder_ids}}, {"$set": {"folder_id": None}})
+    children = [
+        child["_id"]
+        for child in db.folders.find({"parent_id": {"$in": folder_ids}, "_id": {"$nin": folder_ids}}, {"_id": 1})
+    ]
+    for child_id in children:
+        db.folders.update_one({"_id": child_id}, {"$set": {"parent_id": None, "updated_at": datetime.utcnow()}})
+        move_record(db, "folders", child_id, None)
+    return len(children)
+
+
+@job_handler("delete_folder")
+async def delete_folder_tree(ctx: JobContext, payload: dict) -> dict:
+    """
+    Delete a folder and the owner's subfolders, moving the owner's documents in
+    them to the trash and other users' documents and subfolders to the top
+    level; safe to re-run.
+    """
+    db = ctx.db
+    root = await ctx.run_sync(db.folders.find_one, {"_id": payload["folder_id"]})
+    if not root:
+        return {"deleted_documents": 0, "deleted_folders": 0}
+    scope = {"workspace_id": payload["workspace_id"], "owner_id": payload["owner_id"]}
+    folder_ids = list(await ctx.run_sync(_folder_subtree, db, root, scope))
+    await ctx.progress(total_folders=len(folder_ids), deleted_documents=0)
+
+    deleted_documents = 0
+    while deleted := await ctx.run_sync(_trash_document_batch, db, folder_ids, scope, payload["owner_id"]):
+        deleted_documents += deleted
+        await ctx.progress(deleted_documents=deleted_documents)
+
+    # Other users' documents and subfolders filed here lose their folder rather than being deleted
+    moved_folders = await ctx.run_sync(_release_children, db, folder_ids)
+    result = await ctx.run_sync(db.folders.delete_many, {"_id": {"$in": folder_ids}})
+    return {
+        "deleted_documents": deleted_documents,
+        "deleted_folders": result.deleted_count,
+        "moved_folders": moved_folders
+    }
+
+
 @router.delete("/{folder_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_folder(
     folder_id: str,
+    recursive: bool = Query(False, description="Delete subfolders and documents too, as a background job"),
     current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
     db = Depends(get_db("CollabraDoc"))
 ):
     """Delete a folder"""
@@ -305,19 +519,17 @@ async def delete_folder(
             )
         
         # Check if folder exists and user owns it
-        folder = db.folders.find_one({"_id": obj_id})
-        if not folder:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Folder not found"
-            )
-        
-        if str(folder.get("owner_id")) != str(current_user.id):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
-        
+        folder = access.require("folders", obj_id, OWNER)
+        
+        if recursive:
+            job = enqueue_job(db, "delete_folder", {
+                "folder_id": obj_id,
+                "workspace_id": access.workspace.id,
+                "owner_id": folder["owner_id"]
+            }, owner_id=current_user.id)
+            job.pop("payload")
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder(job_out(job)))
+
         # Check if folder has subfolders
         subfolders = db.folders.find_one({"parent_id": obj_id})
         if subfolders:
@@ -327,7 +539,7 @@ async def delete_folder(
             )
         
         # Check if folder has documents
-        documents = db.documents.find_one({"folder_id": obj_id})
+        documents = db.documents.find_one({"folder_id": obj_id, "deleted_at": None})
         if documents:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -0,0 +1,84 @@
+import os
+import tempfile
+from anyio import to_thread
+from fastapi import APIRouter, HTTPException, Depends, File, Form, UploadFile, status
+from typing import Optional
+from bson import ObjectId
+from core.database import get_db
+from core.importer import is_supported_archive, store_archive
+from core.jobs import enqueue_job
+from core.metrics import InstrumentedRoute
+from core.permissions import EDITOR, Access, get_access
+from core.settings import settings
+from schemas import JobOut
+from routes.jobs import job_out
+from core.jwt import get_current_user
+from models.user import UserInDB
+
+router = APIRouter(prefix="/imports", tags=["imports"], route_class=InstrumentedRoute)
+
+_COPY_CHUNK = 1024 * 1024
+
+
+async def _spool_upload(upload: UploadFile, spool):
+    """Copy the upload to a local temporary file, enforcing the size limit"""
+    written = 0
+    while chunk := await upload.read(_COPY_CHUNK):
+        written += len(chunk)
+        if written > settings.IMPORT_MAX_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Archive exceeds {settings.IMPORT_MAX_BYTES} bytes"
+            )
+        await to_thread.run_sync(spool.write, chunk)
+
+
+@router.post("/", response_model=JobOut, status_code=status.HTTP_202_ACCEPTED)
+async def create_import(
+    file: UploadFile = File(..., description="zip or tar archive of .md, .html and .txt files"),
+    folder_id: Optional[str] = Form(None, description="Folder to import into; defaults to the top level"),
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Queue an import job for an archive; directories become folders and files become documents"""
+    try:
+        target_folder = None
+        if folder_id:
+            try:
+                target_folder = ObjectId(folder_id)
+            except Exception:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid folder ID format"
+                )
+            access.require("folders", target_folder, EDITOR)
+        else:
+            access.workspace.require_member()
+
+        with tempfile.TemporaryFile() as spool:
+            await _spool_upload(file, spool)
+            if not await to_thread.run_sync(is_supported_archive, spool):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Unsupported archive format; upload a zip or tar file"
+                )
+            archive_id = await to_thread.run_sync(store_archive, db, spool, os.path.basename(file.filename or ""))
+
+        job = enqueue_job(db, "import", {
+            "archive_id": archive_id,
+            "filename": file.filename or "",
+            "owner_id": current_user.id,
+            "workspace_id": access.workspace.id,
+            "folder_id": target_folder
+        }, owner_id=current_user.id)
+        job.pop("payload")
+        return job_out(job)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to start import: {str(e)}"
+        )
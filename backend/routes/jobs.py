@@ -0,0 +1,93 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from typing import List
+from bson import ObjectId
+from core.database import get_db
+from core.jobs import cancel_job
+from core.metrics import InstrumentedRoute
+from schemas import JobOut
+from core.jwt import get_current_user
+from models.user import UserInDB
+
+router = APIRouter(prefix="/jobs", tags=["jobs"], route_class=InstrumentedRoute)
+
+
+def job_out(job: dict) -> JobOut:
+    job["id"] = str(job["_id"])
+    return JobOut(**job)
+
+
+def _find_own_job(db, job_id: str, current_user: UserInDB) -> dict:
+    try:
+        obj_id = ObjectId(job_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid job ID format"
+        )
+
+    job = db.jobs.find_one({"_id": obj_id}, {"payload": 0})
+    if not job or str(job.get("owner_id")) != str(current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
+
+
+@router.get("/", response_model=List[JobOut])
+async def get_jobs(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: UserInDB = Depends(get_current_user),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Most recent jobs started by the current user"""
+    try:
+        jobs = db.jobs.find({"owner_id": current_user.id}, {"payload": 0}).sort("created_at", -1).limit(limit)
+        return [job_out(job) for job in jobs]
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve jobs: {str(e)}"
+        )
+
+
+@router.get("/{job_id}", response_model=JobOut)
+async def get_job(
+    job_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Status and progress of a job"""
+    try:
+        return job_out(_find_own_job(db, job_id, current_user))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve job: {str(e)}"
+        )
+
+
+@router.post("/{job_id}/cancel", response_model=JobOut)
+async def cancel(
+    job_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Cancel a job; a running job stops at its next progress checkpoint"""
+    try:
+        job = _find_own_job(db, job_id, current_user)
+        job = cancel_job(db, job["_id"])
+        job.pop("payload", None)
+        return job_out(job)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to cancel job: {str(e)}"
+        )
@@ -0,0 +1,101 @@
+from fastapi import APIRouter, HTTPException, Depends, status
+from bson import ObjectId
+from core.directory import DIRECTORY_FIELDS, directory_entry
+from core.metrics import InstrumentedRoute
+from core.permissions import VIEWER, Access, get_access
+from core.repositories import Repositories
+from core.presence import heartbeat, leave, presence
+from schemas import PresenceIn, PresenceOut, UserSuggestionOut
+from core.jwt import get_current_user
+from models.user import UserInDB
+
+router = APIRouter(prefix="/presence", tags=["presence"], route_class=InstrumentedRoute)
+
+
+def _document_id(document_id: str) -> ObjectId:
+    try:
+        return ObjectId(document_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid document ID format"
+        )
+
+
+def _presence_out(document_id: str | None, repos: Repositories | None = None) -> PresenceOut:
+    if document_id is None:
+        return PresenceOut(online=presence.online_count())
+    user_ids = presence.document_users(document_id)
+    users = {
+        str(user["_id"]): directory_entry(user)
+        for user in repos.users.find(
+            {"_id": {"$in": [ObjectId(user_id) for user_id in user_ids]}}, DIRECTORY_FIELDS
+        )
+    } if user_ids else {}
+    return PresenceOut(
+        online=presence.online_count(),
+        document_id=document_id,
+        users=[UserSuggestionOut(**users[user_id]) for user_id in user_ids if user_id in users]
+    )
+
+
+@router.post("/heartbeat", response_model=PresenceOut)
+async def send_heartbeat(
+    body: PresenceIn,
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access)
+):
+    """Keep the current user online, and on a document if one is given; send every PRESENCE_TTL_SECONDS / 2"""
+    try:
+        if body.document_id:
+            access.require("documents", _document_id(body.document_id), VIEWER)
+        heartbeat(current_user.id, body.document_id)
+        return _presence_out(body.document_id, access.repos)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to record heartbeat: {str(e)}"
+        )
+
+
+@router.post("/leave", status_code=status.HTTP_204_NO_CONTENT)
+async def leave_document(
+    body: PresenceIn,
+    current_user: UserInDB = Depends(get_current_user)
+):
+    """Mark the current user as gone from a document without waiting for the session to expire"""
+    if not body.document_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="document_id is required"
+        )
+    leave(current_user.id, body.document_id)
+
+
+@router.get("/documents/{document_id}", response_model=PresenceOut)
+async def get_document_presence(
+    document_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    access: Access = Depends(get_access)
+):
+    """Users currently on a document"""
+    try:
+        access.require("documents", _document_id(document_id), VIEWER)
+        return _presence_out(document_id, access.repos)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve presence: {str(e)}"
+        )
+
+
+@router.get("/", response_model=PresenceOut)
+async def get_presence(current_user: UserInDB = Depends(get_current_user)):
+    """Number of users online"""
+    return _presence_out(None)
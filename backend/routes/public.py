@@ -0,0 +1,54 @@
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response, status
+from bson import ObjectId
+from core.database import get_db
+from core.metrics import InstrumentedRoute
+from core.public import PUBLIC_FORMATS, cache_headers, etag_matches, public_snapshots
+
+router = APIRouter(prefix="/public", tags=["public"], route_class=InstrumentedRoute)
+
+# Public HTML is user content served from the API's origin: no scripts, no plugins, no framing
+_HTML_HEADERS = {
+    "Content-Security-Policy": "default-src 'none'; img-src * data:; style-src 'unsafe-inline'; sandbox",
+    "X-Content-Type-Options": "nosniff",
+}
+
+
+@router.get("/documents/{document_id}")
+async def get_public_document(
+    document_id: str,
+    format: str = Query("json", pattern="^(json|html)$", description="json, or html for a standalone page"),
+    if_none_match: str | None = Header(None),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """A public document, read-only and without signing in; cacheable by browsers and reverse proxies"""
+    try:
+        try:
+            obj_id = ObjectId(document_id)
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid document ID format"
+            )
+
+        snapshot = await public_snapshots.get(db, obj_id, format)
+        if snapshot is None:
+            # Private and missing documents look the same from outside
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found"
+            )
+
+        headers = cache_headers(snapshot)
+        if format == "html":
+            headers.update(_HTML_HEADERS)
+        if etag_matches(if_none_match, snapshot.etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=snapshot.body, media_type=PUBLIC_FORMATS[format], headers=headers)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve document: {str(e)}"
+        )
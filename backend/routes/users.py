@@ -1,18 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from bson import ObjectId
 from core.database import get_db
-from schemas import UserCreate, UserOut, UserStatsOut
+from core.directory import DIRECTORY_FIELDS, workspace_directories
+from core.metrics import InstrumentedRoute
+from core.repositories import Repositories, get_read_repositories, get_repositories
+from core.presence import presence
+from schemas import UserCreate, UserOut, UserStatsOut, UserSuggestionOut
 from core.security import hash_password
-from typing import List
+from core.jwt import get_current_user
+from core.workspaces import Workspace, get_workspace
+from models.user import UserInDB
+from typing import List, Optional
 
-router = APIRouter(prefix="/users", tags=["users"])
+router = APIRouter(prefix="/users", tags=["users"], route_class=InstrumentedRoute)
 
 @router.post("/", response_model=UserOut, status_code=status.HTTP_201_CREATED)
 def create_user(
     user_in: UserCreate,
-    db = Depends(get_db("CollabraDoc"))
+    repos: Repositories = Depends(get_repositories)
 ):
-    if db.users.find_one({"email": user_in.email}):
+    if repos.users.find_one({"email": user_in.email}, {"_id": 1}):
         raise HTTPException(400, "Email already exists")
         
     hashed_password = hash_password(user_in.password)
@@ -21,13 +28,31 @@ def create_user(
 
     user_data["password"] = hashed_password
     
-    result = db.users.insert_one(user_data)
+    user_id = repos.users.insert(user_data)
 
-    return UserOut(id=str(result.inserted_id), **user_data)
+    return UserOut(id=str(user_id), **user_data)
 
 @router.get("/", response_model=List[UserStatsOut])
-def get_users(db = Depends(get_db("CollabraDoc"))):
-    users = list(db.users.find())
+def get_users(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[str] = Query(None, description="Id of the last user on the previous page"),
+    repos: Repositories = Depends(get_read_repositories)
+):
+    """One page of the user directory in signup order; X-Next-Cursor holds the value for `after`"""
+    query = {}
+    if after:
+        try:
+            query["_id"] = {"$gt": ObjectId(after)}
+        except Exception:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+    users = repos.users.find(query, DIRECTORY_FIELDS, sort=[("_id", 1)], limit=limit)
+    if len(users) == limit:
+        response.headers["X-Next-Cursor"] = str(users[-1]["_id"])
+    statuses = presence.statuses(str(user["_id"]) for user in users)
     result = []
     for user in users:
         result.append({
@@ -36,6 +61,18 @@ def get_users(db = Depends(get_db("CollabraDoc"))):
             "full_name": user.get("full_name", ""),
             "avatar": user.get("avatar", ""),
             "role": user.get("role", "viewer"),
-            "status": "offline"
+            "status": statuses[str(user["_id"])]
         })
     return result
+
+@router.get("/suggest", response_model=List[UserSuggestionOut])
+def suggest_users(
+    prefix: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(8, ge=1, le=25),
+    current_user: UserInDB = Depends(get_current_user),
+    workspace: Workspace = Depends(get_workspace),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Members of the current workspace whose name or email starts with prefix, for @mention autocomplete"""
+    users = workspace_directories.suggest(db, workspace.id, prefix, limit, exclude=current_user.id)
+    return [UserSuggestionOut(**user) for user in users]
@@ -0,0 +1,194 @@
+from fastapi import APIRouter, HTTPException, Depends, status
+from typing import List
+from bson import ObjectId
+from datetime import datetime
+from core.database import get_db
+from core.metrics import InstrumentedRoute
+from core.permissions import resolve_share_user
+from core.workspaces import OWNER, member_role, personal_workspace_id, set_member
+from schemas import WorkspaceCreate, WorkspaceMemberIn, WorkspaceMemberOut, WorkspaceOut
+from core.jwt import get_current_user
+from models.user import UserInDB
+
+router = APIRouter(prefix="/workspaces", tags=["workspaces"], route_class=InstrumentedRoute)
+
+
+def _workspace_id(workspace_id: str) -> ObjectId:
+    try:
+        return ObjectId(workspace_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid workspace ID format"
+        )
+
+
+def _require_role(db, workspace_id: ObjectId, user_id: str, owner: bool = False) -> str:
+    role = member_role(db, workspace_id, user_id)
+    if role is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Workspace not found"
+        )
+    if owner and role != OWNER:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only the workspace owner can manage members"
+        )
+    return role
+
+
+def _workspace_out(workspace: dict, user_id: str) -> WorkspaceOut:
+    role = next(member["role"] for member in workspace["members"] if member["user_id"] == user_id)
+    return WorkspaceOut(
+        id=str(workspace["_id"]),
+        name=workspace["name"],
+        personal=workspace.get("personal", False),
+        role=role,
+        member_count=len(workspace["members"]),
+        created_at=workspace["created_at"]
+    )
+
+
+def _members_out(db, workspace_id: ObjectId) -> List[WorkspaceMemberOut]:
+    workspace = db.workspaces.find_one({"_id": workspace_id}, {"members": 1})
+    members = workspace["members"] if workspace else []
+    users = {
+        str(user["_id"]): user
+        for user in db.users.find(
+            {"_id": {"$in": [ObjectId(member["user_id"]) for member in members]}}, {"email": 1, "full_name": 1}
+        )
+    }
+    return [
+        WorkspaceMemberOut(
+            **member,
+            email=users.get(member["user_id"], {}).get("email"),
+            full_name=users.get(member["user_id"], {}).get("full_name")
+        )
+        for member in members
+    ]
+
+
+@router.get("/", response_model=List[WorkspaceOut])
+async def get_workspaces(
+    current_user: UserInDB = Depends(get_current_user),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Workspaces the current user belongs to, their personal one first"""
+    try:
+        personal_workspace_id(db, current_user.id)
+        workspaces = db.workspaces.find(
+            {"members.user_id": current_user.id},
+            {"name": 1, "personal": 1, "members": 1, "created_at": 1}
+        ).sort([("personal", -1), ("name", 1)])
+        return [_workspace_out(workspace, current_user.id) for workspace in workspaces]
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve workspaces: {str(e)}"
+        )
+
+
+@router.post("/", response_model=WorkspaceOut, status_code=status.HTTP_201_CREATED)
+async def create_workspace(
+    workspace_data: WorkspaceCreate,
+    current_user: UserInDB = Depends(get_current_user),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Create a team workspace owned by the current user"""
+    try:
+        now = datetime.utcnow()
+        workspace = {
+            "name": workspace_data.name,
+            "owner_id": current_user.id,
+            "personal": False,
+            "members": [{"user_id": current_user.id, "role": OWNER}],
+            "created_at": now,
+            "updated_at": now
+        }
+        workspace["_id"] = db.workspaces.insert_one(workspace).inserted_id
+        return _workspace_out(workspace, current_user.id)
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create workspace: {str(e)}"
+        )
+
+
+@router.get("/{workspace_id}/members", response_model=List[WorkspaceMemberOut])
+async def get_workspace_members(
+    workspace_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Members of a workspace and their roles"""
+    try:
+        obj_id = _workspace_id(workspace_id)
+        _require_role(db, obj_id, current_user.id)
+        return _members_out(db, obj_id)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve workspace members: {str(e)}"
+        )
+
+
+@router.put("/{workspace_id}/members", response_model=List[WorkspaceMemberOut])
+async def set_workspace_member(
+    workspace_id: str,
+    member: WorkspaceMemberIn,
+    current_user: UserInDB = Depends(get_current_user),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Add a user (by user_id or email) as a member or guest, or change their role (owner only)"""
+    try:
+        obj_id = _workspace_id(workspace_id)
+        _require_role(db, obj_id, current_user.id, owner=True)
+        user_id = resolve_share_user(db, member.user_id, member.email)
+        if user_id == str(current_user.id):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The owner's role can't be changed"
+            )
+        set_member(db, obj_id, user_id, member.role)
+        return _members_out(db, obj_id)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to set workspace member: {str(e)}"
+        )
+
+
+@router.delete("/{workspace_id}/members/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def remove_workspace_member(
+    workspace_id: str,
+    user_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    db = Depends(get_db("CollabraDoc"))
+):
+    """Remove a member (owner only); members may also remove themselves"""
+    try:
+        obj_id = _workspace_id(workspace_id)
+        role = _require_role(db, obj_id, current_user.id, owner=user_id != str(current_user.id))
+        if user_id == str(current_user.id) and role == OWNER:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The owner can't be removed from the workspace"
+            )
+        set_member(db, obj_id, user_id, None)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to remove workspace member: {str(e)}"
+        )
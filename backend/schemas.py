@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Literal, Optional, List
 from datetime import datetime
 
 
@@ -9,6 +9,14 @@ class UserCreate(BaseModel):
     full_name: Optional[str] = None
 
 
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+
 class UserOut(BaseModel):
     id: str = Field(..., description="MongoDB ObjectId as string")
     email: EmailStr
@@ -24,6 +32,73 @@ class DocumentOut(BaseModel):
     owner_id: str
     created_at: datetime
     updated_at: datetime
+    # Bumped by every content change; send it back as base_version when saving
+    version: int = 0
+    # Users on the document right now; filled in by listings
+    online_users: int = 0
+
+
+class ScoredDocumentOut(DocumentOut):
+    score: float
+
+
+class DocumentSummaryOut(BaseModel):
+    id: str
+    title: str
+    excerpt: str
+    word_count: int
+    char_count: int
+    reading_minutes: int
+    folder_id: Optional[str] = None
+    isPublic: bool
+    owner_id: str
+    last_edited_by: str
+    created_at: datetime
+    updated_at: datetime
+    online_users: int = 0
+
+
+class TrashedDocumentOut(DocumentSummaryOut):
+    deleted_at: datetime
+    purge_at: datetime
+
+
+class ActivityDocumentOut(DocumentSummaryOut):
+    view_count: int = 0
+    edit_count: int = 0
+    last_viewed_at: Optional[datetime] = None
+
+
+class ActivityOut(BaseModel):
+    action: str
+    document_id: str
+    document_title: str
+    user_id: str
+    count: int
+    at: datetime
+
+
+class BlockInfo(BaseModel):
+    id: str
+    position: int
+    size: int
+    heading: Optional[str] = None
+    level: Optional[int] = None
+
+
+class BlockOut(BaseModel):
+    id: str
+    position: int
+    html: str
+
+
+class DocumentOutlineOut(BaseModel):
+    id: str
+    title: str
+    size: int
+    updated_at: datetime
+    version: int = 0
+    blocks: List[BlockInfo]
 
 
 class DocumentCreate(BaseModel):
@@ -33,6 +108,20 @@ class DocumentCreate(BaseModel):
     content: str = ""
 
 
+class ShareCreate(BaseModel):
+    user_id: Optional[str] = None
+    email: Optional[EmailStr] = None
+    role: Literal["viewer", "commenter", "editor"]
+
+
+class ShareOut(BaseModel):
+    user_id: str
+    role: str
+    email: Optional[str] = None
+    full_name: Optional[str] = None
+    inherited: bool = False
+
+
 class FolderOut(BaseModel):
     id: str
     name: str
@@ -88,10 +177,78 @@ class CommentUpdate(BaseModel):
     resolved: Optional[bool] = None
 
 
+class JobOut(BaseModel):
+    id: str
+    kind: str
+    status: str
+    progress: dict = {}
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    attempts: int
+    max_attempts: int
+    cancel_requested: bool = False
+    created_at: datetime
+    updated_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class AttachmentOut(BaseModel):
+    id: str = Field(..., description="SHA-256 of the content")
+    url: str
+    filename: str
+    content_type: str
+    size: int
+    created_at: datetime
+
+
 class ErrorResponse(BaseModel):
     detail: str
 
 
+class UserSuggestionOut(BaseModel):
+    id: str
+    email: EmailStr
+    full_name: Optional[str] = None
+    avatar: Optional[str] = None
+
+
+class PresenceIn(BaseModel):
+    document_id: Optional[str] = None
+
+
+class PresenceOut(BaseModel):
+    online: int
+    document_id: Optional[str] = None
+    users: List[UserSuggestionOut] = []
+
+
+class WorkspaceCreate(BaseModel):
+    name: str
+
+
+class WorkspaceOut(BaseModel):
+    id: str
+    name: str
+    personal: bool = False
+    role: str
+    member_count: int
+    created_at: datetime
+
+
+class WorkspaceMemberIn(BaseModel):
+    user_id: Optional[str] = None
+    email: Optional[EmailStr] = None
+    role: Literal["member", "guest"]
+
+
+class WorkspaceMemberOut(BaseModel):
+    user_id: str
+    role: str
+    email: Optional[str] = None
+    full_name: Optional[str] = None
+
+
 class UserStatsOut(BaseModel):
     id: str
     email: EmailStr
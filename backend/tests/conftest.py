@@ -0,0 +1,67 @@
+"""
+Shared fixtures. API tests run the app on the in-memory repository engine:
+users, comments and permission lookups go through repositories, so those
+routes work without MongoDB as long as the test seeds documents through
+`repos` and stays away from routes that write documents directly.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("MONGODB_URL", "mongodb://localhost:27017")
+os.environ.setdefault("SECRET_KEY", "test-secret-key-test-secret-key-test")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "15")
+# Every test client shares one address; the per-IP login and signup limits would trip
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+from bson import ObjectId  # noqa: E402
+from fastapi import Depends  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from core.jwt import get_current_user  # noqa: E402
+from core.repositories import get_read_repositories, get_repositories, memory_repositories  # noqa: E402
+from core.workspaces import MEMBER, Workspace, get_workspace  # noqa: E402
+from models.user import UserInDB  # noqa: E402
+
+PASSWORD = "correct-horse-battery"
+
+
+@pytest.fixture
+def workspace_id():
+    return ObjectId()
+
+
+@pytest.fixture
+def repos():
+    return memory_repositories()
+
+
+@pytest.fixture
+def client(repos, workspace_id):
+    """Test client on the memory engine; every user is a member of one workspace"""
+    def workspace(current_user: UserInDB = Depends(get_current_user)) -> Workspace:
+        return Workspace(workspace_id, MEMBER)
+
+    main.app.dependency_overrides.update({
+        get_repositories: lambda: repos,
+        get_read_repositories: lambda: repos,
+        get_workspace: workspace,
+    })
+    # Not entered as a context manager: the lifespan's background tasks need MongoDB
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def signup(client):
+    """Create a user and sign in; returns (user id, auth headers)"""
+    def create(email: str, full_name: str = "Test User") -> tuple[str, dict]:
+        response = client.post("/api/auth/signup", json={"email": email, "password": PASSWORD, "full_name": full_name})
+        assert response.status_code == 201, response.text
+        login = client.post("/api/auth/login", data={"username": email, "password": PASSWORD})
+        assert login.status_code == 200, login.text
+        return login.json()["user"]["id"], {"Authorization": f"Bearer {login.json()['access_token']}"}
+    return create
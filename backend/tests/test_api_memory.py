@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from core.permissions import COMMENTER, VIEWER, readers_of
+
+
+def seed_document(repos, workspace_id, owner_id: str, shares: list[dict] = (), title: str = "Notes") -> ObjectId:
+    record = {
+        "title": title,
+        "content": "<p>Hello</p>",
+        "workspace_id": workspace_id,
+        "owner_id": owner_id,
+        "isPublic": False,
+        "shares": list(shares),
+        "inherited_shares": [],
+        "folder_id": None,
+    }
+    return repos.documents.insert({**record, "readers": readers_of(record)})
+
+
+def seed_comment(repos, workspace_id, document_id, author_id: str, parent_id=None, minutes_ago: int = 0) -> ObjectId:
+    at = datetime.utcnow() - timedelta(minutes=minutes_ago)
+    return repos.comments.insert({
+        "workspace_id": workspace_id,
+        "document_id": document_id,
+        "content": f"Comment by {author_id}",
+        "author": {"id": author_id, "name": "Someone", "email": "someone@example.com", "avatar": None},
+        "created_at": at,
+        "updated_at": at,
+        "replies": [],
+        "resolved": False,
+        "selection": None,
+        "position": None,
+        "parent_id": parent_id,
+    })
+
+
+def test_signup_login(client, signup):
+    user_id, _ = signup("ada@example.com", "Ada")
+    assert ObjectId.is_valid(user_id)
+
+    duplicate = client.post("/api/auth/signup", json={"email": "ada@example.com", "password": "another-password"})
+    assert duplicate.status_code == 400
+
+    wrong = client.post("/api/auth/login", data={"username": "ada@example.com", "password": "wrong-password"})
+    assert wrong.status_code == 401
+
+
+def test_users_page(client, signup):
+    for index in range(3):
+        signup(f"user{index}@example.com")
+    first = client.get("/api/users/", params={"limit": 2})
+    assert first.status_code == 200
+    assert [user["email"] for user in first.json()] == ["user0@example.com", "user1@example.com"]
+    rest = client.get("/api/users/", params={"limit": 2, "after": first.headers["X-Next-Cursor"]})
+    assert [user["email"] for user in rest.json()] == ["user2@example.com"]
+
+
+def test_comments_follow_document_access(client, signup, repos, workspace_id):
+    owner_id, owner = signup("owner@example.com")
+    viewer_id, viewer = signup("viewer@example.com")
+    _, stranger = signup("stranger@example.com")
+    document_id = seed_document(repos, workspace_id, owner_id, [{"user_id": viewer_id, "role": VIEWER}])
+    older = seed_comment(repos, workspace_id, document_id, owner_id, minutes_ago=5)
+    newer = seed_comment(repos, workspace_id, document_id, owner_id)
+    reply = seed_comment(repos, workspace_id, document_id, viewer_id, parent_id=older)
+
+    for headers in (owner, viewer):
+        response = client.get(f"/api/comments/document/{document_id}", headers=headers)
+        assert response.status_code == 200
+        comments = response.json()
+        # Newest thread first, replies nested under their parent
+        assert [comment["id"] for comment in comments] == [str(newer), str(older)]
+        assert [r["id"] for r in comments[1]["replies"]] == [str(reply)]
+
+    assert client.get(f"/api/comments/document/{document_id}", headers=stranger).status_code == 403
+    assert client.get(f"/api/comments/{older}", headers=stranger).status_code == 403
+    assert client.get(f"/api/comments/document/{ObjectId()}", headers=owner).status_code == 404
+
+
+def test_only_author_with_comment_role_updates(client, signup, repos, workspace_id):
+    owner_id, owner = signup("owner@example.com")
+    commenter_id, commenter = signup("commenter@example.com")
+    document_id = seed_document(repos, workspace_id, owner_id, [{"user_id": commenter_id, "role": COMMENTER}])
+    comment_id = seed_comment(repos, workspace_id, document_id, commenter_id)
+
+    response = client.put(f"/api/comments/{comment_id}", json={"resolved": True}, headers=commenter)
+    assert response.status_code == 200
+    assert response.json()["resolved"] is True
+    assert client.put(f"/api/comments/{comment_id}", json={"content": "Mine now"}, headers=owner).status_code == 403
+
+    # Demoted to viewer: the author can no longer edit their comment
+    repos.documents.update_one({"_id": document_id}, {"$set": {"shares": [{"user_id": commenter_id, "role": VIEWER}]}})
+    assert client.put(f"/api/comments/{comment_id}", json={"content": "Edit"}, headers=commenter).status_code == 403
+
+
+def test_delete_trashes_thread(client, signup, repos, workspace_id):
+    owner_id, owner = signup("owner@example.com")
+    viewer_id, viewer = signup("viewer@example.com")
+    document_id = seed_document(repos, workspace_id, owner_id, [{"user_id": viewer_id, "role": VIEWER}])
+    thread = seed_comment(repos, workspace_id, document_id, owner_id)
+    seed_comment(repos, workspace_id, document_id, viewer_id, parent_id=thread)
+
+    # Not their comment, and not their document
+    assert client.delete(f"/api/comments/{thread}", headers=viewer).status_code == 403
+    assert client.delete(f"/api/comments/{thread}", headers=owner).status_code == 204
+
+    assert client.get(f"/api/comments/document/{document_id}", headers=owner).json() == []
+    assert client.get(f"/api/comments/{thread}", headers=owner).status_code == 404
+    assert repos.comments.count({"document_id": document_id, "deleted_by": owner_id}) == 2
@@ -0,0 +1,38 @@
+from core.cache import SizedLRU
+
+
+def test_evicts_least_recently_used_until_under_budget():
+    cache = SizedLRU(100)
+    cache.put("a", "A", 40)
+    cache.put("b", "B", 40)
+    assert cache.get("a") == "A"
+    cache.put("c", "C", 40)
+    assert "b" not in cache
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+    assert cache.total_bytes == 80
+
+
+def test_replacing_a_value_updates_the_total():
+    cache = SizedLRU(100)
+    cache.put("a", "small", 10)
+    cache.put("a", "large", 90)
+    assert cache.total_bytes == 90
+    cache.pop("a")
+    assert cache.total_bytes == 0 and len(cache) == 0
+
+
+def test_value_larger_than_budget_is_not_kept():
+    cache = SizedLRU(100)
+    cache.put("a", "A", 30)
+    cache.put("b", "B", 101)
+    assert "b" not in cache
+    assert cache.get("a") == "A" and cache.total_bytes == 30
+
+
+def test_one_large_value_evicts_several_small_ones():
+    cache = SizedLRU(100)
+    for key in "abcde":
+        cache.put(key, key, 20)
+    cache.put("f", "f", 70)
+    assert [key for key in "abcdef" if key in cache] == ["e", "f"]
+    assert cache.total_bytes == 90
@@ -0,0 +1,114 @@
+import random
+
+import pytest
+
+from core.merge import matching_blocks, merge3, split_lines, split_words
+
+
+def lcs_length(a: list, b: list) -> int:
+    """Brute-force dynamic programme the diff must match"""
+    previous = [0] * (len(b) + 1)
+    for x in a:
+        row = [0]
+        for j, y in enumerate(b):
+            row.append(previous[j] + 1 if x == y else max(previous[j + 1], row[j]))
+        previous = row
+    return previous[-1]
+
+
+def check_blocks(a: list, b: list, blocks: list):
+    end_a = end_b = 0
+    for i, j, size in blocks:
+        assert size > 0
+        assert i >= end_a and j >= end_b
+        assert a[i:i + size] == b[j:j + size]
+        end_a, end_b = i + size, j + size
+
+
+@pytest.mark.parametrize("alphabet", ["ab", "abcd", "abcdefghij"])
+def test_matching_blocks_is_a_longest_common_subsequence(alphabet):
+    rng = random.Random(alphabet)
+    for _ in range(1500):
+        a = rng.choices(alphabet, k=rng.randint(0, 25))
+        if rng.random() < 0.5:
+            # Mostly-equal inputs, like two saves of one document
+            b = list(a)
+            for _ in range(rng.randint(1, 4)):
+                position = rng.randint(0, len(b))
+                b[position:position + rng.randint(0, 3)] = rng.choices(alphabet, k=rng.randint(0, 3))
+        else:
+            b = rng.choices(alphabet, k=rng.randint(0, 25))
+        blocks = matching_blocks(a, b)
+        check_blocks(a, b, blocks)
+        assert sum(size for _, _, size in blocks) == lcs_length(a, b), (a, b)
+
+
+def test_matching_blocks_merges_adjacent_runs():
+    a = list("abcdef")
+    assert matching_blocks(a, list(a)) == [(0, 0, 6)]
+    assert matching_blocks(a, list("abXdef")) == [(0, 0, 2), (3, 3, 3)]
+    assert matching_blocks([], list("abc")) == []
+
+
+def test_split_round_trip():
+    text = "<h1>Title</h1><p>One, two&amp; three</p>\n<ul><li>a</li><li>b<br>c</li></ul>tail"
+    assert "".join(split_lines(text)) == text
+    assert split_lines(text)[:2] == ["<h1>Title</h1>", "<p>One, two&amp; three</p>"]
+    assert "".join(split_words(text)) == text
+    assert "&amp;" in split_words(text)
+
+
+def paragraphs(words: list[str]) -> str:
+    return "".join(f"<p>{word} text here</p>" for word in words)
+
+
+def test_merge3_trivial_cases():
+    assert merge3("a", "a", "b").text == "b"
+    assert merge3("a", "b", "a").text == "b"
+    assert merge3("a", "b", "b").text == "b"
+    assert not merge3("a", "a", "b").conflicts
+
+
+def test_merge3_combines_edits_to_different_paragraphs():
+    base = paragraphs(["one", "two", "three"])
+    current = paragraphs(["ONE", "two", "three"])
+    incoming = paragraphs(["one", "two", "THREE"])
+    result = merge3(base, current, incoming)
+    assert result.text == paragraphs(["ONE", "two", "THREE"])
+    assert not result.conflicts
+
+
+def test_merge3_combines_edits_to_different_words_of_a_paragraph():
+    base = "<p>The quick brown fox jumps</p>"
+    result = merge3(base, "<p>The slow brown fox jumps</p>", "<p>The quick brown fox sleeps</p>")
+    assert result.text == "<p>The slow brown fox sleeps</p>"
+    assert not result.conflicts
+
+
+def test_merge3_reports_overlapping_edits():
+    base = "<p>The quick brown fox</p><p>unchanged</p>"
+    result = merge3(base, "<p>The slow brown fox</p><p>unchanged</p>", "<p>The fast brown fox</p><p>unchanged</p>")
+    # The stored text wins where they disagree
+    assert result.text == "<p>The slow brown fox</p><p>unchanged</p>"
+    assert [(c.base, c.current, c.incoming) for c in result.conflicts] == [("quick", "slow", "fast")]
+
+
+def test_merge3_fuzz_separate_paragraphs():
+    rng = random.Random(48)
+    for _ in range(300):
+        words = [f"w{index}" for index in range(rng.randint(3, 12))]
+        ours, theirs = sorted(rng.sample(range(len(words)), 2))
+        if theirs - ours < 2:
+            # Keep an untouched paragraph between the edits
+            continue
+        current = list(words)
+        current[ours] = "ours"
+        incoming = list(words)
+        incoming[theirs] = "theirs"
+        if rng.random() < 0.5:
+            incoming.insert(theirs + 1, "added")
+        expected = list(incoming)
+        expected[ours] = "ours"
+        result = merge3(paragraphs(words), paragraphs(current), paragraphs(incoming))
+        assert result.text == paragraphs(expected)
+        assert not result.conflicts
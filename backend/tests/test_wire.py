@@ -0,0 +1,123 @@
+import random
+
+import pytest
+
+from core.wire import (
+    BINARY, BINARY_PROTOCOL, DELETE, INSERT, JSON, JSON_PROTOCOL, RETAIN, Awareness, AwarenessState, Broadcast,
+    Cursor, Init, Presence, PresenceUser, Update, UserJoined, UserLeft, WireError, apply_ops, diff_ops, negotiate,
+    utf16_length
+)
+
+OBJECT_ID = "64b7f0c2a1b2c3d4e5f60718"
+# ASCII, accents, CJK and characters outside the BMP (two UTF-16 units each)
+ALPHABET = "ab <>/é中😀𝄞"
+
+MESSAGES = [
+    Init("<p>Hello 😀</p>", 7),
+    Update(3, content="<p>Hé</p>"),
+    Update(4, ops=[(RETAIN, 3), (DELETE, 2), (INSERT, "𝄞 x")]),
+    Update(5, ops=[]),
+    Cursor(OBJECT_ID, 12),
+    Cursor("legacy-user", 0),
+    Presence([PresenceUser(OBJECT_ID, "Ada", "ada@example.com", "hsl(1, 70%, 50%)"), PresenceUser("guest")]),
+    Awareness([AwarenessState(OBJECT_ID, 9, {"cursor": {"anchor": 1, "head": 4}}), AwarenessState("x", 2, None)]),
+    UserJoined(OBJECT_ID),
+    UserJoined(),
+    UserLeft("someone"),
+]
+
+
+def random_text(rng, size: int) -> str:
+    return "".join(rng.choice(ALPHABET) for _ in range(size))
+
+
+def edit(rng, text: str) -> str:
+    start = rng.randint(0, len(text))
+    end = rng.randint(start, min(len(text), start + 5))
+    return text[:start] + random_text(rng, rng.randint(0, 4)) + text[end:]
+
+
+def test_utf16_length_matches_javascript():
+    assert utf16_length("abc") == 3
+    assert utf16_length("é中") == 2
+    assert utf16_length("😀") == 2
+    assert utf16_length("a😀b") == 4
+
+
+def test_offsets_count_utf16_units():
+    assert diff_ops("😀a", "😀ba") == [(RETAIN, 2), (INSERT, "b")]
+    assert diff_ops("x😀y", "xy") == [(RETAIN, 1), (DELETE, 2)]
+    assert apply_ops("😀a", [(RETAIN, 2), (INSERT, "b")]) == "😀ba"
+    # What a browser computes with "😀a".slice(0, 1): the pair is split
+    assert apply_ops("😀a", [(RETAIN, 1), (DELETE, 1)]) == "\ud83da"
+
+
+def test_diff_apply_fuzz():
+    rng = random.Random(5)
+    for _ in range(2000):
+        old = random_text(rng, rng.randint(0, 20))
+        new = edit(rng, old)
+        ops = diff_ops(old, new)
+        assert apply_ops(old, ops) == new
+        assert BINARY.decode(BINARY.encode(Update(1, ops=ops))).ops == ops
+
+
+def test_apply_rejects_edits_past_the_end():
+    with pytest.raises(WireError):
+        apply_ops("😀", [(RETAIN, 3)])
+    with pytest.raises(WireError):
+        apply_ops("ab", [(RETAIN, 1), (DELETE, 2)])
+
+
+@pytest.mark.parametrize("message", MESSAGES, ids=lambda message: type(message).__name__)
+def test_binary_round_trip(message):
+    assert BINARY.decode(BINARY.encode(message)) == message
+
+
+@pytest.mark.parametrize(
+    "message", [message for message in MESSAGES if not (isinstance(message, Update) and message.ops is not None)],
+    ids=lambda message: type(message).__name__
+)
+def test_json_round_trip(message):
+    decoded = JSON.decode(JSON.encode(message, "doc"))
+    if isinstance(message, (Init, Update)):
+        # JSON envelopes carry no version
+        assert decoded.content == message.content
+    else:
+        assert decoded == message
+
+
+def test_binary_rejects_truncated_and_padded_frames():
+    for message in MESSAGES:
+        frame = BINARY.encode(message)
+        for end in range(len(frame)):
+            with pytest.raises(WireError):
+                BINARY.decode(frame[:end])
+        with pytest.raises(WireError):
+            BINARY.decode(frame + b"\x00")
+
+
+def test_binary_rejects_unknown_version_and_type():
+    with pytest.raises(WireError):
+        BINARY.decode(bytes((2,)) + BINARY.encode(UserJoined())[1:])
+    with pytest.raises(WireError):
+        BINARY.decode(bytes((1, 99)))
+
+
+def test_json_clients_need_content():
+    with pytest.raises(WireError):
+        JSON.encode(Update(1, ops=[(INSERT, "x")]))
+
+
+def test_negotiate():
+    assert negotiate(None) is JSON
+    assert negotiate("") is JSON
+    assert negotiate("chat, other") is JSON
+    assert negotiate(f"{JSON_PROTOCOL}, {BINARY_PROTOCOL}") is BINARY
+    assert negotiate([JSON_PROTOCOL]) is JSON
+
+
+def test_broadcast_encodes_once_per_codec():
+    broadcast = Broadcast(Update(2, ops=[(INSERT, "a")], content="a"), "doc")
+    assert broadcast.frame(BINARY) is broadcast.frame(BINARY)
+    assert JSON.decode(broadcast.frame(JSON)).content == "a"
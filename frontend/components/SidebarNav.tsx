@@ -24,7 +24,7 @@ import {
   Loader2,
 } from "lucide-react";
 import { cn } from "@/lib/utils";
-import { documentApi, folderApi, Document, Folder } from "@/lib/api";
+import { documentApi, folderApi, DocumentSummary, Folder } from "@/lib/api";
 
 const iconMap = { home: Home, search: Search, settings: Settings } as const;
 
@@ -33,13 +33,13 @@ interface Props {
 }
 
 interface DocumentsByPath {
-  [path: string]: Document[];
+  [path: string]: DocumentSummary[];
 }
 
 export default function SidebarNav({ navigation }: Props) {
   const pathname = usePathname();
   // Remove useSearchParams from here as it's now in NavItem component
-  const [documents, setDocuments] = useState<Document[]>([]);
+  const [documents, setDocuments] = useState<DocumentSummary[]>([]);
   const [folders, setFolders] = useState<Folder[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
@@ -50,7 +50,7 @@ export default function SidebarNav({ navigation }: Props) {
         setLoading(true);
         console.log("Fetching documents and folders...");
         const [docsData, foldersData] = await Promise.all([
-          documentApi.getAll(),
+          documentApi.getSummaries(),
           folderApi.getAll(),
         ]);
         console.log("Documents fetched:", docsData);
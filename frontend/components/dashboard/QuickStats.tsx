@@ -12,7 +12,7 @@ function QuickStats({ users, onlineUsers }: {
   const [documentCount, setDocumentCount] = useState<number>(0);
 
   useEffect(() => {
-    documentApi.getAll().then(docs => setDocumentCount(docs.length)).catch(() => setDocumentCount(0));
+    documentApi.getSummaries().then(docs => setDocumentCount(docs.length)).catch(() => setDocumentCount(0));
   }, []);
 
   console.log('QuickStats rendered with:', {
@@ -15,12 +15,12 @@ function RecentDocuments() {
   const [recentDocs, setRecentDocs] = useState<Document[]>([]);
 
   useEffect(() => {
-    documentApi.getAll().then(docs => {
+    documentApi.getSummaries().then(docs => {
       // Transform docs to match frontend Document type if needed
       const transformed = docs.map((doc: any) => ({
         id: doc.id,
         title: doc.title,
-        content: doc.content,
+        content: doc.excerpt,
         lastModified: new Date(doc.updated_at),
         author: { id: '', name: '', email: '', avatar: '', role: 'viewer' as 'viewer', status: 'offline' as 'offline' },
         collaborators: [],
@@ -66,6 +66,21 @@ export interface Document {
   updated_at: string;
 }
 
+export interface DocumentSummary {
+  id: string;
+  title: string;
+  excerpt: string;
+  word_count: number;
+  char_count: number;
+  reading_minutes: number;
+  folder_id?: string;
+  isPublic: boolean;
+  owner_id: string;
+  last_edited_by: string;
+  created_at: string;
+  updated_at: string;
+}
+
 export interface CreateDocumentRequest {
   title: string;
   folder_id?: string;
@@ -90,6 +105,9 @@ export const documentApi = {
   getAll: (): Promise<Document[]> =>
     apiRequest<Document[]>('/documents/'),
 
+  getSummaries: (q?: string): Promise<DocumentSummary[]> =>
+    apiRequest<DocumentSummary[]>(`/documents/summaries${q ? `?q=${encodeURIComponent(q)}` : ''}`),
+
   search: (q: string): Promise<Document[]> =>
     apiRequest<Document[]>(`/documents/search?q=${encodeURIComponent(q)}`),
 